@@ -0,0 +1,79 @@
+"""Benchmark full-frame and ROI read throughput of chunk layouts
+
+For each chunk layout, a QPImage with background data is written
+to disk. Then the background-corrected phase is read in full and
+for random regions of interest (via `QPImage.roi`). The file is
+reopened for every read so that the HDF5 chunk cache is cold.
+
+Usage::
+
+    python bench_chunks.py [--size 4096] [--roi 256] [--repeat 5]
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+
+import qpimage
+
+
+LAYOUTS = ["full", "tiles", "auto", (128, 128), (512, 512)]
+
+
+def write_image(path, size, chunks):
+    rs = np.random.RandomState(42)
+    pha = rs.normal(size=(size, size))
+    bg = np.linspace(0, 1, size**2).reshape(size, size)
+    with qpimage.QPImage(data=pha, bg_data=bg, which_data="phase",
+                         h5file=path, h5mode="w", h5chunks=chunks):
+        pass
+
+
+def bench_layout(path, size, roi, repeat):
+    rs = np.random.RandomState(0)
+    t_full = []
+    for _ in range(repeat):
+        with qpimage.QPImage(h5file=path, h5mode="r") as qpi:
+            t0 = time.perf_counter()
+            qpi.pha
+            t_full.append(time.perf_counter() - t0)
+    t_roi = []
+    for _ in range(repeat):
+        x, y = rs.randint(0, size - roi, size=2)
+        with qpimage.QPImage(h5file=path, h5mode="r") as qpi:
+            t0 = time.perf_counter()
+            qpi.roi(np.s_[x:x + roi, y:y + roi]).pha
+            t_roi.append(time.perf_counter() - t0)
+    return np.median(t_full), np.median(t_roi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--roi", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tdir = pathlib.Path(tempfile.mkdtemp())
+    mb_full = args.size**2 * 4 * 2 / 1024**2  # raw and bg (float32)
+    mb_roi = args.roi**2 * 4 * 2 / 1024**2
+    print("image {0}x{0}px, ROI {1}x{1}px".format(args.size, args.roi))
+    print("{:>12} {:>10} {:>12} {:>12} {:>12}".format(
+        "layout", "file [MB]", "full [MB/s]", "ROI [ms]", "ROI [MB/s]"))
+    for chunks in LAYOUTS:
+        path = tdir / "bench_chunks_{}.h5".format(
+            chunks if isinstance(chunks, str) else "{}x{}".format(*chunks))
+        write_image(path, args.size, chunks)
+        t_full, t_roi = bench_layout(path, args.size, args.roi, args.repeat)
+        print("{:>12} {:>10.1f} {:>12.1f} {:>12.2f} {:>12.1f}".format(
+            str(chunks),
+            path.stat().st_size / 1024**2,
+            mb_full / t_full,
+            t_roi * 1e3,
+            mb_roi / t_roi))
+
+
+if __name__ == "__main__":
+    main()
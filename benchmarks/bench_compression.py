@@ -0,0 +1,100 @@
+"""Benchmark compression profiles on the image data of an HDF5 file
+
+All image datasets of a QPImage or QPSeries file are written with
+each compression profile in :const:`qpimage.image_data.COMPRESSION_PROFILES`
+(keeping their chunk shapes). For each profile, the compression
+ratio (uncompressed size / stored size) and the write and read
+throughput (uncompressed MB/s) are reported. Without an input
+file, a synthetic noisy phase image is used.
+
+Usage::
+
+    python bench_compression.py [path/to/data.h5] [--repeat 3]
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from qpimage.image_data import COMPRESSION_PROFILES, write_image_dataset
+
+
+def get_images(path):
+    """Return a list of (name, data, chunks) of all image datasets"""
+    images = []
+
+    def visit(name, obj):
+        if (isinstance(obj, h5py.Dataset)
+                and obj.shape is not None and obj.ndim == 2):
+            images.append((name, obj[:], obj.chunks or "full"))
+
+    with h5py.File(path, "r") as h5:
+        h5.visititems(visit)
+    return images
+
+
+def synthetic_images(size=1024):
+    rs = np.random.RandomState(42)
+    x = np.linspace(-1, 1, size).reshape(-1, 1)
+    y = np.linspace(-1, 1, size).reshape(1, -1)
+    pha = 3 * np.exp(-(x**2 + y**2) / .1) + rs.normal(scale=.05,
+                                                      size=(size, size))
+    return [("phase/raw", pha.astype("float32"), "full")]
+
+
+def bench_profile(images, profile, repeat):
+    tdir = pathlib.Path(tempfile.mkdtemp())
+    nbytes = sum(data.nbytes for _, data, _ in images)
+    t_write = []
+    t_read = []
+    for ii in range(repeat):
+        path = tdir / "bench_{}_{}.h5".format(profile, ii)
+        with h5py.File(path, "w") as h5:
+            t0 = time.perf_counter()
+            for name, data, chunks in images:
+                write_image_dataset(group=h5.require_group("data"),
+                                    key=name.replace("/", "_"),
+                                    data=data,
+                                    chunks=chunks,
+                                    compression=profile)
+            h5.flush()
+            t_write.append(time.perf_counter() - t0)
+            stored = sum(dset.id.get_storage_size()
+                         for dset in h5["data"].values())
+        with h5py.File(path, "r") as h5:
+            t0 = time.perf_counter()
+            for dset in h5["data"].values():
+                dset[:]
+            t_read.append(time.perf_counter() - t0)
+    mb = nbytes / 1024**2
+    return nbytes / stored, mb / np.median(t_write), mb / np.median(t_read)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", nargs="?", default=None,
+                        help="QPImage or QPSeries HDF5 file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.path is None:
+        images = synthetic_images()
+        print("synthetic data")
+    else:
+        images = get_images(args.path)
+        print(args.path)
+    print("{} images, {:.1f} MB uncompressed".format(
+        len(images), sum(dd.nbytes for _, dd, _ in images) / 1024**2))
+    print("{:>10} {:>8} {:>14} {:>13}".format(
+        "profile", "ratio", "write [MB/s]", "read [MB/s]"))
+    for profile in COMPRESSION_PROFILES:
+        ratio, mbps_w, mbps_r = bench_profile(images, profile, args.repeat)
+        print("{:>10} {:>8.2f} {:>14.1f} {:>13.1f}".format(
+            profile, ratio, mbps_w, mbps_r))
+
+
+if __name__ == "__main__":
+    main()
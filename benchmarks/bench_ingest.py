@@ -0,0 +1,71 @@
+"""Benchmark the streaming ingestion of off-axis holograms
+
+Synthetic holograms are converted to a QPSeries on disk with
+:func:`qpimage.ingest.ingest` and the throughput and latency
+statistics are printed for different numbers of workers.
+
+Usage::
+
+    python bench_ingest.py [--frames 200] [--size 512]
+                           [--workers 1 2 4] [--queue-size 8]
+                           [--compression archive]
+"""
+import argparse
+import pathlib
+import tempfile
+
+import numpy as np
+
+import qpimage
+import qpimage.ingest
+
+
+def holograms(frames, size):
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    for ii in range(frames):
+        rad = size / 8 + ii % 10
+        disk = 1.5 * ((x - size / 2)**2 + (y - size / 2)**2 < rad**2)
+        yield (np.sin(-.6 * x - .4 * y + disk),
+               {"identifier": "holo_{}".format(ii)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queue-size", type=int, default=None)
+    parser.add_argument("--compression", default="archive",
+                        choices=sorted(
+                            qpimage.image_data.COMPRESSION_PROFILES))
+    args = parser.parse_args()
+
+    tmpdir = pathlib.Path(tempfile.mkdtemp())
+    print("Ingesting {} holograms of {}x{}px ({} compression)".format(
+        args.frames, args.size, args.size, args.compression))
+    print("{:>8s} {:>12s} {:>14s} {:>14s} {:>12s}".format(
+        "workers", "frames/s", "latency [ms]", "process [ms]", "write [s]"))
+    for workers in args.workers:
+        path = tmpdir / "bench_ingest_{}.h5".format(workers)
+        qps = qpimage.QPSeries(h5file=path, h5mode="w",
+                               h5compression=args.compression)
+        stats = qpimage.ingest.ingest(
+            frames=holograms(args.frames, args.size),
+            series=qps,
+            meta_data={"wavelength": 550e-9, "pixel size": 1e-7},
+            qpretrieve_kw={"filter_name": "gauss"},
+            compute_bg_kw={"which_data": "phase",
+                           "fit_offset": "fit",
+                           "fit_profile": "tilt",
+                           "border_px": 5},
+            workers=workers,
+            queue_size=args.queue_size)
+        qps.h5.close()
+        print("{:>8d} {:>12.1f} {:>14.1f} {:>14.1f} {:>12.2f}".format(
+            workers, stats["throughput"], stats["latency median"] * 1e3,
+            stats["process mean"] * 1e3, stats["write time"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark metadata access (repr, shape, dtype) of a QPSeries
+
+Metadata queries must be answered from the HDF5 dataset headers.
+This script counts the number of image reads (calls to
+`h5py.Dataset.__getitem__`) while listing all QPImages of a
+series stored on disk and fails if any image data were read.
+
+Usage::
+
+    python bench_metadata.py [--images 500] [--size 1024]
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+import qpimage
+
+
+def create_series(path, images, size):
+    rs = np.random.RandomState(42)
+    with qpimage.QPSeries(h5file=path, h5mode="w") as qps:
+        for ii in range(images):
+            pha = rs.normal(size=(size, size))
+            qpi = qpimage.QPImage(data=pha, which_data="phase",
+                                  meta_data={"wavelength": 550e-9})
+            qps.add_qpimage(qpi, identifier="image_{}".format(ii))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+
+    path = pathlib.Path(tempfile.mkdtemp()) / "bench_metadata.h5"
+    print("Creating series with {} images of {}x{}px...".format(
+        args.images, args.size, args.size))
+    create_series(path, args.images, args.size)
+
+    reads = [0]
+    getitem = h5py.Dataset.__getitem__
+
+    def counting_getitem(self, *args, **kwargs):
+        reads[0] += 1
+        return getitem(self, *args, **kwargs)
+
+    h5py.Dataset.__getitem__ = counting_getitem
+    try:
+        with qpimage.QPSeries(h5file=path, h5mode="r") as qps:
+            t0 = time.perf_counter()
+            for qpi in qps:
+                repr(qpi)
+                qpi.shape
+                qpi.dtype
+            t1 = time.perf_counter()
+    finally:
+        h5py.Dataset.__getitem__ = getitem
+
+    print("repr/shape/dtype of {} images: {:.3f}s ({:.2f}ms per image)".format(
+        args.images, t1 - t0, (t1 - t0) / args.images * 1e3))
+    print("image reads: {}".format(reads[0]))
+    if reads[0]:
+        raise SystemExit("Metadata access read image data!")
+
+
+if __name__ == "__main__":
+    main()
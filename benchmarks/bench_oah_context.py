@@ -0,0 +1,53 @@
+"""Benchmark off-axis hologram retrieval with a reusable context
+
+Compares the time per hologram of `QPImage(which_data="raw-oah")`
+with and without an :class:`qpimage.oah.OAHContext`, which caches
+the sideband frequency and the Fourier filter.
+
+Usage::
+
+    python bench_oah_context.py [--frames 50] [--size 512]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import qpimage
+from qpimage.oah import OAHContext
+
+
+def hologram(size, ii):
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rad = size / 8 + ii % 10
+    disk = 1.5 * ((x - size / 2)**2 + (y - size / 2)**2 < rad**2)
+    return np.sin(-.6 * x - .4 * y + disk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+
+    holos = [hologram(args.size, ii) for ii in range(args.frames)]
+    kw = {"filter_name": "smooth disk"}
+    print("Retrieving {} holograms of {}x{}px (no unwrapping)".format(
+        args.frames, args.size, args.size))
+    for name in ["qpretrieve_kw", "oah_context"]:
+        if name == "oah_context":
+            ctxkw = {"oah_context": OAHContext(qpretrieve_kw=kw)}
+        else:
+            ctxkw = {"qpretrieve_kw": kw}
+        t0 = time.perf_counter()
+        for holo in holos:
+            qpimage.QPImage(holo, which_data="raw-oah", proc_phase=False,
+                            **ctxkw)
+        t1 = time.perf_counter()
+        print("{:>14s}: {:.2f}ms per hologram".format(
+            name, (t1 - t0) / args.frames * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark refocusing a QPImage to many distances
+
+Compares calling `QPImage.refocus` for each distance with
+`QPImage.refocus_stack`, which returns a 3D field array or adds
+the refocused QPImages to a stacked QPSeries.
+
+Usage::
+
+    python bench_refocus_stack.py [--distances 50] [--size 512]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import qpimage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--distances", type=int, default=50)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+
+    x = np.linspace(-1, 1, args.size).reshape(-1, 1)
+    y = np.linspace(-1, 1, args.size).reshape(1, -1)
+    pha = 2 * np.exp(-(x**2 + y**2) / .1)
+    amp = 1 - .2 * np.exp(-(x**2 + y**2) / .05)
+    qpi = qpimage.QPImage(data=(pha, amp),
+                          which_data="phase,amplitude",
+                          meta_data={"wavelength": 550e-9,
+                                     "pixel size": .1e-6,
+                                     "medium index": 1.335})
+    distances = np.linspace(-10e-6, 10e-6, args.distances)
+    print("Refocusing {}x{}px to {} distances".format(
+        args.size, args.size, args.distances))
+
+    def per_distance():
+        return [qpi.refocus(dd) for dd in distances]
+
+    def stack_array():
+        return qpi.refocus_stack(distances)
+
+    def stack_series():
+        return qpi.refocus_stack(
+            distances, series=qpimage.QPSeries(layout="stacked"))
+
+    def stack_series_raw():
+        return qpi.refocus_stack(
+            distances, series=qpimage.QPSeries(layout="stacked"),
+            proc_phase=False)
+
+    for func in [per_distance, stack_array, stack_series, stack_series_raw]:
+        t0 = time.perf_counter()
+        func()
+        t1 = time.perf_counter()
+        print("{:>17s}: {:7.2f}ms per distance".format(
+            func.__name__, (t1 - t0) / args.distances * 1e3))
+
+
+if __name__ == "__main__":
+    main()
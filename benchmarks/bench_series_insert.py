@@ -0,0 +1,66 @@
+"""Benchmark inserting identified QPImages into a QPSeries
+
+Every call to `QPSeries.add_qpimage` checks whether the identifier
+already exists. With the identifier index, this check does not
+depend on the length of the series and filling a series takes
+linear time. This script inserts the images in batches and prints
+the time per batch, which should stay constant, as well as the
+time of identifier lookups in the filled series.
+
+Usage::
+
+    python bench_series_insert.py [--images 10000] [--batch 1000]
+                                  [--size 16] [--layout group]
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+
+import qpimage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--images", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=16)
+    parser.add_argument("--layout", default="group",
+                        choices=qpimage.series.VALID_SERIES_LAYOUTS)
+    args = parser.parse_args()
+
+    rs = np.random.RandomState(42)
+    qpi = qpimage.QPImage(data=rs.normal(size=(args.size, args.size)),
+                          which_data="phase")
+    path = pathlib.Path(tempfile.mkdtemp()) / "bench_series_insert.h5"
+    print("Inserting {} images of {}x{}px ({} layout)...".format(
+        args.images, args.size, args.size, args.layout))
+    times = []
+    with qpimage.QPSeries(h5file=path, h5mode="w",
+                          layout=args.layout) as qps:
+        for start in range(0, args.images, args.batch):
+            t0 = time.perf_counter()
+            for ii in range(start, min(start + args.batch, args.images)):
+                qps.add_qpimage(qpi, identifier="image_{}".format(ii))
+            times.append(time.perf_counter() - t0)
+            print("  images {:>6d}-{:<6d} {:.3f}s".format(
+                start, start + args.batch - 1, times[-1]))
+
+    print("total: {:.3f}s; last/first batch: {:.2f}".format(
+        sum(times), times[-1] / times[0]))
+
+    with qpimage.QPSeries(h5file=path, h5mode="r") as qps:
+        t0 = time.perf_counter()
+        for ii in range(0, args.images, args.images // 100 or 1):
+            assert "image_{}".format(ii) in qps
+        t1 = time.perf_counter()
+        qps["image_{}".format(args.images - 1)]
+        t2 = time.perf_counter()
+    print("100 membership tests: {:.3f}ms".format((t1 - t0) * 1e3))
+    print("lookup of the last image: {:.3f}ms".format((t2 - t1) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
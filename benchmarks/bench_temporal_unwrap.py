@@ -0,0 +1,78 @@
+"""Benchmark temporal phase unwrapping of a time-lapse series
+
+A synthetic time-lapse of slowly moving cells with Gaussian phase
+noise is wrapped and ingested into a QPSeries (`which_data="phase"`,
+one worker) with spatial unwrapping of every frame and with
+`temporal_unwrap=True`.
+The throughput, the fraction of spatially unwrapped pixels, and the
+maximum deviation from the true phase (in units of 2π, ignoring a
+constant offset) are printed.
+
+Usage::
+
+    python bench_temporal_unwrap.py [--frames 50] [--size 1024]
+                                    [--speed 1.0] [--noise 0.3]
+"""
+import argparse
+
+import numpy as np
+
+import qpimage
+import qpimage.ingest
+
+
+def time_lapse(num, size, speed):
+    """Phase of cells moving `speed` pixels per frame"""
+    rs = np.random.RandomState(42)
+    pos = rs.uniform(0, size, size=(10, 2))
+    vel = rs.normal(scale=speed, size=(10, 2))
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    frames = []
+    for ii in range(num):
+        pha = np.zeros((size, size))
+        for (px, py), (vx, vy) in zip(pos, vel):
+            rr = (x - px - ii * vx)**2 + (y - py - ii * vy)**2
+            pha += 15 * np.exp(-rr / (size / 10)**2)
+        frames.append(pha)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="speed of the cells [px/frame]")
+    parser.add_argument("--noise", type=float, default=0.3,
+                        help="standard deviation of the phase noise [rad]")
+    args = parser.parse_args()
+
+    truth = time_lapse(args.frames, args.size, args.speed)
+    rs = np.random.RandomState(47)
+    for pha in truth:
+        pha += rs.normal(scale=args.noise, size=pha.shape)
+    wrapped = [np.angle(np.exp(1j * pha)) for pha in truth]
+    print("Ingesting {} frames of {}x{}px (noise {} rad)".format(
+        args.frames, args.size, args.size, args.noise))
+    for temporal in [False, True]:
+        qps = qpimage.QPSeries()
+        stats = qpimage.ingest.ingest(frames=wrapped,
+                                      series=qps,
+                                      which_data="phase",
+                                      workers=1,
+                                      temporal_unwrap=temporal)
+        error = 0
+        for ii in range(args.frames):
+            diff = (qps[ii].pha - truth[ii]) / (2 * np.pi)
+            error = max(error, np.ptp(np.round(diff)))
+        print("{:>8s}: {:7.2f}ms per frame, {:5.1%} spatially unwrapped, "
+              "max. error {:.0f}x2π".format(
+                  "temporal" if temporal else "spatial",
+                  stats["duration"] / args.frames * 1e3,
+                  1 if not temporal else stats["temporal fallback"],
+                  error))
+
+
+if __name__ == "__main__":
+    main()
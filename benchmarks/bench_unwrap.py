@@ -0,0 +1,104 @@
+"""Benchmark accuracy and speed of the phase unwrapping engines
+
+Synthetic phase images (a smooth object on a tilted background,
+optionally with noise) are wrapped and unwrapped with each engine
+of :const:`qpimage.unwrap.UNWRAP_ENGINES`. The error is the root
+mean square deviation from the true phase after subtracting the
+mean offset (engines may return the phase with a 2π offset).
+The peak memory is the increase of the resident set size during
+unwrapping (Linux only, the peak is reset via /proc/self/clear_refs).
+
+The default tile size of the "tiled" engine is smaller than
+:const:`qpimage.unwrap.TILE_SIZE`, such that the images are split
+into several tiles and the stitching of the tiles is timed as well.
+The number of tiles per image is listed in the "tiles" column.
+
+Usage::
+
+    python bench_unwrap.py [--sizes 128 256 512 1024] [--repeat 3]
+                           [--noise 0.0] [--tile-size 128]
+                           [--overlap 32] [--workers 4]
+"""
+import argparse
+import functools
+import time
+
+import numpy as np
+
+from qpimage import unwrap
+
+
+def synthetic_phase(size, noise=0.0):
+    x = np.linspace(-1, 1, size).reshape(-1, 1)
+    y = np.linspace(-1, 1, size).reshape(1, -1)
+    pha = size / 8 * np.exp(-(x**2 + y**2) / .2) + size / 32 * (x - y)
+    if noise:
+        rs = np.random.RandomState(42)
+        pha += rs.normal(scale=noise, size=pha.shape)
+    return pha
+
+
+def get_engines(tile_size, overlap, workers):
+    engines = {name: unwrap.get_engine(name)
+               for name in sorted(unwrap.UNWRAP_ENGINES)}
+    engines["tiled"] = functools.partial(unwrap.unwrap_tiled,
+                                         tile_size=tile_size,
+                                         overlap=overlap,
+                                         workers=workers)
+    return engines
+
+
+def peak_memory(func, wrapped):
+    """Increase of the resident set size when unwrapping [MB]"""
+    def status(key):
+        with open("/proc/self/status") as fd:
+            for line in fd:
+                if line.startswith(key):
+                    return int(line.split()[1])
+
+    with open("/proc/self/clear_refs", "w") as fd:
+        # reset the peak resident set size
+        fd.write("5")
+    before = status("VmRSS")
+    func(wrapped)
+    return (status("VmHWM") - before) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[128, 256, 512, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.0,
+                        help="standard deviation of the phase noise [rad]")
+    parser.add_argument("--tile-size", type=int, default=128,
+                        help="tile size of the 'tiled' engine")
+    parser.add_argument("--overlap", type=int, default=32,
+                        help="tile overlap of the 'tiled' engine")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of threads of the 'tiled' engine")
+    args = parser.parse_args()
+
+    engines = get_engines(args.tile_size, args.overlap, args.workers)
+    print("{:>6s} {:>8s} {:>6s} {:>10s} {:>12s} {:>10s}".format(
+        "size", "engine", "tiles", "time [ms]", "RMS error", "peak [MB]"))
+    for size in args.sizes:
+        num_tiles = int(np.ceil(size / args.tile_size))**2
+        pha = synthetic_phase(size, noise=args.noise)
+        wrapped = np.angle(np.exp(1j * pha))
+        for name, func in engines.items():
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                unwrapped = func(wrapped)
+                times.append(time.perf_counter() - t0)
+            peak = peak_memory(func, wrapped)
+            diff = unwrapped - pha
+            error = np.sqrt(np.mean((diff - np.mean(diff))**2))
+            tiles = num_tiles if name == "tiled" else 1
+            print("{:6d} {:>8s} {:6d} {:10.2f} {:12.2e} {:10.1f}".format(
+                size, name, tiles, np.min(times) * 1e3, error, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark the wrap detection that skips phase unwrapping
+
+Compares the time of :func:`qpimage.unwrap.is_wrapped` with the
+time of the unwrapping engine for a thin sample that does not wrap
+(the check scans the entire image and unwrapping is skipped) and for
+a thick sample (the check stops at the first phase jump). Both phase
+images contain NaN values, for which the "skimage" engine creates a
+masked array.
+
+Usage::
+
+    python bench_wrap_check.py [--sizes 512 1024 2048] [--repeat 5]
+                               [--engine skimage]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from qpimage import unwrap
+
+
+def sample(size, thickness):
+    x = np.linspace(-1, 1, size).reshape(-1, 1)
+    y = np.linspace(-1, 1, size).reshape(1, -1)
+    pha = thickness * np.exp(-(x**2 + y**2) / .2)
+    pha[:size // 20, :size // 20] = np.nan
+    return np.angle(np.exp(1j * pha))
+
+
+def timeit(func, data, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - t0)
+    return np.min(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--engine", type=str, default="skimage")
+    args = parser.parse_args()
+
+    engine = unwrap.get_engine(args.engine)
+    print("{:>6s} {:>7s} {:>10s} {:>12s}".format(
+        "size", "sample", "check [ms]", "unwrap [ms]"))
+    for size in args.sizes:
+        for name, thickness in [("thin", 2.5), ("thick", 50)]:
+            data = sample(size, thickness)
+            assert unwrap.is_wrapped(data) == (name == "thick")
+            print("{:6d} {:>7s} {:10.2f} {:12.2f}".format(
+                size, name, timeit(unwrap.is_wrapped, data, args.repeat),
+                timeit(engine, data, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,62 @@
+import collections
+import hashlib
+import threading
+
 import lmfit
 import numpy as np
+import scipy.linalg
 
 
 #: valid values for keyword argument `fit_offset` in :func:`estimate`
 VALID_FIT_OFFSETS = ["fit", "gauss", "mean", "mode"]
 #: valid values for keyword argument `fit_profile` in :func:`estimate`
 VALID_FIT_PROFILES = ["offset", "poly2o", "tilt"]
+#: valid values for keyword argument `fit_engine` in :func:`estimate`
+VALID_FIT_ENGINES = ["linear", "lmfit"]
+#: names of the model parameters of each background profile
+PROFILE_PARAMETERS = {"offset": ["off"],
+                      "poly2o": ["mx", "my", "mxy", "ax", "ay", "off"],
+                      "tilt": ["mx", "my", "off"],
+                      }
+
+#: maximum number of fit geometries kept in the cache (see :func:`cache_info`)
+CACHE_MAXSIZE = 32
+#: maximum total size of the fit geometry cache in bytes
+CACHE_MAXBYTES = 2**28
+
+#: statistics of the fit geometry cache (see :func:`cache_info`)
+CacheInfo = collections.namedtuple("CacheInfo",
+                                   ["hits", "misses", "maxsize", "currsize"])
+
+
+def cache_clear():
+    """Clear the fit geometry cache and reset its statistics"""
+    _geometry_cache.clear()
+
+
+def cache_info():
+    """Return statistics of the fit geometry cache
+
+    The mask image, the masked pixel coordinates, and the factorized
+    normal equations of the linear least-squares problem only depend
+    on the image shape, `border_px`, `from_mask` and `fit_profile`.
+    :func:`estimate` caches them, so that fitting a series of images
+    with the same geometry computes them only once.
+
+    Returns
+    -------
+    info: CacheInfo
+        Named tuple with the number of cache `hits` and `misses`,
+        the maximum number of entries `maxsize` (see
+        :const:`CACHE_MAXSIZE`) and the current number of entries
+        `currsize`
+    """
+    return _geometry_cache.info()
 
 
 def estimate(data, fit_offset="mean", fit_profile="tilt",
-             border_px=0, from_mask=None, ret_mask=False):
+             border_px=0, from_mask=None, ret_mask=False,
+             fit_engine="linear", ret_params=False):
     """Estimate the background value of an image
 
     Parameters
@@ -39,6 +86,26 @@ def estimate(data, fit_offset="mean", fit_profile="tilt",
         estimation.
     ret_mask: bool
         Return the boolean mask used to compute the background.
+    fit_engine: str
+        The solver used for the "tilt" and "poly2o" profiles:
+
+        - "linear": closed-form linear least-squares solution
+          (default, see :func:`fit_linear`)
+        - "lmfit": iterative minimization with :mod:`lmfit`
+    ret_params: bool
+        Return the model parameters of the background image
+        as a dictionary (see :const:`PROFILE_PARAMETERS` and
+        :func:`profile_model`). The offset computed with
+        `fit_offset` is included in the "off" parameter.
+
+    Returns
+    -------
+    bgimg: 2d np.ndarray
+        Background image
+    mask: 2d boolean np.ndarray
+        Mask used for background estimation (if `ret_mask` is set)
+    params: dict
+        Model parameters of `bgimg` (if `ret_params` is set)
 
     Notes
     -----
@@ -46,58 +113,203 @@ def estimate(data, fit_offset="mean", fit_profile="tilt",
     intersection of the two is used, i.e. the positions
     where both, the frame mask and `from_mask`, are
     `True`.
+
+    Non-finite pixels (e.g. NaN) in the background region are
+    excluded from the fit and from the returned mask. The fit
+    geometry of such a mask is not cached.
+
+    Both background profiles are linear in their parameters.
+    Therefore, the "linear" and the "lmfit" engines yield the
+    same background up to numerical precision.
     """
-    if fit_profile not in VALID_FIT_PROFILES:
-        msg = "`fit_profile` must be one of {}, got '{}'".format(
-            VALID_FIT_PROFILES,
-            fit_profile)
-        raise ValueError(msg)
-    if fit_offset not in VALID_FIT_OFFSETS:
-        msg = "`fit_offset` must be one of {}, got '{}'".format(
-            VALID_FIT_OFFSETS,
-            fit_offset)
-        raise ValueError(msg)
-    # initial mask image
-    if from_mask is not None:
-        assert isinstance(from_mask, np.ndarray)
-        mask = from_mask.copy()
-    else:
-        mask = np.ones_like(data, dtype=bool)
-    # multiply with border mask image (intersection)
-    if border_px > 0:
-        border_px = int(np.round(border_px))
-        mask_px = np.zeros_like(mask)
-        mask_px[:border_px, :] = True
-        mask_px[-border_px:, :] = True
-        mask_px[:, :border_px] = True
-        mask_px[:, -border_px:] = True
-        # intersection
-        np.logical_and(mask, mask_px, out=mask)
+    _check_fit_args(fit_offset=fit_offset,
+                    fit_profile=fit_profile,
+                    fit_engine=fit_engine)
+    # mask image and linear system (cached for recurring geometries)
+    geom = _geometry_cache.get(shape=data.shape,
+                               border_px=border_px,
+                               from_mask=from_mask,
+                               fit_profile=fit_profile)
+    if not np.all(np.isfinite(data[geom.mask])):
+        # exclude non-finite pixels (the fit geometry is not cached)
+        mask = np.logical_and(geom.mask, np.isfinite(data))
+        if not np.any(mask):
+            raise ValueError("The background region does not contain "
+                             + "any finite pixels!")
+        geom = _FitGeometry(mask, fit_profile)
+    mask = geom.mask
     # compute background image
-    if fit_profile == "tilt":
-        bgimg = profile_tilt(data, mask)
-    elif fit_profile == "poly2o":
-        bgimg = profile_poly2o(data, mask)
+    if fit_profile == "offset":
+        params = {"off": 0.}
+    elif fit_engine == "linear":
+        params = geom.fit(data)
     else:
-        bgimg = np.zeros_like(data, dtype=float)
+        params = _fit_lmfit(data, mask, fit_profile)
+    bgimg = profile_model(fit_profile, params, data.shape)
     # add offsets
     if fit_offset == "fit":
         if fit_profile == "offset":
             msg = "`fit_offset=='fit'` only valid when `fit_profile!='offset`"
             raise ValueError(msg)
         # nothing else to do here, using offset from fit
-    elif fit_offset == "gauss":
-        bgimg += offset_gaussian((data - bgimg)[mask])
-    elif fit_offset == "mean":
-        bgimg += np.mean((data - bgimg)[mask])
-    elif fit_offset == "mode":
-        bgimg += offset_mode((data - bgimg)[mask])
+    else:
+        if fit_offset == "gauss":
+            offset = float(offset_gaussian((data - bgimg)[mask]))
+        elif fit_offset == "mean":
+            offset = np.mean((data - bgimg)[mask])
+        elif fit_offset == "mode":
+            offset = offset_mode((data - bgimg)[mask])
+        bgimg += offset
+        params["off"] += offset
+
+    ret = [bgimg]
+    if ret_mask:
+        ret.append(mask.copy())
+    if ret_params:
+        ret.append(params)
+    if len(ret) == 1:
+        return bgimg
+    else:
+        return tuple(ret)
+
+
+def estimate_stack(data3d, fit_offset="mean", fit_profile="tilt",
+                   border_px=0, from_mask=None, ret_mask=False,
+                   fit_engine="linear", ret_params=False):
+    """Estimate the background values of a stack of images
+
+    This is the vectorized version of :func:`estimate`.
+
+    Parameters
+    ----------
+    data3d: np.ndarray of shape (N, M, L)
+        Stack of `N` images from which to compute the background
+    fit_offset, fit_profile, border_px, fit_engine:
+        See :func:`estimate`
+    from_mask: boolean np.ndarray or None
+        Boolean mask of shape (M, L) shared by all images or
+        boolean masks of shape (N, M, L) (one for each image)
+    ret_mask: bool
+        Return the boolean mask(s) used to compute the background.
+    ret_params: bool
+        Return the model parameters of the background images
+        as a dictionary of arrays of length N.
+
+    Notes
+    -----
+    If all images share the same mask, the "tilt" and "poly2o"
+    profiles of all images are solved at once with the
+    pseudo-inverse (factorized normal equations) of the shared
+    design matrix. Otherwise, :func:`estimate` is called for
+    each image separately. This is also the case if the background
+    region contains non-finite pixels, which are then excluded from
+    the masks of the individual images (a stack of masks is returned
+    if the masks differ).
+    """
+    _check_fit_args(fit_offset=fit_offset,
+                    fit_profile=fit_profile,
+                    fit_engine=fit_engine)
+    data3d = np.asarray(data3d)
+    if data3d.ndim != 3:
+        raise ValueError("`data3d` must be a 3D array, got shape {}".format(
+            data3d.shape))
+    shared = not ((from_mask is not None and from_mask.ndim == 3)
+                  or (fit_engine != "linear" and fit_profile != "offset"))
+    if shared:
+        geom = _geometry_cache.get(shape=data3d.shape[1:],
+                                   border_px=border_px,
+                                   from_mask=from_mask,
+                                   fit_profile=fit_profile)
+        # non-finite pixels are excluded individually
+        shared = np.all(np.isfinite(data3d[:, geom.mask]))
+    if not shared:
+        # no shared geometry
+        bgimgs = np.zeros(data3d.shape, dtype=float)
+        masks = np.zeros(data3d.shape, dtype=bool)
+        params = {}
+        for ii in range(data3d.shape[0]):
+            if from_mask is not None and from_mask.ndim == 3:
+                frmask = from_mask[ii]
+            else:
+                frmask = from_mask
+            bgimgs[ii], masks[ii], pari = estimate(data=data3d[ii],
+                                                   fit_offset=fit_offset,
+                                                   fit_profile=fit_profile,
+                                                   border_px=border_px,
+                                                   from_mask=frmask,
+                                                   ret_mask=True,
+                                                   fit_engine=fit_engine,
+                                                   ret_params=True)
+            for name in pari:
+                params.setdefault(name, []).append(pari[name])
+        params = {name: np.array(params[name]) for name in params}
+        if ((from_mask is None or from_mask.ndim == 2)
+                and np.all(masks == masks[0])):
+            # all masks are identical
+            masks = masks[0]
+    else:
+        masks = geom.mask.copy()
+        # compute background images
+        if fit_profile == "offset":
+            params = {"off": np.zeros(data3d.shape[0])}
+        else:
+            params = geom.fit(data3d)
+        bgimgs = _profile_stack(params, data3d.shape)
+        # add offsets
+        if fit_offset == "fit":
+            if fit_profile == "offset":
+                msg = "`fit_offset=='fit'` only valid when " \
+                      + "`fit_profile!='offset`"
+                raise ValueError(msg)
+        else:
+            residuals = data3d[:, masks] - bgimgs[:, masks]
+            if fit_offset == "mean":
+                offsets = np.mean(residuals, axis=1)
+            elif fit_offset == "gauss":
+                offsets = [float(offset_gaussian(res)) for res in residuals]
+            else:
+                offsets = [offset_mode(res) for res in residuals]
+            bgimgs += np.reshape(offsets, (-1, 1, 1))
+            params["off"] = params["off"] + offsets
 
+    ret = [bgimgs]
     if ret_mask:
-        ret = (bgimg, mask)
+        ret.append(masks)
+    if ret_params:
+        ret.append(params)
+    if len(ret) == 1:
+        return bgimgs
     else:
-        ret = bgimg
-    return ret
+        return tuple(ret)
+
+
+def fit_linear(data, mask, fit_profile):
+    """Fit a background profile to `data[mask]` by linear least squares
+
+    Parameters
+    ----------
+    data: 2d np.ndarray
+        Input image
+    mask: 2d boolean np.ndarray
+        Pixels of `data` used for fitting
+    fit_profile: str
+        Either "tilt" or "poly2o"
+
+    Returns
+    -------
+    params: dict
+        Fitted model parameters (same names as used by
+        :func:`tilt_model` and :func:`poly2o_model`)
+
+    Notes
+    -----
+    The design matrix is only built for the pixels in `mask`,
+    which makes this approach considerably faster than
+    :func:`lmfit.minimize` for border-only background masks.
+    In contrast to :func:`estimate`, this function does not
+    make use of the fit geometry cache (see :func:`cache_info`).
+    """
+    return _FitGeometry(np.array(mask, dtype=bool), fit_profile).fit(data)
 
 
 def offset_gaussian(data):
@@ -128,40 +340,67 @@ def offset_mode(data):
     return hx[idmax]
 
 
-def profile_tilt(data, mask):
-    """Fit a 2D tilt to `data[mask]`"""
-    params = lmfit.Parameters()
-    params.add(name="mx", value=0)
-    params.add(name="my", value=0)
-    params.add(name="off", value=np.average(data[mask]))
-    fr = lmfit.minimize(tilt_residual, params, args=(data, mask))
-    bg = tilt_model(fr.params, data.shape)
+def profile_model(fit_profile, params, shape, region=None):
+    """Compute the background image of a profile from its parameters
+
+    Parameters
+    ----------
+    fit_profile: str
+        One of :const:`VALID_FIT_PROFILES`
+    params: lmfit.Parameters or dict
+        Model parameters (see :const:`PROFILE_PARAMETERS`)
+    shape: tuple of int
+        Shape of the background image
+    region: tuple of two slices or None
+        If given, only compute this region of the background image
+    """
+    if fit_profile not in PROFILE_PARAMETERS:
+        raise ValueError("Unsupported `fit_profile`: {}".format(fit_profile))
+    if region is not None:
+        names = PROFILE_PARAMETERS[fit_profile]
+        values = _param_values(params, names)
+        x = (np.arange(shape[0]) - shape[0] // 2)[region[0]].reshape(-1, 1)
+        y = (np.arange(shape[1]) - shape[1] // 2)[region[1]].reshape(1, -1)
+        terms = {"off": 1, "mx": x, "my": y, "mxy": x * y,
+                 "ax": x**2, "ay": y**2}
+        bg = np.zeros((x.size, y.size), dtype=float)
+        for name, value in zip(names, values):
+            bg += value * terms[name]
+    elif fit_profile == "tilt":
+        bg = tilt_model(params, shape)
+    elif fit_profile == "poly2o":
+        bg = poly2o_model(params, shape)
+    elif fit_profile == "offset":
+        bg = np.zeros(shape, dtype=float) + _param_values(params, ["off"])[0]
     return bg
 
 
-def profile_poly2o(data, mask):
+def profile_tilt(data, mask, fit_engine="linear"):
+    """Fit a 2D tilt to `data[mask]`"""
+    if fit_engine == "linear":
+        params = fit_linear(data, mask, "tilt")
+    else:
+        params = _fit_lmfit(data, mask, "tilt")
+    return tilt_model(params, data.shape)
+
+
+def profile_poly2o(data, mask, fit_engine="linear"):
     """Fit a 2D 2nd order polynomial to `data[mask]`"""
-    # lmfit
-    params = lmfit.Parameters()
-    params.add(name="mx", value=0)
-    params.add(name="my", value=0)
-    params.add(name="mxy", value=0)
-    params.add(name="ax", value=0)
-    params.add(name="ay", value=0)
-    params.add(name="off", value=np.average(data[mask]))
-    fr = lmfit.minimize(poly2o_residual, params, args=(data, mask))
-    bg = poly2o_model(fr.params, data.shape)
-    return bg
+    if fit_engine == "linear":
+        params = fit_linear(data, mask, "poly2o")
+    else:
+        params = _fit_lmfit(data, mask, "poly2o")
+    return poly2o_model(params, data.shape)
 
 
 def poly2o_model(params, shape):
-    """lmfit 2nd order polynomial model"""
-    mx = params["mx"].value
-    my = params["my"].value
-    mxy = params["mxy"].value
-    ax = params["ax"].value
-    ay = params["ay"].value
-    off = params["off"].value
+    """lmfit 2nd order polynomial model
+
+    `params` may also be a dictionary of floats
+    (see :func:`fit_linear`).
+    """
+    mx, my, mxy, ax, ay, off = _param_values(
+        params, ["mx", "my", "mxy", "ax", "ay", "off"])
     bg = np.zeros(shape, dtype=float) + off
     x = np.arange(bg.shape[0]) - bg.shape[0] // 2
     y = np.arange(bg.shape[1]) - bg.shape[1] // 2
@@ -179,10 +418,12 @@ def poly2o_residual(params, data, mask):
 
 
 def tilt_model(params, shape):
-    """lmfit tilt model"""
-    mx = params["mx"].value
-    my = params["my"].value
-    off = params["off"].value
+    """lmfit tilt model
+
+    `params` may also be a dictionary of floats
+    (see :func:`fit_linear`).
+    """
+    mx, my, off = _param_values(params, ["mx", "my", "off"])
     bg = np.zeros(shape, dtype=float) + off
     x = np.arange(bg.shape[0]) - bg.shape[0] // 2
     y = np.arange(bg.shape[1]) - bg.shape[1] // 2
@@ -197,3 +438,244 @@ def tilt_residual(params, data, mask):
     bg = tilt_model(params, shape=data.shape)
     res = (data - bg)[mask]
     return res.flatten()
+
+
+def _param_values(params, names):
+    """Return parameter values from lmfit.Parameters or a dict"""
+    values = []
+    for name in names:
+        par = params[name]
+        if isinstance(par, lmfit.Parameter):
+            par = par.value
+        values.append(par)
+    return values
+
+
+def _check_fit_args(fit_offset, fit_profile, fit_engine):
+    """Raise a ValueError for invalid background fit arguments"""
+    if fit_profile not in VALID_FIT_PROFILES:
+        msg = "`fit_profile` must be one of {}, got '{}'".format(
+            VALID_FIT_PROFILES,
+            fit_profile)
+        raise ValueError(msg)
+    if fit_offset not in VALID_FIT_OFFSETS:
+        msg = "`fit_offset` must be one of {}, got '{}'".format(
+            VALID_FIT_OFFSETS,
+            fit_offset)
+        raise ValueError(msg)
+    if fit_engine not in VALID_FIT_ENGINES:
+        msg = "`fit_engine` must be one of {}, got '{}'".format(
+            VALID_FIT_ENGINES,
+            fit_engine)
+        raise ValueError(msg)
+
+
+def _fit_lmfit(data, mask, fit_profile):
+    """Fit a tilt or poly2o profile to `data[mask]` with lmfit"""
+    params = lmfit.Parameters()
+    for name in PROFILE_PARAMETERS[fit_profile]:
+        if name == "off":
+            params.add(name=name, value=np.average(data[mask]))
+        else:
+            params.add(name=name, value=0)
+    if fit_profile == "tilt":
+        residual = tilt_residual
+    else:
+        residual = poly2o_residual
+    fr = lmfit.minimize(residual, params, args=(data, mask))
+    return {name: fr.params[name].value for name in fr.params}
+
+
+def _get_mask(shape, border_px=0, from_mask=None):
+    """Return the boolean background mask for an image of given shape"""
+    # initial mask image
+    if from_mask is not None:
+        assert isinstance(from_mask, np.ndarray)
+        mask = np.array(from_mask, dtype=bool)
+    else:
+        mask = np.ones(shape, dtype=bool)
+    # multiply with border mask image (intersection)
+    if border_px > 0:
+        mask_px = np.zeros_like(mask)
+        mask_px[:border_px, :] = True
+        mask_px[-border_px:, :] = True
+        mask_px[:, :border_px] = True
+        mask_px[:, -border_px:] = True
+        # intersection
+        np.logical_and(mask, mask_px, out=mask)
+    return mask
+
+
+def _profile_stack(params, shape):
+    """Evaluate tilt or poly2o models with array-valued parameters
+
+    Parameters
+    ----------
+    params: dict
+        Model parameters, each an array of length `shape[0]`
+    shape: tuple of int
+        Shape (N, M, L) of the resulting image stack
+    """
+    x = (np.arange(shape[1]) - shape[1] // 2).reshape(1, -1, 1)
+    y = (np.arange(shape[2]) - shape[2] // 2).reshape(1, 1, -1)
+    bg = np.zeros(shape, dtype=float)
+    for name, value in params.items():
+        if name == "off":
+            term = 1
+        elif name == "mx":
+            term = x
+        elif name == "my":
+            term = y
+        elif name == "mxy":
+            term = x * y
+        elif name == "ax":
+            term = x**2
+        elif name == "ay":
+            term = y**2
+        bg += np.reshape(value, (-1, 1, 1)) * term
+    return bg
+
+
+class _FitGeometry(object):
+    def __init__(self, mask, fit_profile):
+        """Background mask and linear least-squares system of a fit
+
+        Parameters
+        ----------
+        mask: 2d boolean np.ndarray
+            Pixels used for fitting; the array is made read-only
+        fit_profile: str
+            One of :const:`VALID_FIT_PROFILES`
+        """
+        mask.flags.writeable = False
+        #: boolean background mask
+        self.mask = mask
+        self.fit_profile = fit_profile
+        #: masked and centered pixel coordinates
+        self.xm = self.ym = None
+        self.names = []
+        self._design = None
+        self._scale = None
+        self._cho = None
+        if fit_profile != "offset":
+            xm, ym = np.nonzero(mask)
+            self.xm = xm - mask.shape[0] // 2
+            self.ym = ym - mask.shape[1] // 2
+            self._setup_system()
+
+    @property
+    def nbytes(self):
+        """approximate memory consumption in bytes"""
+        arrays = [self.mask, self.xm, self.ym, self._design]
+        return sum([a.nbytes for a in arrays if a is not None])
+
+    def _setup_system(self):
+        """Build the design matrix and factorize the normal equations"""
+        xm, ym = self.xm, self.ym
+        if self.fit_profile == "tilt":
+            columns = [xm, ym, np.ones(xm.size)]
+        elif self.fit_profile == "poly2o":
+            columns = [xm, ym, xm * ym, xm**2, ym**2, np.ones(xm.size)]
+        else:
+            raise ValueError(
+                "Unsupported `fit_profile`: {}".format(self.fit_profile))
+        self.names = PROFILE_PARAMETERS[self.fit_profile]
+        design = np.stack(columns, axis=1).astype(float)
+        # normalize the columns to improve the condition of the problem
+        scale = np.linalg.norm(design, axis=0)
+        scale[scale == 0] = 1
+        design /= scale
+        self._design = design
+        self._scale = scale
+        try:
+            self._cho = scipy.linalg.cho_factor(design.T @ design)
+        except (np.linalg.LinAlgError, scipy.linalg.LinAlgError):
+            # rank-deficient problem (e.g. all pixels in one row)
+            self._cho = None
+
+    def _solve(self, values):
+        """Solve the (scaled) least-squares problem for `values`"""
+        if self._cho is None:
+            return np.linalg.lstsq(self._design, values, rcond=None)[0]
+        else:
+            return scipy.linalg.cho_solve(self._cho, self._design.T @ values)
+
+    def fit(self, data):
+        """Fit the background profile to `data[..., self.mask]`
+
+        Parameters
+        ----------
+        data: np.ndarray of shape (M, L) or (N, M, L)
+            Image or stack of images
+
+        Returns
+        -------
+        params: dict
+            Fitted model parameters (floats for a single image,
+            arrays of length N for an image stack)
+        """
+        # (number of masked pixels) or (number of masked pixels, N)
+        values = data[..., self.mask].T
+        coeffs = self._solve(values)
+        # one step of iterative refinement
+        coeffs += self._solve(values - self._design @ coeffs)
+        if coeffs.ndim == 2:
+            coeffs /= self._scale.reshape(-1, 1)
+        else:
+            coeffs /= self._scale
+        return dict(zip(self.names, coeffs))
+
+
+class _GeometryCache(object):
+    def __init__(self):
+        """Thread-safe LRU cache for instances of :class:`_FitGeometry`"""
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, shape, border_px=0, from_mask=None, fit_profile="tilt"):
+        """Return the (cached) fit geometry"""
+        if border_px > 0:
+            border_px = int(np.round(border_px))
+        else:
+            border_px = 0
+        if from_mask is None:
+            digest = None
+        else:
+            assert isinstance(from_mask, np.ndarray)
+            buf = np.ascontiguousarray(from_mask, dtype=bool)
+            digest = (buf.shape, hashlib.sha1(buf).hexdigest())
+        key = (tuple(shape), border_px, digest, fit_profile)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        geom = _FitGeometry(mask=_get_mask(shape, border_px, from_mask),
+                            fit_profile=fit_profile)
+        with self._lock:
+            self._entries[key] = geom
+            # remove least recently used entries
+            while (len(self._entries) > CACHE_MAXSIZE
+                   or sum([g.nbytes for g in self._entries.values()])
+                    > CACHE_MAXBYTES):
+                self._entries.popitem(last=False)
+        return geom
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(hits=self.hits,
+                             misses=self.misses,
+                             maxsize=CACHE_MAXSIZE,
+                             currsize=len(self._entries))
+
+
+_geometry_cache = _GeometryCache()
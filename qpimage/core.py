@@ -5,12 +5,19 @@ import h5py
 import nrefocus
 import numpy as np
 import qpretrieve
-from skimage.restoration import unwrap_phase
 
-from .image_data import Amplitude, Phase, write_image_dataset
+from .image_data import Amplitude, ImageCache, Phase, check_chunks, \
+    check_compression, get_chunk_shape, get_compression_kwargs, \
+    get_dataset_role, write_image_dataset
+from .memory import MemoryGroup
 from .meta import MetaDict, DATA_KEYS, META_KEYS
+from .unwrap import UNWRAP_ATTR, get_engine, unwrap_if_wrapped
 from ._version import version as __version__
 
+#: default memory limit [bytes] of the propagated Fourier spectra that
+#: :func:`QPImage.refocus_stack` computes at once
+REFOCUS_STACK_LIMIT = 2**28
+
 #: valid combinations for keyword argument `which_data`
 VALID_INPUT_DATA = ["field",
                     "hologram",  # deprecated
@@ -23,12 +30,11 @@ VALID_INPUT_DATA = ["field",
 
 
 class QPImage(object):
-    # required to create in-memory HDF5 files with unique fd
-    _instances = 0
-
     def __init__(self, data=None, bg_data=None, which_data="phase",
                  meta_data=None, qpretrieve_kw=None, holo_kw=None,
-                 proc_phase=True, h5file=None, h5mode="a", h5dtype="float32"):
+                 proc_phase=True, h5file=None, h5mode="a", h5dtype="float32",
+                 h5chunks=None, h5compression=None, cache_limit=None,
+                 oah_context=None, unwrap="skimage"):
         """Quantitative phase image manipulation
 
         This class implements various tasks for quantitative phase
@@ -39,8 +45,18 @@ class QPImage(object):
         ----------
         data: 2d ndarray (float or complex) or list
             The experimental data (see `which_data`)
-        bg_data: 2d ndarray (float or complex), list, or `None`
-            The background data (must be same type as `data`)
+        bg_data: 2d ndarray (float or complex), list, QPImage, or `None`
+            The background data (must be same type as `data`). To
+            avoid processing the same background data (e.g. a
+            reference hologram) for many QPImages, process it once
+            by creating a QPImage and pass that QPImage (not
+            supported for "raw-qlsi" data, where the reference is
+            used for computing the wavefront). To also store that
+            background only once in a series, use the `bg_data`
+            argument of :func:`qpimage.QPSeries.add_qpimage`.
+
+            .. versionchanged:: 0.10.0
+                `bg_data` can be a QPImage
         which_data: str or tuple
             String or comma-separated list of strings indicating
             the order and type of input data. Valid values are
@@ -62,22 +78,27 @@ class QPImage(object):
             .. versionadded:: 0.1.6
         proc_phase: bool
             Process the phase data. This includes phase unwrapping
-            using :func:`skimage.restoration.unwrap_phase` and
-            correcting for 2PI phase offsets (The offset is estimated
-            from a 1px-wide border around the image).
+            (see `unwrap`) and correcting for 2PI phase offsets (The
+            offset is estimated from a 1px-wide border around the
+            image).
 
             .. versionadded:: 0.6.0
                 Previous versions always performed phase unwrapping
                 and did so without offset correction
-        h5file: str, pathlib.Path, h5py.Group, h5py.File, or None
+        h5file: str, pathlib.Path, h5py.Group, h5py.File, MemoryGroup, or None
             A path to an HDF5 data file where all data is cached. If
             set to `None` (default), all data will be handled in
-            memory using the "core" driver of the :mod:`h5py`'s
-            :class:`h5py:File` class. If the file does not exist,
-            it is created. If the file already exists, it is opened
-            with the file mode defined by `hdf5_mode`. If this is
-            an instance of h5py.Group or h5py.File, then this will
-            be used to internally store all data.
+            memory as NumPy arrays (see :mod:`qpimage.memory`);
+            use :func:`QPImage.copy` to write them to an HDF5 file.
+            If the file does not exist, it is created. If the file
+            already exists, it is opened with the file mode defined
+            by `hdf5_mode`. If this is an instance of h5py.Group,
+            h5py.File, or :class:`qpimage.memory.MemoryGroup`, then
+            this will be used to internally store all data.
+
+            .. versionchanged:: 0.10.0
+                In-memory data are not stored in an HDF5 file with
+                the "core" driver anymore
         h5mode: str
             Valid file modes are (only applies if `h5file` is a path)
 
@@ -92,6 +113,53 @@ class QPImage(object):
             is "float32" which is sufficient for 2D image analysis and
             consumes only half the disk space of the numpy default
             "float64".
+        h5chunks: str, int, tuple of int, or None
+            Chunk layout of the images in the HDF5 file ("full",
+            "tiles", "auto", or a tile shape, see
+            :func:`qpimage.image_data.write_image_dataset`). Use
+            tiles for large images that are often accessed
+            partially (e.g. via :func:`QPImage.roi`). If set to
+            `None` (default), the layout recorded in `h5file` is
+            used or "full" for new files.
+
+            .. versionadded:: 0.10.0
+        h5compression: str, dict, or None
+            Compression profile ("archive", "fast", or "none") of the
+            images in the HDF5 file or a dictionary with a profile
+            for each dataset role ("raw", "bg", "mask"), see
+            :func:`qpimage.image_data.check_compression`. Use "fast"
+            or "none" if writing speed matters more than file size.
+            If set to `None` (default), the profiles recorded in
+            `h5file` are used or "archive" for new files.
+
+            .. versionadded:: 0.10.0
+        cache_limit: int or None
+            Memory limit in bytes for caching the background-corrected
+            images (`amp`, `pha`, `bg_amp`, `bg_pha`, and `field`) of
+            this instance. If set to `None` (default), only the limit
+            shared by all QPImages of the process applies
+            (:const:`qpimage.image_data.CACHE_LIMIT`). Set to 0 to
+            disable caching. The cache is invalidated whenever the
+            data are modified through this instance.
+
+            .. versionadded:: 0.10.0
+        oah_context: qpimage.oah.OAHContext or None
+            Reusable retrieval context for off-axis holograms
+            (`which_data="raw-oah"`) that caches the sideband
+            frequency and the Fourier filter of previous holograms
+            of the same shape. If given, `qpretrieve_kw` is not used
+            for off-axis holograms.
+
+            .. versionadded:: 0.10.0
+        unwrap: str
+            Phase unwrapping engine used if `proc_phase` is set (see
+            :const:`qpimage.unwrap.UNWRAP_ENGINES`): "skimage" (default,
+            :func:`skimage.restoration.unwrap_phase`), "dct" (fast
+            least-squares unwrapping), "tiled" (skimage in overlapping
+            tiles for very large images), or "none" (only 2PI offset
+            correction)
+
+            .. versionadded:: 0.10.0
 
         Notes
         -----
@@ -102,6 +170,9 @@ class QPImage(object):
 
             qpi = QPImage(data=...)
             qpi_scliced = qpi[10:20, 40:30]
+
+        Use :func:`QPImage.roi` to access a region of the image
+        without creating a new QPImage.
         """
         if qpretrieve_kw is None:
             qpretrieve_kw = {}
@@ -130,51 +201,72 @@ class QPImage(object):
             if isinstance(data, (str, pathlib.Path)):
                 msg += " Did you mean `h5file={}`?".format(data)
             raise ValueError(msg)
-        if isinstance(h5file, h5py.Group):
+        if isinstance(h5file, (h5py.Group, MemoryGroup)):
             self.h5 = h5file
             self._do_h5_cleanup = False
+        elif h5file is None:
+            self.h5 = MemoryGroup()
+            self._do_h5_cleanup = False
         else:
-            if h5file is None:
-                h5kwargs = {"name": "qpimage{}.h5".format(QPImage._instances),
-                            "driver": "core",
-                            "backing_store": False,
-                            "mode": "w"}
-            else:
-                h5kwargs = {"name": h5file,
-                            "mode": h5mode}
-            self.h5 = h5py.File(**h5kwargs)
+            self.h5 = h5py.File(name=h5file, mode=h5mode)
             self._do_h5_cleanup = True
-        QPImage._instances += 1
         #: hologram processing keyword arguments
         self.qpretrieve_kw = qpretrieve_kw
+        #: off-axis hologram retrieval context
+        self.oah_context = oah_context
+        #: phase unwrapping engine (see :mod:`qpimage.unwrap`)
+        self.unwrap_engine = unwrap
+        get_engine(unwrap)
         # set meta data
         meta = MetaDict(meta_data)
         for key in meta:
             self.h5.attrs[key] = meta[key]
         if "qpimage version" not in self.h5.attrs:
             self.h5.attrs["qpimage version"] = __version__
+        # cache for background-corrected images
+        self._cache = ImageCache(limit=cache_limit)
         # set data
         self._amp = Amplitude(self.h5.require_group("amplitude"),
-                              h5dtype=h5dtype)
+                              h5dtype=h5dtype,
+                              cache=self._cache,
+                              chunks=h5chunks,
+                              compression=h5compression)
         self._pha = Phase(self.h5.require_group("phase"),
-                          h5dtype=h5dtype)
+                          h5dtype=h5dtype,
+                          cache=self._cache,
+                          chunks=h5chunks,
+                          compression=h5compression)
         if data is not None:
             # Compute phase and amplitude from input data.
             # Note that for QLSI data, the background correction step
             # takes place in the gradient during wavefront computation.
             # Here we allow this to happen and only set the background
             # data if there are any.
-            amp, pha, bg_amp, bg_pha = self._get_amp_pha(
+            if isinstance(bg_data, QPImage):
+                if self._conv_which_data(which_data) == "raw-qlsi":
+                    raise ValueError("`bg_data` must not be a QPImage "
+                                     + "for 'raw-qlsi' data!")
+                # already processed background data
+                bg_qpi, bg_data = bg_data, None
+            else:
+                bg_qpi = None
+            amp, pha, bg_amp, bg_pha, unwrapped = self._get_amp_pha(
                 data=data,
                 bg_data=bg_data,
                 which_data=which_data,
-                proc_phase=proc_phase)
+                proc_phase=proc_phase,
+                ret_unwrapped=True)
             self._amp["raw"] = amp
             self._pha["raw"] = pha
+            self._pha.h5.attrs[UNWRAP_ATTR] = unwrapped
             # set background data
-            if bg_pha is not None:
+            if bg_qpi is not None:
+                self.set_bg_data(bg_data=bg_qpi)
+            elif bg_pha is not None:
+                # (already processed in `_get_amp_pha`)
                 self.set_bg_data(bg_data=(bg_pha, bg_amp),
-                                 which_data="phase,amplitude")
+                                 which_data="phase,amplitude",
+                                 proc_phase=False)
         self.h5dtype = h5dtype
         # :mod:`nrefocus` interface class
         self._refocuser = None
@@ -212,12 +304,7 @@ class QPImage(object):
         """
         if isinstance(given, (slice, tuple)):
             # return new QPImage
-            qpi = QPImage(data=(self.raw_pha[given], self.raw_amp[given]),
-                          bg_data=(self.bg_pha[given], self.bg_amp[given]),
-                          which_data=("phase", "amplitude"),
-                          meta_data=self.meta,
-                          proc_phase=False)
-            return qpi
+            return self.roi(given).materialize()
         elif isinstance(given, str):
             # return meta data
             return self.meta[given]
@@ -231,8 +318,8 @@ class QPImage(object):
         else:
             ident = hex(id(self))
         rep = "QPImage <{}>, {x}x{y}px".format(ident,
-                                               x=self._amp.raw.shape[0],
-                                               y=self._amp.raw.shape[1],
+                                               x=self._amp.shape[0],
+                                               y=self._amp.shape[1],
                                                )
         if "wavelength" in self:
             wl = self["wavelength"]
@@ -282,7 +369,8 @@ class QPImage(object):
             msg = "unknown type for `which_data`: {}".format(which_data)
             raise ValueError(msg)
 
-    def _get_amp_pha(self, data, which_data, bg_data=None, proc_phase=True):
+    def _get_amp_pha(self, data, which_data, bg_data=None, proc_phase=True,
+                     ret_unwrapped=False):
         """Convert input data to phase and amplitude
 
         Parameters
@@ -297,13 +385,17 @@ class QPImage(object):
             with the phase data as first element.
         proc_phase: bool
             Process the phase data. This includes phase unwrapping
-            using :func:`skimage.restoration.unwrap_phase` and
-            correcting for 2PI phase offsets (The offset is estimated
-            from a 1px-wide border around the image).
+            with :attr:`QPImage.unwrap_engine` and correcting for 2PI
+            phase offsets (The offset is estimated from a 1px-wide
+            border around the image).
 
             .. versionadded:: 0.6.0
                 Previous versions always performed phase unwrapping
                 and did so without offset correction
+        ret_unwrapped: bool
+            Also return whether the phase unwrapping engine was
+            applied (phase images without phase jumps are not
+            unwrapped, see :func:`qpimage.unwrap.unwrap_if_wrapped`)
 
         Returns
         -------
@@ -312,6 +404,8 @@ class QPImage(object):
         bg_amp, bg_pha: .Amplitdue, .Phase or None, None
             background amplitude and phase retrieved from the input
             data (if applicable)
+        unwrapped: bool
+            whether the phase was unwrapped (if `ret_unwrapped`)
         """
         which_data = QPImage._conv_which_data(which_data)
 
@@ -332,9 +426,14 @@ class QPImage(object):
                 warnings.warn("The 'hologram' data type is deprecated, "
                               + "please use 'raw-oah' instead!",
                               DeprecationWarning)
-            oah = qpretrieve.OffAxisHologram(data=data, **self.qpretrieve_kw)
-            amp, pha, _, _ = self._get_amp_pha(oah.run_pipeline(),
-                                               which_data="field")
+            if self.oah_context is not None:
+                field = self.oah_context.retrieve(data)
+            else:
+                oah = qpretrieve.OffAxisHologram(data=data,
+                                                 **self.qpretrieve_kw)
+                field = oah.run_pipeline()
+            amp, pha, _, _ = self._get_amp_pha(field, which_data="field",
+                                               proc_phase=False)
         elif which_data == "raw-qlsi":
             qlsi = qpretrieve.QLSInterferogram(
                 data=data,
@@ -352,29 +451,11 @@ class QPImage(object):
         if amp.size == 0 or pha.size == 0:
             msg = "`data` with shape {} has zero size!".format(amp.shape)
             raise ValueError(msg)
+        unwrapped = False
         if proc_phase:
-            # phase unwrapping (take into account nans)
-            nanmask = np.isnan(pha)
-            if np.sum(nanmask):
-                # create masked array
-                # skimage.restoration.unwrap_phase cannot handle nan data
-                # (even if masked)
-                pham = pha.copy()
-                pham[nanmask] = 0
-                pham = np.ma.masked_array(pham, mask=nanmask)
-                pha = unwrap_phase(pham, rng=47)
-                pha[nanmask] = np.nan
-            else:
-                pha = unwrap_phase(pha, rng=47)
-            # remove 2PI offsets that might be present in the border phase
-            border = np.concatenate((pha[0, :],
-                                     pha[-1, :],
-                                     pha[:, 0],
-                                     pha[:, -1]))
-            twopi = 2*np.pi
-            minimum = divmod_neg(np.nanmin(border), twopi)[0]
-            offset = minimum * twopi
-            pha -= offset
+            # phase unwrapping (the engines take into account nans)
+            pha, unwrapped = unwrap_if_wrapped(pha, engine=self.unwrap_engine)
+            pha = correct_2pi_offset(pha)
 
         if bg_data is not None:
             bg_amp, bg_pha, _, _ = self._get_amp_pha(
@@ -385,7 +466,49 @@ class QPImage(object):
         else:
             bg_amp = bg_pha = None
 
-        return amp, pha, bg_amp, bg_pha
+        if ret_unwrapped:
+            return amp, pha, bg_amp, bg_pha, unwrapped
+        else:
+            return amp, pha, bg_amp, bg_pha
+
+    def _get_border_px(self, border_m=0, border_perc=0, border_px=0,
+                       from_mask=None):
+        """Convert the `border_*` arguments of `compute_bg` to pixels
+
+        The largest border is used. A ValueError is raised if
+        neither a border nor a valid `from_mask` is given.
+        """
+        border_list = []
+        if border_m:
+            if border_m < 0:
+                raise ValueError("`border_m` must be greater than zero!")
+            border_list.append(border_m / self.meta["pixel size"])
+        if border_perc:
+            if border_perc < 0 or border_perc > 50:
+                raise ValueError("`border_perc` must be in interval [0, 50]!")
+            size = np.average(self.shape)
+            border_list.append(size * border_perc / 100)
+        if border_px:
+            border_list.append(border_px)
+        # get maximum border size
+        if border_list:
+            border_px = int(np.round(np.max(border_list)))
+        elif from_mask is None:
+            raise ValueError("Neither `from_mask` nor `border_*` given!")
+        elif np.all(from_mask == 0):
+            raise ValueError("`from_mask` must not be all-zero!")
+        return border_px
+
+    def _get_field(self):
+        """Return the cached, read-only background-corrected field"""
+        key = ("QPImage", "field")
+        version = (self._amp._version, self._pha._version)
+        field = self._cache.get(key, version)
+        if field is None:
+            field = self._amp._get_image() \
+                * np.exp(1j * self._pha._get_image())
+            self._cache.set(key, version, field)
+        return field
 
     @property
     def bg_amp(self):
@@ -405,12 +528,12 @@ class QPImage(object):
     @property
     def dtype(self):
         """dtype of the phase data array"""
-        return self._pha.raw.dtype
+        return self._pha.dtype
 
     @property
     def field(self):
         """background-corrected complex field"""
-        return self.amp * np.exp(1j * self.pha)
+        return self._get_field().copy()
 
     @property
     def info(self):
@@ -448,7 +571,12 @@ class QPImage(object):
     @property
     def shape(self):
         """size of image dimensions"""
-        return self._pha.h5["raw"].shape
+        return self._pha.shape
+
+    @property
+    def size(self):
+        """number of pixels of the phase data array"""
+        return self._pha.size
 
     def clear_bg(self, which_data=("amplitude", "phase"), keys="fit"):
         """Clear background correction
@@ -488,7 +616,7 @@ class QPImage(object):
     def compute_bg(self, which_data="phase",
                    fit_offset="mean", fit_profile="tilt",
                    border_m=0, border_perc=0, border_px=0,
-                   from_mask=None, ret_mask=False):
+                   from_mask=None, ret_mask=False, fit_storage="image"):
         """Compute background correction
 
         Parameters
@@ -530,6 +658,10 @@ class QPImage(object):
             estimation.
         ret_mask: bool
             Return the boolean mask used to compute the background.
+        fit_storage: str
+            Store the full background image ("image", default) or
+            only the background model parameters ("params"), see
+            :func:`qpimage.image_data.ImageData.estimate_bg`.
 
         Notes
         -----
@@ -552,26 +684,10 @@ class QPImage(object):
                 "phase" in which_data):
             msg = "`which_data` must contain 'phase' or 'amplitude'!"
             raise ValueError(msg)
-        # get border in px
-        border_list = []
-        if border_m:
-            if border_m < 0:
-                raise ValueError("`border_m` must be greater than zero!")
-            border_list.append(border_m / self.meta["pixel size"])
-        if border_perc:
-            if border_perc < 0 or border_perc > 50:
-                raise ValueError("`border_perc` must be in interval [0, 50]!")
-            size = np.average(self.shape)
-            border_list.append(size * border_perc / 100)
-        if border_px:
-            border_list.append(border_px)
-        # get maximum border size
-        if border_list:
-            border_px = int(np.round(np.max(border_list)))
-        elif from_mask is None:
-            raise ValueError("Neither `from_mask` nor `border_*` given!")
-        elif np.all(from_mask == 0):
-            raise ValueError("`from_mask` must not be all-zero!")
+        border_px = self._get_border_px(border_m=border_m,
+                                        border_perc=border_perc,
+                                        border_px=border_px,
+                                        from_mask=from_mask)
         # Get affected image data
         imdat_list = []
         if "amplitude" in which_data:
@@ -585,22 +701,35 @@ class QPImage(object):
                                      fit_profile=fit_profile,
                                      border_px=border_px,
                                      from_mask=from_mask,
-                                     ret_mask=ret_mask)
+                                     ret_mask=ret_mask,
+                                     fit_storage=fit_storage)
         # return phase mask (if possible) for user-convenience/testing
         return mask
 
-    def copy(self, h5file=None):
+    def copy(self, h5file=None, h5chunks=None, h5compression=None):
         """Create a copy of the current instance
 
         This is done by recursively copying the underlying HDF5 data.
 
         Parameters
         ----------
-        h5file: str, h5py.File, h5py.Group, or None
+        h5file: str, h5py.File, h5py.Group, MemoryGroup, or None
             see `QPImage.__init__`
+        h5chunks: str, int, tuple of int, or None
+            Chunk layout of the copy (see `QPImage.__init__`);
+            defaults to the layout of this instance
+        h5compression: str, dict, or None
+            Compression profiles of the copy (see `QPImage.__init__`);
+            defaults to the profiles of this instance
         """
-        h5 = copyh5(self.h5, h5file)
-        return QPImage(h5file=h5, h5dtype=self.h5dtype)
+        if h5chunks is None:
+            h5chunks = self._pha.chunks
+        if h5compression is None:
+            h5compression = self._pha.compression
+        h5 = copyh5(self.h5, h5file, chunks=h5chunks,
+                    compression=h5compression)
+        return QPImage(h5file=h5, h5dtype=self.h5dtype,
+                       cache_limit=self._cache.limit)
 
     def refocus(self, distance, kernel="helmholtz", padding=True,
                 h5file=None, h5mode="a", ret_refocus_iface=False,
@@ -622,12 +751,11 @@ class QPImage(object):
         h5file: str, h5py.Group, h5py.File, or None
             A path to an HDF5 data file where the QPImage is cached.
             If set to `None` (default), all data will be handled in
-            memory using the "core" driver of the :mod:`h5py`'s
-            :class:`h5py:File` class. If the file does not exist,
-            it is created. If the file already exists, it is opened
-            with the file mode defined by `hdf5_mode`. If this is
-            an instance of h5py.Group or h5py.File, then this will
-            be used to internally store all data.
+            memory (see :func:`QPImage.__init__`). If the file does
+            not exist, it is created. If the file already exists, it
+            is opened with the file mode defined by `hdf5_mode`. If
+            this is an instance of h5py.Group or h5py.File, then this
+            will be used to internally store all data.
         h5mode: str
             Valid file modes are (only applies if `h5file` is a path)
 
@@ -696,6 +824,137 @@ class QPImage(object):
         else:
             return qpi2
 
+    def refocus_stack(self, distances, kernel="helmholtz", padding=True,
+                      series=None, proc_phase=True,
+                      max_bytes=REFOCUS_STACK_LIMIT):
+        """Compute numerically refocused fields for several distances
+
+        In contrast to calling :func:`QPImage.refocus` for each
+        distance, the field is computed and Fourier-transformed only
+        once and the refocused fields are computed in chunks of
+        distances at once. For equidistant `distances`, the
+        propagation kernels are computed recursively from the kernel
+        of one step.
+
+        Parameters
+        ----------
+        distances: 1d array-like of floats
+            Focusing distances [m]
+        kernel: str
+            Refocusing method, one of ["helmholtz","fresnel"]
+        padding: bool
+            Whether to perform padding during refocusing
+            (see :func:`QPImage.refocus`)
+        series: qpimage.QPSeries or None
+            If given, the refocused QPImages are added to this series
+            (e.g. ``QPSeries(layout="stacked")``) and the series is
+            returned. The identifiers of the QPImages are set as in
+            :func:`QPImage.refocus`.
+        proc_phase: bool
+            Whether to process (unwrap) the phase of the refocused
+            QPImages added to `series` (see :class:`QPImage`)
+        max_bytes: int
+            Memory limit [bytes] of the propagated Fourier spectra
+            that are computed at once (at least one distance is
+            computed at a time)
+
+        Returns
+        -------
+        stack: 3d complex ndarray or qpimage.QPSeries
+            Refocused fields (the first axis enumerates `distances`)
+            or `series`
+
+        See Also
+        --------
+        - :mod:`nrefocus`: library used for numerical focusing
+        """
+        distances = np.array(distances, dtype=float).reshape(-1)
+        field = self.field
+        # (planning FFTW transforms does not pay off for a single
+        # forward transform)
+        refocuser = nrefocus.RefocusNumpy(
+            field=field,
+            wavelength=self["wavelength"],
+            pixel_size=self["pixel size"],
+            medium_index=self["medium index"],
+            distance=0,
+            kernel=kernel,
+            padding=padding
+        )
+        fft_origin = np.asarray(refocuser.fft_origin)
+        # the spectra and their inverse Fourier transforms
+        chunk_size = max(1, int(max_bytes // (2 * fft_origin.nbytes)))
+        if series is None:
+            stack = np.empty((distances.size,) + field.shape, dtype=complex)
+        if "identifier" in self:
+            ident = self["identifier"]
+        else:
+            ident = ""
+        steps = np.diff(distances)
+        if steps.size and np.allclose(steps, steps[0], rtol=1e-9, atol=0):
+            # For equidistant distances, the propagation kernels are
+            # computed by multiplying with the kernel of one step.
+            step_kernel = refocuser.get_kernel(steps[0])
+        else:
+            step_kernel = None
+        for start in range(0, distances.size, chunk_size):
+            chunk = distances[start:start + chunk_size]
+            spectra = np.empty((chunk.size,) + fft_origin.shape,
+                               dtype=complex)
+            for ii, distance in enumerate(chunk):
+                if step_kernel is not None and ii > 0:
+                    np.multiply(spectra[ii - 1], step_kernel,
+                                out=spectra[ii])
+                else:
+                    spectra[ii] = refocuser.get_kernel(distance)
+            spectra *= fft_origin
+            fields = np.fft.ifft2(spectra, axes=(-2, -1))
+            del spectra
+            for ii, distance in enumerate(chunk):
+                field2 = fields[ii]
+                if padding:
+                    field2 = nrefocus.pad.pad_rem(field2)
+                if series is None:
+                    stack[start + ii] = field2
+                else:
+                    meta_data = self.meta
+                    meta_data["identifier"] = \
+                        f"{ident}@{kernel[0]}{distance:.5e}m"
+                    qpi = QPImage(data=field2,
+                                  which_data="field",
+                                  meta_data=meta_data,
+                                  proc_phase=proc_phase,
+                                  h5dtype=self.h5dtype,
+                                  unwrap=self.unwrap_engine)
+                    series.add_qpimage(qpi)
+        if series is None:
+            return stack
+        else:
+            return series
+
+    def roi(self, given):
+        """Return a lazy view of a region of interest
+
+        Parameters
+        ----------
+        given: slice or tuple of slices
+            Region of interest, e.g. `np.s_[100:356, 200:456]`;
+            only positive slice steps are supported.
+
+        Returns
+        -------
+        roi: QPImageROI
+            View that reads only the hyperslab `given` from the
+            underlying data when one of its properties is accessed
+
+        Notes
+        -----
+        `qpi[given]` is equivalent to `qpi.roi(given).materialize()`.
+
+        .. versionadded:: 0.10.0
+        """
+        return QPImageROI(self, given)
+
     def set_bg_data(self, bg_data, which_data=None, proc_phase=True):
         """Set background amplitude and phase data
 
@@ -712,9 +971,9 @@ class QPImage(object):
             with the phase data as first element.
         proc_phase: bool
             Process the phase data. This includes phase unwrapping
-            using :func:`skimage.restoration.unwrap_phase` and
-            correcting for 2PI phase offsets (The offset is estimated
-            from a 1px-wide border around the image).
+            with :attr:`QPImage.unwrap_engine` and correcting for 2PI
+            phase offsets (The offset is estimated from a 1px-wide
+            border around the image).
         """
         if isinstance(bg_data, QPImage):
             if which_data is not None:
@@ -734,56 +993,187 @@ class QPImage(object):
         self._pha.set_bg(pha, key="data")
 
 
-def copyh5(inh5, outh5):
+class QPImageROI(object):
+    def __init__(self, qpi, given):
+        """Lazy view of a region of interest of a QPImage
+
+        Every property access reads the corresponding hyperslab from
+        the raw data and computes the background only in the region
+        of interest. The view reflects later modifications of the
+        underlying QPImage.
+
+        Parameters
+        ----------
+        qpi: QPImage
+            The underlying QPImage
+        given: slice or tuple of slices
+            Region of interest (see :func:`QPImage.roi`)
+        """
+        self.qpi = qpi
+        #: region of interest as a tuple of two normalized slices
+        self.region = self._normalize_region(given, qpi.shape)
+
+    def __repr__(self):
+        return "QPImageROI of {}, [{}:{}, {}:{}]".format(
+            repr(self.qpi),
+            self.region[0].start, self.region[0].stop,
+            self.region[1].start, self.region[1].stop)
+
+    @staticmethod
+    def _normalize_region(given, shape):
+        if isinstance(given, slice):
+            given = (given,)
+        if (not isinstance(given, tuple)
+            or len(given) > 2
+                or not all(isinstance(gg, slice) for gg in given)):
+            msg = "Only slicing and meta data keys allowed for `__getitem__`"
+            raise ValueError(msg)
+        given = given + (slice(None),) * (2 - len(given))
+        region = tuple(slice(*gg.indices(size))
+                       for gg, size in zip(given, shape))
+        if any(sl.step < 1 for sl in region):
+            raise ValueError("Only positive slice steps are supported!")
+        return region
+
+    @property
+    def amp(self):
+        """background-corrected amplitude image of the region"""
+        return self.qpi._amp._bg_correct(*self.qpi._amp._get_region(
+            self.region))
+
+    @property
+    def bg_amp(self):
+        """background amplitude image of the region"""
+        return self.qpi._amp._get_region(self.region)[1]
+
+    @property
+    def bg_pha(self):
+        """background phase image of the region"""
+        return self.qpi._pha._get_region(self.region)[1]
+
+    @property
+    def field(self):
+        """background-corrected complex field of the region"""
+        return self.amp * np.exp(1j * self.pha)
+
+    @property
+    def meta(self):
+        """dictionary with imaging meta data"""
+        return self.qpi.meta
+
+    @property
+    def pha(self):
+        """background-corrected phase image of the region"""
+        return self.qpi._pha._bg_correct(*self.qpi._pha._get_region(
+            self.region))
+
+    @property
+    def raw_amp(self):
+        """raw amplitude image of the region"""
+        return self.qpi._amp.h5["raw"][self.region]
+
+    @property
+    def raw_pha(self):
+        """raw phase image of the region"""
+        return self.qpi._pha.h5["raw"][self.region]
+
+    @property
+    def shape(self):
+        """size of the region"""
+        return self.qpi._pha._region_shape(self.region)
+
+    def materialize(self, h5file=None, h5mode="a", h5chunks=None,
+                    h5compression=None):
+        """Create a new QPImage from the region of interest
+
+        The background data of the returned QPImage is merged into
+        the "data" background array, i.e. there will be no "fit"
+        background array.
+
+        Parameters
+        ----------
+        h5file: str, h5py.Group, h5py.File, MemoryGroup, or None
+            see `QPImage.__init__`
+        h5mode: str
+            see `QPImage.__init__`
+        h5chunks: str, int, tuple of int, or None
+            see `QPImage.__init__`; defaults to the chunk layout
+            of the underlying QPImage
+        h5compression: str, dict, or None
+            see `QPImage.__init__`; defaults to the compression
+            profiles of the underlying QPImage
+        """
+        if h5chunks is None:
+            h5chunks = self.qpi._pha.chunks
+        if h5compression is None:
+            h5compression = self.qpi._pha.compression
+        raw_pha, bg_pha = self.qpi._pha._get_region(self.region)
+        raw_amp, bg_amp = self.qpi._amp._get_region(self.region)
+        qpi = QPImage(data=(raw_pha, raw_amp),
+                      bg_data=(bg_pha, bg_amp),
+                      which_data=("phase", "amplitude"),
+                      meta_data=self.meta,
+                      proc_phase=False,
+                      h5file=h5file,
+                      h5mode=h5mode,
+                      h5dtype=self.qpi.h5dtype,
+                      h5chunks=h5chunks,
+                      h5compression=h5compression)
+        if UNWRAP_ATTR in self.qpi._pha.h5.attrs:
+            qpi._pha.h5.attrs[UNWRAP_ATTR] = \
+                self.qpi._pha.h5.attrs[UNWRAP_ATTR]
+        return qpi
+
+
+def copyh5(inh5, outh5, chunks=None, compression=None):
     """Recursively copy all HDF5 data from one group to another
 
-    Data from links is copied.
+    Datasets are copied with HDF5's native object copy (compressed
+    chunks are not decoded) unless their chunk layout or compression
+    has to be converted or one of the groups is held in memory. Hard
+    links within `inh5` remain hard links in `outh5`. Data from soft
+    links is copied.
 
     Parameters
     ----------
-    inh5: str, h5py.File, or h5py.Group
+    inh5: str, h5py.File, h5py.Group, or MemoryGroup
         The input HDF5 data. This can be either a file name or
         an HDF5 object.
-    outh5: str, h5py.File, h5py.Group, or None
+    outh5: str, h5py.File, h5py.Group, MemoryGroup, or None
         The output HDF5 data. This can be either a file name or
-        an HDF5 object. If set to `None`, a new HDF5 object is
-        created in memory.
+        an HDF5 object. If set to `None`, a new
+        :class:`qpimage.memory.MemoryGroup` is created.
+    chunks: str, int, tuple of int, or None
+        Chunk layout of the copied images (see
+        :func:`qpimage.image_data.write_image_dataset`); the
+        "chunk_layout" attribute of image data groups is updated
+        accordingly. If set to `None` (default), the chunk shapes
+        of the input datasets are kept.
+    compression: str, dict, or None
+        Compression profiles of the copied images (see
+        :func:`qpimage.image_data.check_compression`); the
+        "compression_*" attributes of image data groups are updated
+        accordingly. If set to `None` (default), the filters of the
+        input datasets are kept.
 
     Notes
     -----
     All data in outh5 are overridden by the inh5 data.
     """
-    if not isinstance(inh5, h5py.Group):
+    if not isinstance(inh5, (h5py.Group, MemoryGroup)):
         inh5 = h5py.File(inh5, mode="r")
     if outh5 is None:
-        # create file in memory
-        h5kwargs = {"name": "qpimage{}.h5".format(QPImage._instances),
-                    "driver": "core",
-                    "backing_store": False,
-                    "mode": "w"}
-        outh5 = h5py.File(**h5kwargs)
+        # keep data in memory
+        outh5 = MemoryGroup()
         return_h5obj = True
-        QPImage._instances += 1
-    elif not isinstance(outh5, h5py.Group):
+    elif not isinstance(outh5, (h5py.Group, MemoryGroup)):
         # create new file
         outh5 = h5py.File(outh5, mode="w")
         return_h5obj = False
     else:
         return_h5obj = True
-    # begin iteration
-    for key in inh5:
-        if key in outh5:
-            del outh5[key]
-        if isinstance(inh5[key], h5py.Group):
-            outh5.create_group(key)
-            copyh5(inh5[key], outh5[key])
-        else:
-            dset = write_image_dataset(group=outh5,
-                                       key=key,
-                                       data=inh5[key][:],
-                                       h5dtype=inh5[key].dtype)
-            dset.attrs.update(inh5[key].attrs)
-    outh5.attrs.update(inh5.attrs)
+    _copyh5_group(inh5, outh5, chunks=chunks, compression=compression,
+                  links={})
     if return_h5obj:
         # in-memory or previously created instance of h5py.File
         return outh5
@@ -795,6 +1185,138 @@ def copyh5(inh5, outh5):
         return fn
 
 
+def _copyh5_group(inh5, outh5, chunks, compression, links):
+    """Recursive part of :func:`copyh5`
+
+    `links` maps input datasets (see :func:`_object_key`) to tuples
+    of the input dataset and its output dataset already copied.
+    """
+    for key in inh5:
+        if key in outh5:
+            del outh5[key]
+        inobj = inh5[key]
+        if isinstance(inobj, (h5py.Group, MemoryGroup)):
+            outh5.create_group(key)
+            _copyh5_group(inobj, outh5[key], chunks=chunks,
+                          compression=compression, links=links)
+            continue
+        objkey = _object_key(inobj)
+        if objkey in links:
+            # hard link to the dataset copied before
+            outh5[key] = links[objkey][1]
+            continue
+        if inobj.shape is None:
+            # empty dataset (parametric background)
+            dset = outh5.create_dataset(key,
+                                        data=h5py.Empty(inobj.dtype))
+            dset.attrs.update(inobj.attrs)
+        elif inobj.ndim != 2:
+            # not an image (e.g. the identifier index of a series)
+            if (isinstance(inobj, h5py.Dataset)
+                    and isinstance(outh5, h5py.Group)):
+                outh5.copy(inobj, outh5, name=key)
+                dset = outh5[key]
+            else:
+                dset = outh5.create_dataset(key, data=inobj[:],
+                                            dtype=inobj.dtype)
+                dset.attrs.update(inobj.attrs)
+        else:
+            if compression is not None:
+                role = get_dataset_role(inobj.name)
+                dcompression = check_compression(compression)[role]
+            else:
+                dcompression = None
+            if _can_copy_native(inobj, outh5, chunks, dcompression):
+                outh5.copy(inobj, outh5, name=key)
+                dset = outh5[key]
+            else:
+                if chunks is None:
+                    # keep the input chunk shape
+                    dchunks = getattr(inobj, "chunks", None) or "full"
+                else:
+                    dchunks = chunks
+                if dcompression is None:
+                    if isinstance(inobj, h5py.Dataset):
+                        # keep the input filters
+                        dcompression = {
+                            "compression": inobj.compression,
+                            "compression_opts": inobj.compression_opts,
+                            "fletcher32": inobj.fletcher32,
+                            "shuffle": inobj.shuffle}
+                    else:
+                        dcompression = "archive"
+                dset = write_image_dataset(group=outh5,
+                                           key=key,
+                                           data=inobj[:],
+                                           h5dtype=inobj.dtype,
+                                           chunks=dchunks,
+                                           compression=dcompression)
+                dset.attrs.update(inobj.attrs)
+        # (keep a reference to `inobj`, so its `id` is not reused)
+        links[objkey] = (inobj, dset)
+    outh5.attrs.update(inh5.attrs)
+    if chunks is not None and "chunk_layout" in outh5.attrs:
+        outh5.attrs["chunk_layout"] = check_chunks(chunks)
+    if compression is not None and "compression_raw" in outh5.attrs:
+        for role, profile in check_compression(compression).items():
+            outh5.attrs["compression_" + role] = profile
+
+
+def _can_copy_native(dset, outh5, chunks, compression):
+    """Whether `dset` can be copied to `outh5` without conversion
+
+    This is the case if both are HDF5 objects, if `outh5` is not an
+    in-memory file (where images are stored without filters), and if
+    `dset` already has the requested chunk layout and compression
+    profile (`None` means no conversion is requested).
+    """
+    if (not isinstance(dset, h5py.Dataset)
+        or not isinstance(outh5, h5py.Group)
+            or outh5.file.driver == "core"):
+        return False
+    if compression is not None:
+        kwargs = get_compression_kwargs(compression)
+        filters = {"compression": dset.compression,
+                   "compression_opts": dset.compression_opts,
+                   "fletcher32": dset.fletcher32,
+                   "shuffle": dset.shuffle}
+        for name, value in filters.items():
+            default = False if name in ["fletcher32", "shuffle"] else None
+            if kwargs.get(name, default) != value:
+                return False
+    if chunks is not None:
+        shape = get_chunk_shape(chunks, dset.shape, dset.dtype)
+        if dset.chunks != shape:
+            return False
+    return True
+
+
+def _object_key(obj):
+    """Identify a dataset for detecting hard links"""
+    if isinstance(obj, h5py.HLObject):
+        # equal for all hard links to the same object
+        return obj.id
+    else:
+        return id(obj)
+
+
+def correct_2pi_offset(pha):
+    """Remove 2PI offsets that might be present in the border phase
+
+    The offset is estimated from a 1px-wide border around the image;
+    `pha` is modified in-place and returned.
+    """
+    border = np.concatenate((pha[0, :],
+                             pha[-1, :],
+                             pha[:, 0],
+                             pha[:, -1]))
+    twopi = 2*np.pi
+    minimum = divmod_neg(np.nanmin(border), twopi)[0]
+    offset = minimum * twopi
+    pha -= offset
+    return pha
+
+
 def divmod_neg(a, b):
     """Return divmod with the closest result to zero"""
     q, r = divmod(a, b)
@@ -1,22 +1,164 @@
 import abc
+import collections
 import numbers
+import threading
 import warnings
+import weakref
 
 import h5py
 import numpy as np
 
 from . import bg_estimate
+from .memory import MemoryDataset, MemoryGroup
 
 #: default HDF5 compression keyword arguments
 COMPRESSION = {"compression": "gzip",
                "compression_opts": 9,
                }
 
+#: HDF5 filter keyword arguments of the compression profiles
+#: (the profile "archive" additionally uses :const:`COMPRESSION`)
+COMPRESSION_PROFILES = {
+    # small files with checksums (default)
+    "archive": {"fletcher32": True},
+    # fast writing with checksums
+    "fast": {"fletcher32": True,
+             "compression": "lzf"},
+    # fastest writing, largest files
+    "none": {},
+}
+
+#: dataset roles for which compression profiles can be set
+#: individually ("raw": raw image data, "bg": background data,
+#: "mask": background masks)
+COMPRESSION_ROLES = ["raw",
+                     "bg",
+                     "mask",
+                     ]
+
+#: valid chunk layouts for storing images in HDF5 files
+#: (see :func:`write_image_dataset`)
+VALID_CHUNK_LAYOUTS = ["full",
+                       "tiles",
+                       "auto",
+                       ]
+
+#: tile size (pixels) of the chunk layout "tiles"
+CHUNK_TILE_SIZE = 256
+
+#: images larger than this (bytes) are stored in tiles of size
+#: :const:`CHUNK_TILE_SIZE` with the chunk layout "auto"
+CHUNK_AUTO_LIMIT = 2**20
+
 #: valid background data identifiers
 VALID_BG_KEYS = ["data",
                  "fit",
                  ]
 
+#: valid values for keyword argument `fit_storage` in
+#: :func:`ImageData.estimate_bg`
+VALID_FIT_STORAGES = ["image",
+                      "params",
+                      ]
+
+#: memory limit in bytes shared by all :class:`ImageCache` instances
+#: (i.e. by all QPImages) of a process; can be changed at any time,
+#: e.g. ``qpimage.image_data.CACHE_LIMIT = 2**30``
+CACHE_LIMIT = 2**28
+
+#: entries of all :class:`ImageCache` instances in the order of their
+#: last use ((cache id, key) -> (cache weakref, size in bytes))
+_cache_usage = collections.OrderedDict()
+_cache_lock = threading.RLock()
+
+
+def _cache_forget(cache_id, entries):
+    """Remove the entries of a deleted :class:`ImageCache`"""
+    with _cache_lock:
+        for key in entries:
+            _cache_usage.pop((cache_id, key), None)
+
+
+class ImageCache(object):
+    def __init__(self, limit=None):
+        """Memory-bounded cache for computed (background-corrected) images
+
+        Every entry is stored with a version identifier. Entries
+        whose version does not match the requested version are
+        considered outdated. The least recently used entries are
+        removed first, both when this cache exceeds `limit` and when
+        all caches of the process together exceed :const:`CACHE_LIMIT`.
+
+        Parameters
+        ----------
+        limit: int or None
+            Maximum size of the arrays in this cache in bytes. If set
+            to `None`, only :const:`CACHE_LIMIT` applies. Set to 0 to
+            disable caching.
+        """
+        #: maximum size of the arrays in this cache in bytes
+        #: (None: only :const:`CACHE_LIMIT` applies)
+        self.limit = limit
+        self._entries = collections.OrderedDict()
+        weakref.finalize(self, _cache_forget, id(self), self._entries)
+
+    @property
+    def nbytes(self):
+        """total size of all cached arrays in bytes"""
+        return sum([arr.nbytes for _, arr in self._entries.values()])
+
+    def _remove(self, key):
+        """Remove an entry (call with `_cache_lock` acquired)"""
+        self._entries.pop(key, None)
+        _cache_usage.pop((id(self), key), None)
+
+    def clear(self):
+        """Remove all entries"""
+        with _cache_lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def get(self, key, version):
+        """Return the cached (read-only) array or `None`"""
+        with _cache_lock:
+            if key in self._entries:
+                cversion, arr = self._entries[key]
+                if cversion == version:
+                    self._entries.move_to_end(key)
+                    _cache_usage.move_to_end((id(self), key))
+                    return arr
+                else:
+                    # outdated entry
+                    self._remove(key)
+        return None
+
+    def set(self, key, version, arr):
+        """Add an array to the cache
+
+        The array is made read-only if it is cached.
+        """
+        with _cache_lock:
+            self._remove(key)
+            limit = CACHE_LIMIT
+            if self.limit is not None:
+                limit = min(limit, self.limit)
+            if arr.nbytes > limit:
+                return
+            arr.flags.writeable = False
+            self._entries[key] = (version, arr)
+            _cache_usage[(id(self), key)] = (weakref.ref(self), arr.nbytes)
+            # remove least recently used entries of this cache
+            while self.nbytes > limit:
+                self._remove(next(iter(self._entries)))
+            # remove least recently used entries of all caches
+            total = sum([nbytes for _, nbytes in _cache_usage.values()])
+            while total > CACHE_LIMIT:
+                (_, ckey), (ref, nbytes) = _cache_usage.popitem(last=False)
+                cache = ref()
+                if cache is not None:
+                    cache._entries.pop(ckey, None)
+                total -= nbytes
+
 
 class ImageData(object):
     """Base class for image management
@@ -28,11 +170,12 @@ class ImageData(object):
     """
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, h5, h5dtype="float32"):
+    def __init__(self, h5, h5dtype="float32", cache=None, chunks=None,
+                 compression=None):
         """
         Parameters
         ----------
-        h5: h5py.Group
+        h5: h5py.Group or qpimage.memory.MemoryGroup
             HDF5 group where all data is kept
 
         h5dtype: str
@@ -40,17 +183,57 @@ class ImageData(object):
             is "float32" which is sufficient for 2D image analysis and
             consumes only half the disk space of the numpy default
             "float64".
+        cache: ImageCache or None
+            Cache for the combined background image and the
+            background-corrected image. If set to `None`, a new
+            cache with the default memory limit is created.
+        chunks: str, int, tuple of int, or None
+            Chunk layout for storing images (see
+            :func:`write_image_dataset`). The layout is recorded in
+            the "chunk_layout" attribute of `h5` when images are
+            written. If set to `None`, the recorded layout is used
+            (defaults to "full").
+        compression: str, dict, or None
+            Compression profile(s) for storing images (see
+            :func:`check_compression`). The profiles are recorded
+            in the "compression_raw", "compression_bg", and
+            "compression_mask" attributes of `h5` when images are
+            written. If set to `None`, the recorded profiles are
+            used (defaults to "archive").
+
+        Notes
+        -----
+        Every modification of the data through this instance
+        increments a version counter which invalidates the cached
+        images. Modifications of the underlying HDF5 data by other
+        means (e.g. another instance working on the same HDF5 group)
+        are not tracked.
         """
         self.h5dtype = np.dtype(h5dtype)
         self.h5 = h5
+        if chunks is None:
+            chunks = self.h5.attrs.get("chunk_layout", "full")
+        #: chunk layout for storing images
+        self.chunks = check_chunks(chunks)
+        if compression is None:
+            compression = {role: self.h5.attrs.get("compression_" + role,
+                                                   "archive")
+                           for role in COMPRESSION_ROLES}
+        #: compression profile for each role in :const:`COMPRESSION_ROLES`
+        self.compression = check_compression(compression)
+        if cache is None:
+            cache = ImageCache()
+        self._cache = cache
+        #: version counter for cache invalidation
+        self._version = 0
         if "bg_data" not in self.h5:
             self.h5.create_group("bg_data")
 
     def __repr__(self):
         name = self.__class__.__name__
         rep = "{name} image, {x}x{y}px".format(name=name,
-                                               x=self.raw.shape[0],
-                                               y=self.raw.shape[1],
+                                               x=self.shape[0],
+                                               y=self.shape[1],
                                                )
         return rep
 
@@ -69,28 +252,142 @@ class ImageData(object):
                 h5dtype = "bool"
             else:
                 h5dtype = self.h5dtype
+            role = "raw" if key == "raw" else "mask"
             write_image_dataset(group=self.h5,
                                 key=key,
                                 data=value,
-                                h5dtype=h5dtype)
+                                h5dtype=h5dtype,
+                                chunks=self.chunks,
+                                compression=self.compression[role])
+            self.h5.attrs["chunk_layout"] = self.chunks
+            for role in COMPRESSION_ROLES:
+                self.h5.attrs["compression_" + role] = self.compression[role]
+        self._invalidate()
 
     @abc.abstractmethod
-    def _bg_combine(self, *bgs):
-        """Combine several background images"""
+    def _bg_combine(self, bgs, region=None):
+        """Combine several background images (optionally a region)"""
 
     @abc.abstractmethod
     def _bg_correct(self, raw, bg):
         """Remove `bg` from `raw` image data"""
 
+    def _read_bg(self, dset, region=None):
+        """Return the background image stored in `dset`
+
+        Parametric backgrounds (see `fit_storage` in
+        :func:`ImageData.estimate_bg`) are computed from their
+        model coefficients. If `region` (a tuple of two slices)
+        is given, only that hyperslab is read or computed.
+        """
+        if "coefficients" in dset.attrs:
+            model = dset.attrs["model"]
+            if isinstance(model, bytes):
+                model = model.decode("utf-8")
+            params = dict(zip(bg_estimate.PROFILE_PARAMETERS[model],
+                              dset.attrs["coefficients"]))
+            return bg_estimate.profile_model(fit_profile=model,
+                                             params=params,
+                                             shape=self.shape,
+                                             region=region)
+        elif region is None:
+            return dset[:]
+        else:
+            return dset[region]
+
+    def _region_shape(self, region):
+        """Shape of the image `region` (a tuple of two slices)"""
+        if region is None:
+            return self.shape
+        return tuple(len(range(*sl.indices(size)))
+                     for sl, size in zip(region, self.shape))
+
+    def _set_fit_bg(self, bg, fit_offset, fit_profile, border_px,
+                    from_mask, params=None, fit_storage="image"):
+        """Store an estimated background with its fit parameters
+
+        This is used by :func:`ImageData.estimate_bg` and
+        :func:`qpimage.series.QPSeries.compute_bg`.
+        """
+        if fit_storage not in VALID_FIT_STORAGES:
+            msg = "`fit_storage` must be one of {}, got '{}'".format(
+                VALID_FIT_STORAGES, fit_storage)
+            raise ValueError(msg)
+        attrs = {"fit_offset": fit_offset,
+                 "fit_profile": fit_profile,
+                 "border_px": border_px}
+        if fit_storage == "params":
+            self.set_bg(bg=None, key="fit")
+            dset = write_params_dataset(group=self.h5["bg_data"],
+                                        key="fit",
+                                        model=fit_profile,
+                                        params=params)
+            for kw in attrs:
+                dset.attrs[kw] = attrs[kw]
+        else:
+            self.set_bg(bg=bg, key="fit", attrs=attrs)
+        # save `from_mask` separately (arrays vs. h5 attributes)
+        # (if `from_mask` is `None`, this will remove the array)
+        self["estimate_bg_from_mask"] = from_mask
+        self._invalidate()
+
+    def _get_bg(self):
+        """Return the cached, read-only combined background image"""
+        key = (self.__class__.__name__, "bg")
+        bg = self._cache.get(key, self._version)
+        if bg is None:
+            bg = self._bg_combine(self.h5["bg_data"].values())
+            self._cache.set(key, self._version, bg)
+        return bg
+
+    def _get_image(self):
+        """Return the cached, read-only background corrected image"""
+        key = (self.__class__.__name__, "image")
+        image = self._cache.get(key, self._version)
+        if image is None:
+            image = self._bg_correct(self.raw, self._get_bg())
+            self._cache.set(key, self._version, image)
+        return image
+
+    def _get_region(self, region):
+        """Return raw and background data of an image region
+
+        Only the hyperslab `region` (a tuple of two slices with
+        positive steps) is read from each dataset, unless the
+        full background and image are cached already.
+
+        Returns
+        -------
+        raw, bg: 2d ndarrays
+            Raw image and combined background of the region
+        """
+        bg = self._cache.get((self.__class__.__name__, "bg"), self._version)
+        if bg is None:
+            bg = self._bg_combine(self.h5["bg_data"].values(), region=region)
+        else:
+            # (the cached image is read-only)
+            bg = bg[region].copy()
+        raw = self.h5["raw"][region]
+        return raw, bg
+
+    def _invalidate(self):
+        """Increment the version counter (invalidates cached images)"""
+        self._version += 1
+
     @property
     def bg(self):
         """combined background image data"""
-        return self._bg_combine(self.h5["bg_data"].values())
+        return self._get_bg().copy()
+
+    @property
+    def dtype(self):
+        """data type of the stored raw image (no data are read)"""
+        return self.h5["raw"].dtype
 
     @property
     def image(self):
         """background corrected image data"""
-        return self._bg_correct(self.raw, self.bg)
+        return self._get_image().copy()
 
     @property
     def info(self):
@@ -126,6 +423,16 @@ class ImageData(object):
         """raw (uncorrected) image data"""
         return self.h5["raw"][:]
 
+    @property
+    def shape(self):
+        """shape of the raw image (no data are read)"""
+        return self.h5["raw"].shape
+
+    @property
+    def size(self):
+        """number of pixels of the raw image (no data are read)"""
+        return self.h5["raw"].size
+
     def del_bg(self, key):
         """Remove the background image data
 
@@ -141,9 +448,11 @@ class ImageData(object):
         else:
             msg = "No bg data to clear for '{}' in {}.".format(key, self)
             warnings.warn(msg)
+        self._invalidate()
 
     def estimate_bg(self, fit_offset="mean", fit_profile="tilt",
-                    border_px=0, from_mask=None, ret_mask=False):
+                    border_px=0, from_mask=None, ret_mask=False,
+                    fit_storage="image"):
         """Estimate image background
 
         Parameters
@@ -171,6 +480,14 @@ class ImageData(object):
             estimation.
         ret_mask: bool
             Return the mask image used to compute the background.
+        fit_storage: str
+            How the estimated background is stored in `self.h5`:
+
+            - "image": full-resolution background image (default)
+            - "params": only the model name and its coefficients
+              as attributes; the background image is computed
+              when it is accessed (files written this way cannot
+              be opened with qpimage versions older than 0.10.0)
 
         Notes
         -----
@@ -188,19 +505,21 @@ class ImageData(object):
         # remove existing bg before accessing imdat.image
         self.set_bg(bg=None, key="fit")
         # compute bg
-        bgimage, mask = bg_estimate.estimate(data=self.image,
-                                             fit_offset=fit_offset,
-                                             fit_profile=fit_profile,
-                                             border_px=border_px,
-                                             from_mask=from_mask,
-                                             ret_mask=True)
-        attrs = {"fit_offset": fit_offset,
-                 "fit_profile": fit_profile,
-                 "border_px": border_px}
-        self.set_bg(bg=bgimage, key="fit", attrs=attrs)
-        # save `from_mask` separately (arrays vs. h5 attributes)
-        # (if `from_mask` is `None`, this will remove the array)
-        self["estimate_bg_from_mask"] = from_mask
+        bgimage, mask, params = bg_estimate.estimate(data=self._get_image(),
+                                                     fit_offset=fit_offset,
+                                                     fit_profile=fit_profile,
+                                                     border_px=border_px,
+                                                     from_mask=from_mask,
+                                                     ret_mask=True,
+                                                     ret_params=True)
+        self._set_fit_bg(bgimage,
+                         fit_offset=fit_offset,
+                         fit_profile=fit_profile,
+                         border_px=border_px,
+                         from_mask=from_mask,
+                         params=params,
+                         fit_storage=fit_storage)
+        self._invalidate()
         # return mask image
         if ret_mask:
             return mask
@@ -227,7 +546,7 @@ class ImageData(object):
             if key not in VALID_BG_KEYS:
                 raise ValueError("Invalid bg key: {}".format(key))
             if key in self.h5["bg_data"]:
-                data = self.h5["bg_data"][key][:]
+                data = self._read_bg(self.h5["bg_data"][key])
                 if ret_attrs:
                     attrs = dict(self.h5["bg_data"][key].attrs)
                     # remove keys for image visualization in hdf5 files
@@ -247,8 +566,9 @@ class ImageData(object):
         Parameters
         ----------
         bg: numbers.Real, 2d ndarray, ImageData, or h5py.Dataset
-            The background data. If `bg` is an `h5py.Dataset` object,
-            it must exist in the same HDF5 file (a hard link is created).
+            The background data. If `bg` is an `h5py.Dataset` object
+            (or a :class:`qpimage.memory.MemoryDataset`), it must
+            exist in the same HDF5 file (a hard link is created).
             If set to `None`, the data will be removed.
         key: str
             One of :const:`VALID_BG_KEYS`)
@@ -271,10 +591,12 @@ class ImageData(object):
             dset = write_image_dataset(group=self.h5["bg_data"],
                                        key=key,
                                        data=bg,
-                                       h5dtype=self.h5dtype)
+                                       h5dtype=self.h5dtype,
+                                       chunks=self.chunks,
+                                       compression=self.compression["bg"])
             for kw in attrs:
                 dset.attrs[kw] = attrs[kw]
-        elif isinstance(bg, h5py.Dataset):
+        elif isinstance(bg, (h5py.Dataset, MemoryDataset)):
             # Create a hard link
             # (This functionality was intended for saving memory when storing
             # large QPSeries with universal background data, i.e. when using
@@ -283,6 +605,7 @@ class ImageData(object):
         elif bg is not None:
             msg = "Unknown background data type: {}".format(bg)
             raise ValueError(msg)
+        self._invalidate()
 
 
 class Amplitude(ImageData):
@@ -292,12 +615,12 @@ class Amplitude(ImageData):
     by dividing the raw image by the background image.
     """
 
-    def _bg_combine(self, bgs):
+    def _bg_combine(self, bgs, region=None):
         """Combine several background amplitude images"""
-        out = np.ones(self.h5["raw"].shape, dtype=float)
+        out = np.ones(self._region_shape(region), dtype=float)
         # bg is an h5py.DataSet
         for bg in bgs:
-            out *= bg[:]
+            out *= self._read_bg(bg, region=region)
         return out
 
     def _bg_correct(self, raw, bg):
@@ -312,12 +635,12 @@ class Phase(ImageData):
     by subtracting the background image from the raw image.
     """
 
-    def _bg_combine(self, bgs):
+    def _bg_combine(self, bgs, region=None):
         """Combine several background phase images"""
-        out = np.zeros(self.h5["raw"].shape, dtype=float)
+        out = np.zeros(self._region_shape(region), dtype=float)
         for bg in bgs:
             # bg is an h5py.DataSet
-            out += bg[:]
+            out += self._read_bg(bg, region=region)
         return out
 
     def _bg_correct(self, raw, bg):
@@ -325,16 +648,154 @@ class Phase(ImageData):
         return raw - bg
 
 
-def write_image_dataset(group, key, data, h5dtype=None):
+def check_chunks(chunks):
+    """Validate and normalize a chunk layout
+
+    Parameters
+    ----------
+    chunks: str, int, or tuple of int
+        One of :const:`VALID_CHUNK_LAYOUTS`, a tile size, or
+        a tile shape
+
+    Returns
+    -------
+    chunks: str or tuple of two int
+        Normalized chunk layout
+    """
+    if isinstance(chunks, bytes):
+        chunks = chunks.decode("utf-8")
+    if isinstance(chunks, str):
+        if chunks not in VALID_CHUNK_LAYOUTS:
+            msg = "`chunks` must be one of {} or a tile shape, ".format(
+                VALID_CHUNK_LAYOUTS) + "got '{}'".format(chunks)
+            raise ValueError(msg)
+        return chunks
+    if isinstance(chunks, numbers.Integral):
+        chunks = (chunks, chunks)
+    chunks = tuple(int(cc) for cc in np.atleast_1d(chunks))
+    if len(chunks) != 2 or min(chunks) < 1:
+        raise ValueError("Invalid tile shape for `chunks`: {}".format(chunks))
+    return chunks
+
+
+def check_compression(compression):
+    """Validate and normalize compression profiles
+
+    Parameters
+    ----------
+    compression: str or dict
+        A key of :const:`COMPRESSION_PROFILES` used for all
+        datasets or a dictionary with keys from
+        :const:`COMPRESSION_ROLES` and profile names as values
+        (missing roles default to "archive")
+
+    Returns
+    -------
+    compression: dict
+        Compression profile for each role
+    """
+    if isinstance(compression, (str, bytes)):
+        compression = {role: compression for role in COMPRESSION_ROLES}
+    for role in compression:
+        if role not in COMPRESSION_ROLES:
+            msg = "Invalid compression role '{}', expected one of {}".format(
+                role, COMPRESSION_ROLES)
+            raise ValueError(msg)
+    profiles = {}
+    for role in COMPRESSION_ROLES:
+        profile = compression.get(role, "archive")
+        if isinstance(profile, bytes):
+            profile = profile.decode("utf-8")
+        if profile not in COMPRESSION_PROFILES:
+            msg = "Compression profile must be one of {}, got '{}'".format(
+                sorted(COMPRESSION_PROFILES), profile)
+            raise ValueError(msg)
+        profiles[role] = profile
+    return profiles
+
+
+def get_chunk_shape(chunks, shape, dtype):
+    """Return the HDF5 chunk shape of an image for a chunk layout
+
+    Parameters
+    ----------
+    chunks: str, int, or tuple of int
+        Chunk layout (see :func:`write_image_dataset`)
+    shape: tuple of int
+        Shape of the image
+    dtype: np.dtype
+        Data type of the image
+
+    Returns
+    -------
+    chunk_shape: tuple of int
+        The chunk shape (tiles are cropped to the image shape)
+    """
+    chunks = check_chunks(chunks)
+    if chunks == "auto":
+        if np.prod(shape) * np.dtype(dtype).itemsize > CHUNK_AUTO_LIMIT:
+            chunks = "tiles"
+        else:
+            chunks = "full"
+    if chunks == "full" or len(shape) != 2:
+        return tuple(shape)
+    elif chunks == "tiles":
+        chunks = (CHUNK_TILE_SIZE, CHUNK_TILE_SIZE)
+    return tuple(max(1, min(cc, ss)) for cc, ss in zip(chunks, shape))
+
+
+def get_dataset_role(name):
+    """Return the compression role of a QPImage dataset
+
+    Parameters
+    ----------
+    name: str
+        Full name of the dataset, e.g. "/phase/bg_data/fit"
+
+    Returns
+    -------
+    role: str
+        One of :const:`COMPRESSION_ROLES`
+    """
+    parts = name.rstrip("/").split("/")
+    if parts[-1] == "raw":
+        return "raw"
+    elif len(parts) > 1 and parts[-2] == "bg_data":
+        return "bg"
+    else:
+        return "mask"
+
+
+def get_compression_kwargs(profile):
+    """Return the HDF5 filter keyword arguments of a compression profile
+
+    Parameters
+    ----------
+    profile: str
+        A key of :const:`COMPRESSION_PROFILES`
+    """
+    if profile not in COMPRESSION_PROFILES:
+        msg = "Compression profile must be one of {}, got '{}'".format(
+            sorted(COMPRESSION_PROFILES), profile)
+        raise ValueError(msg)
+    kwargs = dict(COMPRESSION_PROFILES[profile])
+    if profile == "archive":
+        kwargs.update(COMPRESSION)
+    return kwargs
+
+
+def write_image_dataset(group, key, data, h5dtype=None, chunks="full",
+                        compression="archive"):
     """Write an image to an HDF5 group as a dataset
 
     This convenience function sets all attributes such that the image
     can be visualized with HDFView, sets the compression and fletcher32
-    filters, and sets the chunk size to the image shape.
+    filters according to `compression`, and sets the chunk shape
+    according to `chunks`.
 
     Parameters
     ----------
-    group: h5py.Group
+    group: h5py.Group or qpimage.memory.MemoryGroup
         HDF5 group to store data to
     key: str
         Dataset identifier
@@ -343,22 +804,44 @@ def write_image_dataset(group, key, data, h5dtype=None):
     h5dtype: str or dtype
         The datatype in which to store the image data. The default
         is the datatype of `data`.
+    chunks: str, int, or tuple of int
+        Chunk layout; one of
+
+        - "full": one chunk per image (default); fastest when images
+          are always read completely
+        - "tiles": square tiles of size :const:`CHUNK_TILE_SIZE`;
+          reading a region of interest or the image border only
+          decompresses the tiles involved
+        - "auto": "full" for images up to :const:`CHUNK_AUTO_LIMIT`
+          bytes and "tiles" for larger images
+        - int or tuple of two int: tile shape
+
+        This does not apply to in-memory data.
+    compression: str or dict
+        Compression profile (a key of :const:`COMPRESSION_PROFILES`)
+        or a dictionary of HDF5 filter keyword arguments
+        ("compression", "compression_opts", "fletcher32", "shuffle")
 
     Returns
     -------
-    dataset: h5py.Dataset
+    dataset: h5py.Dataset or qpimage.memory.MemoryDataset
         The created HDF5 dataset object
     """
     if h5dtype is None:
         h5dtype = data.dtype
+    if isinstance(group, MemoryGroup):
+        # plain NumPy array without compression or HDFView attributes
+        return group.replace_dataset(key, data=data, dtype=h5dtype)
     if key in group:
         del group[key]
     if group.file.driver == "core":
         kwargs = {}
     else:
-        kwargs = {"fletcher32": True,
-                  "chunks": data.shape}
-        kwargs.update(COMPRESSION)
+        kwargs = {"chunks": get_chunk_shape(chunks, data.shape, h5dtype)}
+        if isinstance(compression, dict):
+            kwargs.update(compression)
+        else:
+            kwargs.update(get_compression_kwargs(compression))
 
     dset = group.create_dataset(key,
                                 data=data.astype(h5dtype),
@@ -369,3 +852,36 @@ def write_image_dataset(group, key, data, h5dtype=None):
         dset.attrs.create('IMAGE_VERSION', np.bytes_('1.2'))
         dset.attrs.create('IMAGE_SUBCLASS', np.bytes_('IMAGE_GRAYSCALE'))
     return dset
+
+
+def write_params_dataset(group, key, model, params):
+    """Write a parametric background to an HDF5 group
+
+    The background is stored as an empty dataset with the attributes
+    "model" (one of :const:`qpimage.bg_estimate.VALID_FIT_PROFILES`)
+    and "coefficients" (ordered according to
+    :const:`qpimage.bg_estimate.PROFILE_PARAMETERS`).
+
+    Parameters
+    ----------
+    group: h5py.Group or qpimage.memory.MemoryGroup
+        HDF5 group to store data to
+    key: str
+        Dataset identifier
+    model: str
+        Name of the background model
+    params: dict
+        Model parameters
+
+    Returns
+    -------
+    dataset: h5py.Dataset or qpimage.memory.MemoryDataset
+        The created HDF5 dataset object
+    """
+    if key in group:
+        del group[key]
+    coeffs = [params[name] for name in bg_estimate.PROFILE_PARAMETERS[model]]
+    dset = group.create_dataset(key, data=h5py.Empty("float64"))
+    dset.attrs["model"] = model
+    dset.attrs["coefficients"] = np.array(coeffs, dtype=float)
+    return dset
@@ -0,0 +1,326 @@
+"""Streaming ingestion of raw data into a QPSeries
+
+The function :func:`ingest` converts a (possibly very long) stream
+of raw frames, e.g. off-axis holograms, into QPImages in a pool of
+worker processes and writes them to a :class:`qpimage.QPSeries`
+in the order of the input. The number of frames in flight is
+bounded, so the memory usage does not depend on the length of
+the stream.
+"""
+import collections
+import concurrent.futures
+import multiprocessing as mp
+import pathlib
+import time
+
+import numpy as np
+
+from .core import QPImage, correct_2pi_offset
+from .oah import OAHContext
+from .series import QPSeries
+from .unwrap import TEMPORAL_THRESHOLD, UNWRAP_ATTR, unwrap_temporal
+
+#: default maximum number of queued frames per worker process
+QUEUE_SIZE_PER_WORKER = 4
+
+#: per-process settings of the :func:`ingest` workers
+_ingest_state = {}
+
+
+def ingest(frames, series, which_data="raw-oah", bg_data=None,
+           meta_data=None, qpretrieve_kw=None, proc_phase=True,
+           compute_bg_kw=None, workers=None, queue_size=None,
+           oah_context=None, unwrap="skimage", temporal_unwrap=False,
+           temporal_threshold=TEMPORAL_THRESHOLD):
+    """Convert a stream of raw frames to QPImages of a series
+
+    Parameters
+    ----------
+    frames: iterable
+        Raw frames (see `which_data`) or tuples of a raw frame and a
+        dictionary with metadata of that frame (e.g. "identifier"
+        or "time"). The frames are only consumed as fast as they
+        are processed.
+    series: qpimage.QPSeries, str, or pathlib.Path
+        Target series; if a path is given, the file is opened
+        (or created) and closed afterwards.
+    which_data: str or tuple
+        Type of the raw frames (see :class:`qpimage.QPImage`)
+    bg_data: 2d ndarray, list, QPImage, or None
+        Background data used for all frames
+        (see :class:`qpimage.QPImage`). Except for "raw-qlsi" data,
+        the background data are processed only once and stored only
+        once in `series`; all other QPImages get hard links to them
+        (see `bg_data` in :func:`qpimage.QPSeries.add_qpimage`).
+    meta_data: dict or None
+        Metadata of all frames (see :const:`qpimage.meta.META_KEYS`);
+        the metadata of the individual frames take precedence
+    qpretrieve_kw: dict or None
+        Keyword arguments for phase retrieval
+        (see :class:`qpimage.QPImage`)
+    proc_phase: bool
+        Whether to unwrap the phase (see :class:`qpimage.QPImage`)
+    compute_bg_kw: dict or None
+        If given, :func:`qpimage.QPImage.compute_bg` is called with
+        these keyword arguments for each QPImage
+    workers: int or None
+        Number of worker processes; defaults to the number of CPUs.
+        With `workers=1`, all frames are processed in the current
+        process.
+    queue_size: int or None
+        Maximum number of frames submitted to the workers and not
+        yet written to `series`; defaults to
+        `workers *` :const:`QUEUE_SIZE_PER_WORKER`
+    oah_context: qpimage.oah.OAHContext or None
+        Retrieval context for off-axis holograms (see
+        :class:`qpimage.QPImage`). For `which_data="raw-oah"`, a
+        context is created from `qpretrieve_kw` by default and the
+        sideband is located in the first frame (in the current
+        process), so that all frames are processed with the same
+        sideband and filter.
+    unwrap: str
+        Phase unwrapping engine (see :class:`qpimage.QPImage`)
+    temporal_unwrap: bool
+        Time-lapse mode: unwrap the phase of each frame against the
+        unwrapped phase of the previous frame (see
+        :func:`qpimage.unwrap.unwrap_temporal`); `unwrap` is only
+        used for the first frame and where the phase changed by more
+        than `temporal_threshold`. Since the frames depend on each
+        other, this (and `compute_bg_kw`) is done in the current
+        process after phase retrieval in the workers.
+    temporal_threshold: float
+        Maximum phase change between two frames [rad] for
+        `temporal_unwrap`
+
+    Returns
+    -------
+    stats: dict
+        Throughput and latency statistics:
+
+        - "frames": number of frames written
+        - "duration": total time [s]
+        - "throughput": frames per second
+        - "latency mean", "latency median", "latency max": time
+          from submitting a frame to the workers until it is
+          written to `series` [s]
+        - "process mean": processing time per frame in a worker [s]
+        - "write time": total time spent writing to `series`
+          (including `temporal_unwrap`) [s]
+        - "wait time": total time spent waiting for the workers [s]
+        - "unwrap skipped": number of frames that were not unwrapped,
+          because they did not contain phase jumps (see
+          :func:`qpimage.unwrap.unwrap_if_wrapped`)
+        - "temporal fallback": fraction of pixels that were
+          unwrapped spatially with `temporal_unwrap` (including
+          the first frame)
+        - "workers", "queue size": the settings used
+
+    Notes
+    -----
+    With `workers > 1`, the frames are sent to the workers and the
+    QPImages are sent back in memory; only the current process
+    writes to `series`.
+    """
+    if workers is None:
+        workers = mp.cpu_count()
+    if queue_size is None:
+        queue_size = workers * QUEUE_SIZE_PER_WORKER
+    if queue_size < 1:
+        raise ValueError("`queue_size` must be at least 1, got {}!".format(
+            queue_size))
+    if temporal_unwrap and not proc_phase:
+        raise ValueError("`temporal_unwrap` requires `proc_phase`!")
+    if isinstance(series, (str, pathlib.Path)):
+        with QPSeries(h5file=series, h5mode="a") as qps:
+            return ingest(frames=frames, series=qps, which_data=which_data,
+                          bg_data=bg_data, meta_data=meta_data,
+                          qpretrieve_kw=qpretrieve_kw, proc_phase=proc_phase,
+                          compute_bg_kw=compute_bg_kw, workers=workers,
+                          queue_size=queue_size, oah_context=oah_context,
+                          unwrap=unwrap, temporal_unwrap=temporal_unwrap,
+                          temporal_threshold=temporal_threshold)
+    if oah_context is None and which_data in ["hologram", "raw-oah"]:
+        oah_context = OAHContext(qpretrieve_kw=qpretrieve_kw)
+    if (bg_data is not None
+            and QPImage._conv_which_data(which_data) != "raw-qlsi"):
+        # process the background data only once
+        if isinstance(bg_data, QPImage):
+            shared_bg = bg_data
+        else:
+            shared_bg = QPImage(data=bg_data,
+                                which_data=which_data,
+                                qpretrieve_kw=qpretrieve_kw,
+                                proc_phase=proc_phase,
+                                oah_context=oah_context,
+                                unwrap=unwrap)
+        bg_data = (shared_bg.pha, shared_bg.amp)
+    else:
+        shared_bg = None
+    settings = {"which_data": which_data,
+                "bg_data": bg_data,
+                "shared_bg": shared_bg is not None,
+                "meta_data": meta_data or {},
+                "qpretrieve_kw": qpretrieve_kw,
+                # (temporal unwrapping is done in `write`)
+                "proc_phase": proc_phase and not temporal_unwrap,
+                "compute_bg_kw": None if temporal_unwrap else compute_bg_kw,
+                "oah_context": oah_context,
+                "unwrap": unwrap,
+                }
+
+    stats = {"frames": 0,
+             "unwrap skipped": 0,
+             "write time": 0,
+             "wait time": 0,
+             "workers": workers,
+             "queue size": queue_size,
+             }
+    latencies = []
+    process_times = []
+    # unwrapped phase of the previous frame and fallback pixel counts
+    temporal = {"reference": None, "fallback": 0, "pixels": 0}
+
+    def write(item):
+        """Wait for a queued frame and write it to `series`"""
+        tsubmit, future = item
+        t0 = time.perf_counter()
+        group, tprocess = future.result()
+        t1 = time.perf_counter()
+        qpi = QPImage(h5file=group)
+        if temporal_unwrap:
+            unwrapped, num = unwrap_temporal(
+                qpi._pha.raw,
+                reference=temporal["reference"],
+                threshold=temporal_threshold,
+                engine=unwrap,
+                ret_fallback=True)
+            temporal["reference"] = unwrapped
+            temporal["fallback"] += num
+            temporal["pixels"] += unwrapped.size
+            qpi._pha["raw"] = correct_2pi_offset(unwrapped.copy())
+            qpi._pha.h5.attrs[UNWRAP_ATTR] = True
+        elif proc_phase and not qpi._pha.h5.attrs[UNWRAP_ATTR]:
+            stats["unwrap skipped"] += 1
+        series.add_qpimage(qpi, bg_data=shared_bg)
+        if temporal_unwrap and compute_bg_kw:
+            series.get_qpimage(len(series) - 1).compute_bg(**compute_bg_kw)
+        t2 = time.perf_counter()
+        stats["wait time"] += t1 - t0
+        stats["write time"] += t2 - t1
+        latencies.append(t2 - tsubmit)
+        process_times.append(tprocess)
+        stats["frames"] += 1
+
+    tstart = time.perf_counter()
+    pool = None
+    queue = collections.deque()
+    try:
+        for frame in frames:
+            if (isinstance(frame, tuple) and len(frame) == 2
+                    and isinstance(frame[1], dict)):
+                data, meta = frame
+            else:
+                data, meta = frame, {}
+            if pool is None:
+                if (oah_context is not None
+                        and oah_context.geometry(np.shape(data)) is None):
+                    # locate the sideband once for all workers
+                    oah_context.retrieve(data)
+                pool = _get_executor(workers, settings)
+            if len(queue) >= queue_size:
+                write(queue.popleft())
+            queue.append((time.perf_counter(),
+                          pool.submit(_ingest_frame, data, meta)))
+        while queue:
+            write(queue.popleft())
+    finally:
+        for _, future in queue:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown()
+        _ingest_state.clear()
+    stats["duration"] = time.perf_counter() - tstart
+    stats["throughput"] = stats["frames"] / stats["duration"]
+    if latencies:
+        stats["latency mean"] = np.mean(latencies)
+        stats["latency median"] = np.median(latencies)
+        stats["latency max"] = np.max(latencies)
+        stats["process mean"] = np.mean(process_times)
+    else:
+        stats["latency mean"] = stats["latency median"] = np.nan
+        stats["latency max"] = stats["process mean"] = np.nan
+    if temporal["pixels"]:
+        stats["temporal fallback"] = temporal["fallback"] / temporal["pixels"]
+    else:
+        stats["temporal fallback"] = np.nan
+    return stats
+
+
+def _get_executor(workers, settings):
+    """Return an executor with initialized :func:`ingest` workers"""
+    if workers > 1:
+        # (forked processes would inherit the open HDF5 files)
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_ingest_init,
+            initargs=(settings,))
+    else:
+        pool = _SerialExecutor()
+        _ingest_init(settings)
+    return pool
+
+
+class _SerialExecutor(object):
+    """Executor that runs the tasks in the current process"""
+
+    def shutdown(self):
+        pass
+
+    def submit(self, func, *args):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def _ingest_init(settings):
+    """Initialize an :func:`ingest` worker"""
+    _ingest_state.update(settings)
+    if settings["shared_bg"]:
+        # processed background phase and amplitude
+        _ingest_state["bg_data"] = QPImage(data=settings["bg_data"],
+                                           which_data="phase,amplitude",
+                                           proc_phase=False)
+
+
+def _ingest_frame(data, meta):
+    """Convert a raw frame to a QPImage in an :func:`ingest` worker
+
+    Returns
+    -------
+    group: qpimage.memory.MemoryGroup
+        Data of the QPImage
+    tprocess: float
+        Processing time [s]
+    """
+    t0 = time.perf_counter()
+    meta_data = dict(_ingest_state["meta_data"])
+    meta_data.update(meta)
+    qpi = QPImage(data=data,
+                  bg_data=_ingest_state["bg_data"],
+                  which_data=_ingest_state["which_data"],
+                  meta_data=meta_data,
+                  qpretrieve_kw=_ingest_state["qpretrieve_kw"],
+                  proc_phase=_ingest_state["proc_phase"],
+                  oah_context=_ingest_state["oah_context"],
+                  unwrap=_ingest_state["unwrap"])
+    if _ingest_state["compute_bg_kw"]:
+        qpi.compute_bg(**_ingest_state["compute_bg_kw"])
+    if _ingest_state["shared_bg"]:
+        # the shared background data are not sent back
+        del qpi.h5["amplitude/bg_data/data"]
+        del qpi.h5["phase/bg_data/data"]
+    return qpi.h5, time.perf_counter() - t0
@@ -0,0 +1,220 @@
+"""In-memory storage backend without HDF5
+
+The classes in this module mimic the parts of the :mod:`h5py` group
+and dataset interface that are used by :class:`qpimage.QPImage`.
+Transient QPImages (e.g. when `h5file` is `None`) keep their data in
+plain NumPy arrays this way. To store such a QPImage in an HDF5 file,
+use :func:`qpimage.core.QPImage.copy` with the `h5file` argument.
+"""
+import h5py
+import numpy as np
+
+
+class MemoryAttributes(dict):
+    """Attributes of in-memory objects
+
+    Like :class:`h5py.AttributeManager`, keys are iterated in
+    alphabetical order and numbers are stored as NumPy scalars.
+    """
+
+    def __iter__(self):
+        return iter(sorted(super(MemoryAttributes, self).keys()))
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, (str, bytes)):
+            value = np.array(value)
+            if value.ndim == 0:
+                value = value[()]
+        super(MemoryAttributes, self).__setitem__(key, value)
+
+    def create(self, name, data):
+        self[name] = data
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def keys(self):
+        return list(self)
+
+    def update(self, other=(), **kwargs):
+        for key, value in dict(other, **kwargs).items():
+            self[key] = value
+
+    def values(self):
+        return [self[key] for key in self]
+
+
+class MemoryDataset(object):
+    def __init__(self, data, dtype=None, name=""):
+        """In-memory counterpart of :class:`h5py.Dataset`
+
+        Parameters
+        ----------
+        data: np.ndarray, numbers.Real, or h5py.Empty
+            Data of the dataset; the data are copied
+        dtype: str or np.dtype
+            Data type used for storing the data; defaults to
+            the data type of `data`
+        name: str
+            Full path of the dataset
+        """
+        #: dataset attributes
+        self.attrs = MemoryAttributes()
+        self.name = name
+        if isinstance(data, h5py.Empty):
+            self._data = None
+            self._dtype = np.dtype(dtype or data.dtype)
+        else:
+            self._data = np.array(data, dtype=dtype)
+            self._dtype = self._data.dtype
+
+    def __getitem__(self, given):
+        if self._data is None:
+            return h5py.Empty(self._dtype)
+        return np.array(self._data[given])
+
+    def __repr__(self):
+        return "<MemoryDataset \"{}\": shape {}, type \"{}\">".format(
+            self.name, self.shape, self.dtype.str)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def ndim(self):
+        return None if self._data is None else self._data.ndim
+
+    @property
+    def shape(self):
+        return None if self._data is None else self._data.shape
+
+    @property
+    def size(self):
+        return None if self._data is None else self._data.size
+
+
+class MemoryGroup(object):
+    def __init__(self, name="/"):
+        """In-memory counterpart of :class:`h5py.Group`
+
+        Members can be accessed with paths (e.g. "phase/raw").
+        Assigning an existing :class:`MemoryDataset` to a key
+        creates a hard link, i.e. both keys refer to the same
+        object.
+        """
+        #: group attributes
+        self.attrs = MemoryAttributes()
+        self.name = name
+        self._members = {}
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        else:
+            return True
+
+    def __delitem__(self, name):
+        group, key = self._resolve_parent(name)
+        if key not in group._members:
+            raise KeyError("Unable to delete '{}' (not found)".format(name))
+        del group._members[key]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __getitem__(self, name):
+        group, key = self._resolve_parent(name)
+        if key not in group._members:
+            raise KeyError("Unable to open '{}' (not found)".format(name))
+        return group._members[key]
+
+    def __iter__(self):
+        return iter(sorted(self._members))
+
+    def __len__(self):
+        return len(self._members)
+
+    def __repr__(self):
+        return "<MemoryGroup \"{}\" ({} members)>".format(
+            self.name, len(self))
+
+    def __setitem__(self, name, obj):
+        group, key = self._resolve_parent(name)
+        if key in group._members:
+            raise ValueError("Unable to create '{}' (exists)".format(name))
+        if not isinstance(obj, (MemoryDataset, MemoryGroup)):
+            obj = MemoryDataset(obj, name=group._child_name(key))
+        group._members[key] = obj
+
+    def _child_name(self, key):
+        return "{}/{}".format(self.name.rstrip("/"), key)
+
+    def _resolve_parent(self, name):
+        """Return the parent group and the key of a member path"""
+        parts = [p for p in name.split("/") if p]
+        if not parts:
+            raise KeyError("Invalid name '{}'".format(name))
+        group = self
+        for part in parts[:-1]:
+            group = group._members.get(part)
+            if not isinstance(group, MemoryGroup):
+                raise KeyError("Unable to open '{}' (not found)".format(name))
+        return group, parts[-1]
+
+    def close(self):
+        """Does nothing (for compatibility with h5py.File)"""
+
+    def create_dataset(self, name, data, dtype=None):
+        """Create a new :class:`MemoryDataset` (copies `data`)"""
+        group, key = self._resolve_parent(name)
+        if key in group._members:
+            raise ValueError("Unable to create '{}' (exists)".format(name))
+        dset = MemoryDataset(data, dtype=dtype, name=group._child_name(key))
+        group._members[key] = dset
+        return dset
+
+    def create_group(self, name):
+        """Create a new :class:`MemoryGroup`"""
+        group, key = self._resolve_parent(name)
+        if key in group._members:
+            raise ValueError("Unable to create '{}' (exists)".format(name))
+        newgroup = MemoryGroup(name=group._child_name(key))
+        group._members[key] = newgroup
+        return newgroup
+
+    def flush(self):
+        """Does nothing (for compatibility with h5py.File)"""
+
+    def replace_dataset(self, name, data, dtype=None):
+        """Create the dataset `name`, replacing an existing one
+
+        Group views that cannot delete members (see
+        :mod:`qpimage.stacked`) overwrite the data in place instead.
+        """
+        if name in self:
+            del self[name]
+        return self.create_dataset(name, data=data, dtype=dtype)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def keys(self):
+        return list(self)
+
+    def require_group(self, name):
+        """Return the group `name` (created if it does not exist)"""
+        if name in self:
+            group = self[name]
+            if not isinstance(group, MemoryGroup):
+                raise TypeError("'{}' is not a group".format(name))
+            return group
+        return self.create_group(name)
+
+    def values(self):
+        return [self[key] for key in self]
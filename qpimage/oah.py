@@ -0,0 +1,114 @@
+"""Reusable off-axis hologram retrieval
+
+Holograms recorded with the same setup share the position of the
+sideband in Fourier space and thus the Fourier filter. An
+:class:`OAHContext` determines these once for each hologram shape
+and reuses them for all following holograms, e.g. via the
+`oah_context` argument of :class:`qpimage.QPImage` or of
+:func:`qpimage.ingest.ingest`.
+"""
+import numpy as np
+import qpretrieve
+
+#: keyword arguments of :class:`qpretrieve.OffAxisHologram`
+#: that are not pipeline keyword arguments
+OAH_INIT_KEYS = ["copy",
+                 "padding",
+                 "subtract_mean",
+                 ]
+
+
+class OAHContext(object):
+    def __init__(self, qpretrieve_kw=None):
+        """Off-axis hologram retrieval with cached sideband and filter
+
+        Parameters
+        ----------
+        qpretrieve_kw: dict
+            Keyword arguments for :class:`qpretrieve.OffAxisHologram`
+            (see the `qpretrieve_kw` argument of
+            :class:`qpimage.QPImage`). If "sideband_freq" is not
+            given, the sideband is located in the first hologram
+            of each shape.
+
+        Notes
+        -----
+        The sideband frequency and the filter size are computed only
+        once per hologram shape. Retrieval then goes through the
+        public pipeline of :class:`qpretrieve.OffAxisHologram` with
+        these values, so the Fourier filter is taken from the cache
+        of :func:`qpretrieve.filter.get_filter_array` (the filter of
+        each shape is computed once per process).
+        """
+        kw = dict(qpretrieve_kw or {})
+        #: keyword arguments for the Fourier transform
+        self.init_kw = {key: kw.pop(key) for key in OAH_INIT_KEYS
+                        if key in kw}
+        pipeline_kw = dict(qpretrieve.OffAxisHologram.default_pipeline_kws)
+        for key in kw:
+            if key not in pipeline_kw:
+                raise ValueError("Unknown keyword argument for off-axis "
+                                 + "hologram retrieval: '{}'".format(key))
+        pipeline_kw.update(kw)
+        #: keyword arguments for the retrieval pipeline
+        self.pipeline_kw = pipeline_kw
+        self._geometries = {}
+
+    @classmethod
+    def from_hologram(cls, data, qpretrieve_kw=None):
+        """Create a context and locate the sideband in `data`"""
+        ctx = cls(qpretrieve_kw=qpretrieve_kw)
+        ctx.retrieve(data)
+        return ctx
+
+    def geometry(self, shape):
+        """Return sideband frequency and filter size for a shape
+
+        Returns
+        -------
+        geometry: dict or None
+            Dictionary with the keys "sideband_freq" and "filter_size"
+            (in frequency units) or `None` if no hologram of that
+            shape has been processed yet
+        """
+        geom = self._geometries.get(tuple(shape))
+        if geom is not None:
+            geom = dict(geom)
+        return geom
+
+    def retrieve(self, data):
+        """Retrieve the complex field from an off-axis hologram
+
+        Parameters
+        ----------
+        data: 2d ndarray
+            Off-axis hologram
+
+        Returns
+        -------
+        field: 2d complex ndarray
+            Retrieved complex field
+        """
+        holo = qpretrieve.OffAxisHologram(data=data, **self.init_kw)
+        shape = tuple(np.shape(data)[:2])
+        field = None
+        if shape not in self._geometries:
+            # locate the sideband (unless given) and compute filter size
+            field = holo.run_pipeline(**self.pipeline_kw)
+            freq = tuple(holo.pipeline_kws["sideband_freq"])
+            fsize = holo.compute_filter_size(
+                filter_size=self.pipeline_kw["filter_size"],
+                filter_size_interpretation=(
+                    self.pipeline_kw["filter_size_interpretation"]),
+                sideband_freq=freq)
+            self._geometries[shape] = {"sideband_freq": freq,
+                                       "filter_size": fsize}
+        if field is None:
+            geom = self._geometries[shape]
+            field = holo.run_pipeline(
+                filter_name=self.pipeline_kw["filter_name"],
+                filter_size=geom["filter_size"],
+                filter_size_interpretation="frequency",
+                sideband_freq=geom["sideband_freq"],
+                invert_phase=self.pipeline_kw["invert_phase"])
+        return field
@@ -1,14 +1,52 @@
+import collections
+import multiprocessing as mp
+import numbers
+import os
+import pathlib
+import threading
+import traceback
+
 import h5py
+import numpy as np
 
+from . import bg_estimate
 from .core import QPImage
+from .image_data import COMPRESSION_ROLES, check_chunks, check_compression
+from .memory import MemoryGroup
 from .meta import MetaDict
+from .stacked import StackedStore, _decode, is_stacked
+
+#: name of the dataset holding the identifier of each QPImage of a
+#: series with the "group" layout (index of the QPImage = row)
+IDENTIFIER_INDEX = "identifier_index"
+
+#: name of the root attribute holding the number of QPImages of a
+#: series with the "group" layout
+LENGTH_ATTR = "qpi_count"
+
+#: name of the root attribute of the output series of
+#: :func:`QPSeries.map` that holds the number of processed members
+MAP_PROGRESS_ATTR = "map_progress"
+
+#: maximum number of QPImages queued per worker process of
+#: :func:`QPSeries.map`
+MAP_QUEUE_SIZE_PER_WORKER = 4
+
+#: default memory cap of :func:`QPSeries.iter_prefetch` in bytes
+PREFETCH_LIMIT = 2**28
+
+#: valid series layouts (see :class:`QPSeries`)
+VALID_SERIES_LAYOUTS = ["group",
+                        "stacked",
+                        ]
 
 
 class QPSeries(object):
     _instances = 0
 
     def __init__(self, qpimage_list=[], meta_data={},
-                 h5file=None, h5mode="a", identifier=None):
+                 h5file=None, h5mode="a", identifier=None, h5chunks=None,
+                 h5compression=None, layout=None):
         """Quantitative phase image series
 
         Parameters
@@ -40,6 +78,43 @@ class QPSeries(object):
             - "w": Create file, truncate if exists
             - "w-" or "x": Create file, fail if exists
             - "a": Read/write if exists, create otherwise (default)
+        identifier: str or None
+            Identifier of the series
+        h5chunks: str, int, tuple of int, or None
+            Chunk layout of the images added to the series (see
+            :func:`qpimage.core.QPImage.__init__`). The layout is
+            recorded in the "chunk_layout" attribute of `h5file`.
+            If set to `None` (default), the recorded layout is used
+            or, if none is recorded, the layout of each added QPImage
+            is kept.
+
+            .. versionadded:: 0.10.0
+        h5compression: str, dict, or None
+            Compression profiles of the images added to the series
+            (see :func:`qpimage.core.QPImage.__init__`). The profiles
+            are recorded in the "compression_raw", "compression_bg",
+            and "compression_mask" attributes of `h5file`. If set to
+            `None` (default), the recorded profiles are used or, if
+            none are recorded, the profiles of each added QPImage
+            are kept.
+
+            .. versionadded:: 0.10.0
+        layout: str or None
+            Storage layout of the series (only applies to new or
+            empty files):
+
+            - "group": one HDF5 group "qpi_<n>" per QPImage
+            - "stacked": the images of all QPImages are stored in
+              resizable 3D datasets and their metadata in compound
+              tables (file format version 2, see
+              :mod:`qpimage.stacked`); all QPImages must have the
+              same shape. This layout is much faster for long series
+              and allows efficient access to stacks of images.
+
+            If set to `None` (default), the layout of `h5file` is
+            used or "group" for new files.
+
+            .. versionadded:: 0.10.0
         """
         if qpimage_list and not isinstance(qpimage_list, list):
             msg = "`qpimage_list` must be a list!"
@@ -68,10 +143,70 @@ class QPSeries(object):
             raise ValueError(msg)
 
         # make sure self.h5 is not itself a QPImage file
-        if "phase" in self.h5 and "amplitude" in self.h5:
+        if (not is_stacked(self.h5)
+                and "phase" in self.h5 and "amplitude" in self.h5):
             raise ValueError(
                 "`h5file` is a QPImage file, not a QPSeries file!")
 
+        # determine the series layout
+        if is_stacked(self.h5):
+            file_layout = "stacked"
+        elif [kk for kk in self.h5.keys() if kk.startswith("qpi_")]:
+            file_layout = "group"
+        else:
+            # empty file
+            file_layout = None
+        if layout is None:
+            layout = file_layout or "group"
+        elif layout not in VALID_SERIES_LAYOUTS:
+            raise ValueError("`layout` must be one of {}, got '{}'".format(
+                VALID_SERIES_LAYOUTS, layout))
+        elif file_layout is not None and layout != file_layout:
+            raise ValueError("Cannot use the '{}' layout, ".format(layout)
+                             + "`h5file` has the '{}' ".format(file_layout)
+                             + "layout!")
+        #: storage layout of the series (see :const:`VALID_SERIES_LAYOUTS`)
+        self.layout = layout
+
+        if self.layout == "stacked":
+            self._store = StackedStore(self.h5,
+                                       chunks=h5chunks,
+                                       compression=h5compression)
+            #: chunk layout of the images (None: layout of added QPImage)
+            self.h5chunks = self._store.chunks
+            #: compression profiles of the images (None: profiles
+            #: of added QPImage)
+            self.h5compression = self._store.compression
+        else:
+            self._store = None
+            if h5chunks is not None:
+                self.h5.attrs["chunk_layout"] = check_chunks(h5chunks)
+            if "chunk_layout" in self.h5.attrs:
+                self.h5chunks = check_chunks(self.h5.attrs["chunk_layout"])
+            else:
+                self.h5chunks = None
+            if h5compression is not None:
+                for role, profile in check_compression(
+                        h5compression).items():
+                    self.h5.attrs["compression_" + role] = profile
+            if "compression_raw" in self.h5.attrs:
+                self.h5compression = check_compression(
+                    {role: self.h5.attrs["compression_" + role]
+                     for role in COMPRESSION_ROLES})
+            else:
+                self.h5compression = None
+
+        # number of QPImages in the series
+        self._len = self._load_length()
+
+        # identifier -> index map for lookups and membership tests
+        # (loaded on first use, see :func:`QPSeries._get_id_index`)
+        self._id_index = None
+
+        # processed background QPImages stored in the series and the
+        # index of the QPImage holding them (see `add_qpimage`)
+        self._shared_bg = []
+
         # Write QPimage data to h5 file
         for qpi in qpimage_list:
             self.add_qpimage(qpi)
@@ -83,6 +218,16 @@ class QPSeries(object):
                 qpii = self.get_qpimage(index=ii)
                 for mk in meta:
                     qpii.h5.attrs[mk] = meta[mk]
+            if "identifier" in meta:
+                # keep the identifier index in sync
+                if self._store is None:
+                    dset = self._get_identifier_dataset(len(self))
+                    dset[:] = [meta["identifier"]] * len(self)
+                self._id_index = None
+
+        # processed background QPImages stored in the series and the
+        # index of the QPImage holding them (see `add_qpimage`)
+        self._shared_bg = []
 
         # Set identifier
         if identifier:
@@ -90,14 +235,7 @@ class QPSeries(object):
 
     def __contains__(self, qpid):
         """test whether a QPImage with the given identifier exists"""
-        for ii in range(len(self)):
-            qpi = self[ii]
-            if "identifier" in qpi and qpi["identifier"] == qpid:
-                exists = True
-                break
-        else:
-            exists = False
-        return exists
+        return self._find_identifier(qpid) is not None
 
     def __enter__(self):
         return self
@@ -115,9 +253,138 @@ class QPSeries(object):
             yield self[ii]
 
     def __len__(self):
-        keys = list(self.h5.keys())
-        keys = [kk for kk in keys if kk.startswith("qpi_")]
-        return len(keys)
+        return self._len
+
+    def _find_identifier(self, qpid, scan=True):
+        """Return the index of the QPImage with the identifier `qpid`
+
+        The index found in the identifier index is verified against
+        the metadata of that QPImage. The identifier index is rebuilt
+        from the metadata of all QPImages if this check fails or, for
+        `scan=True`, if `qpid` is not found (the identifier of a
+        QPImage may have been changed after it was added to the
+        series). Returns `None` if `qpid` is not found.
+        """
+        index = self._get_id_index().get(qpid)
+        if ((index is None and scan)
+                or (index is not None
+                    and self._read_identifier(index) != qpid)):
+            self._id_index = {}
+            self._load_identifier_index(rebuild=True)
+            index = self._id_index.get(qpid)
+        return index
+
+    def _get_id_index(self):
+        """Return the identifier -> index map, loading it on first use
+
+        The map is not loaded when the series is opened, such that
+        iterating over a series does not read any datasets.
+        """
+        if self._id_index is None:
+            self._id_index = {}
+            self._load_identifier_index()
+        return self._id_index
+
+    def _index_identifier(self, identifier, index):
+        """Add an identifier to the in-memory identifier map"""
+        if identifier and self._id_index is not None:
+            # keep the first occurrence (as for a linear search)
+            self._id_index.setdefault(identifier, index)
+
+    def _load_length(self):
+        """Return the number of QPImages in the series
+
+        For the "group" layout, the :const:`LENGTH_ATTR` attribute
+        `n` is used if the groups "qpi_<n-1>" and "qpi_<n>" exist
+        and do not exist, respectively (no listing of the group keys).
+        Otherwise (e.g. for files created with qpimage < 0.10.0), the
+        QPImage groups are counted and the attribute is (re)written,
+        unless the file is opened read-only. For the "stacked" layout,
+        the length of the metadata table is used.
+        """
+        if self._store is not None:
+            return len(self._store)
+        num = self.h5.attrs.get(LENGTH_ATTR, None)
+        if (num is not None
+                and (num == 0 or "qpi_{}".format(num - 1) in self.h5)
+                and "qpi_{}".format(num) not in self.h5):
+            return int(num)
+        num = len([kk for kk in self.h5.keys() if kk.startswith("qpi_")])
+        if self.h5.file.mode != "r":
+            self.h5.attrs[LENGTH_ATTR] = num
+        return num
+
+    def _load_identifier_index(self, rebuild=False):
+        """Load (or rebuild) the identifier -> index map
+
+        For the "group" layout, the identifiers are read from the
+        :const:`IDENTIFIER_INDEX` dataset. If that dataset is missing
+        (files created with qpimage < 0.10.0), does not match the
+        QPImage groups, or if `rebuild` is True, the identifiers are
+        collected from the group attributes (without reading image
+        data) and the dataset is rewritten if necessary, unless the
+        file is opened read-only. For the
+        "stacked" layout, the identifiers are stored in the metadata
+        table.
+        """
+        if self._store is not None:
+            ids = self._store.identifiers()
+        else:
+            num = len(self)
+            if (not rebuild
+                    and IDENTIFIER_INDEX in self.h5
+                    and self.h5[IDENTIFIER_INDEX].shape == (num,)):
+                ids = [_decode(ii) for ii in self.h5[IDENTIFIER_INDEX][:]]
+            else:
+                ids = []
+                for ii in range(num):
+                    attrs = self.h5["qpi_{}".format(ii)].attrs
+                    ids.append(_decode(attrs.get("identifier", "")))
+                if self.h5.file.mode != "r":
+                    if (IDENTIFIER_INDEX in self.h5
+                            and self.h5[IDENTIFIER_INDEX].shape == (num,)):
+                        dset = self.h5[IDENTIFIER_INDEX]
+                        if [_decode(ii) for ii in dset[:]] != ids:
+                            dset[:] = ids
+                    else:
+                        if IDENTIFIER_INDEX in self.h5:
+                            del self.h5[IDENTIFIER_INDEX]
+                        self._get_identifier_dataset(num)[:] = ids
+        for ii, qpid in enumerate(ids):
+            self._index_identifier(qpid, ii)
+
+    def _read_identifier(self, index):
+        """Return the identifier of a QPImage from its metadata"""
+        if self._store is not None:
+            qpid = self._store.h5["meta"][index]["identifier"]
+        else:
+            attrs = self.h5["qpi_{}".format(index)].attrs
+            qpid = attrs.get("identifier", "")
+        return _decode(qpid)
+
+    def _get_identifier_dataset(self, size):
+        """Return the :const:`IDENTIFIER_INDEX` dataset with `size` rows"""
+        if IDENTIFIER_INDEX not in self.h5:
+            self.h5.create_dataset(IDENTIFIER_INDEX,
+                                   shape=(size,),
+                                   maxshape=(None,),
+                                   chunks=(1024,),
+                                   dtype=h5py.string_dtype())
+        dset = self.h5[IDENTIFIER_INDEX]
+        if dset.shape[0] != size:
+            dset.resize((size,))
+        return dset
+
+    @property
+    def amp_stack(self):
+        """lazy 3D view of the amplitude images (see :class:`SeriesStack`)
+        """
+        return SeriesStack(self, "amp")
+
+    @property
+    def field_stack(self):
+        """lazy 3D view of the complex fields (see :class:`SeriesStack`)"""
+        return SeriesStack(self, "field")
 
     @property
     def identifier(self):
@@ -127,7 +394,13 @@ class QPSeries(object):
         else:
             return None
 
-    def add_qpimage(self, qpi, identifier=None, bg_from_idx=None):
+    @property
+    def pha_stack(self):
+        """lazy 3D view of the phase images (see :class:`SeriesStack`)"""
+        return SeriesStack(self, "pha")
+
+    def add_qpimage(self, qpi, identifier=None, bg_from_idx=None,
+                    bg_data=None):
         """Add a QPImage instance to the QPSeries
 
         Parameters
@@ -140,32 +413,165 @@ class QPSeries(object):
             Use the background data from the data stored in this index,
             creating hard links within the HDF5 file.
             (Saves memory if e.g. all qpimages is corrected with the same data)
+        bg_data: qpimage.QPImage or None
+            Processed background data (replaces the "data" background
+            of `qpi`). The first time a QPImage is given here, its
+            phase and amplitude are stored as background data of the
+            added QPImage; all following QPImages added with the same
+            `bg_data` get hard links to them (as with `bg_from_idx`).
         """
         if not isinstance(qpi, QPImage):
             raise ValueError("`fli` must be instance of QPImage!")
+        if bg_data is not None:
+            if not isinstance(bg_data, QPImage):
+                raise ValueError("`bg_data` must be instance of QPImage!")
+            elif bg_from_idx is not None:
+                raise ValueError("`bg_data` and `bg_from_idx` must not "
+                                 + "be set at the same time!")
+            for ref, index in self._shared_bg:
+                if ref is bg_data:
+                    bg_from_idx = index
+                    break
         if "identifier" in qpi and identifier is None:
             identifier = qpi["identifier"]
-        if identifier and identifier in self:
+        # (no scan of all QPImages for new identifiers)
+        if identifier and self._find_identifier(identifier,
+                                                scan=False) is not None:
             msg = "The identifier '{}' already ".format(identifier) \
                   + "exists! You can either change the identifier of " \
                   + " '{}' or remove it.".format(qpi)
             raise ValueError(msg)
+        # make sure the identifier index is in sync before appending
+        self._get_id_index()
         # determine number of qpimages
         num = len(self)
-        # indices start at zero; do not add 1
-        name = "qpi_{}".format(num)
-        group = self.h5.create_group(name)
-        thisqpi = qpi.copy(h5file=group)
+        if self._store is not None:
+            self._store.append(qpi, identifier=identifier,
+                               bg_from_idx=bg_from_idx)
+            self._len += 1
+        else:
+            # indices start at zero; do not add 1
+            name = "qpi_{}".format(num)
+            group = self.h5.create_group(name)
+            thisqpi = qpi.copy(h5file=group, h5chunks=self.h5chunks,
+                               h5compression=self.h5compression)
 
-        if bg_from_idx is not None:
-            # Create hard links
-            refqpi = self[bg_from_idx]
-            thisqpi._amp.set_bg(bg=refqpi._amp.h5["bg_data"]["data"])
-            thisqpi._pha.set_bg(bg=refqpi._pha.h5["bg_data"]["data"])
+            if bg_from_idx is not None:
+                # Create hard links
+                refqpi = self[bg_from_idx]
+                thisqpi._amp.set_bg(bg=refqpi._amp.h5["bg_data"]["data"])
+                thisqpi._pha.set_bg(bg=refqpi._pha.h5["bg_data"]["data"])
 
-        if identifier:
-            # set identifier
-            group.attrs["identifier"] = identifier
+            if identifier:
+                # set identifier
+                group.attrs["identifier"] = identifier
+            # update the length
+            self._len += 1
+            self.h5.attrs[LENGTH_ATTR] = self._len
+            # update the identifier index
+            self._get_identifier_dataset(num + 1)[num] = identifier or ""
+        self._index_identifier(identifier, num)
+        if bg_data is not None and bg_from_idx is None:
+            # store the background data once
+            self.get_qpimage(num).set_bg_data(bg_data)
+            self._shared_bg.append((bg_data, num))
+
+    def compute_bg(self, which_data="phase",
+                   fit_offset="mean", fit_profile="tilt",
+                   border_m=0, border_perc=0, border_px=0,
+                   from_mask=None, fit_storage="image", batch_size=32):
+        """Compute background correction for all QPImages
+
+        This is the batched version of
+        :func:`qpimage.core.QPImage.compute_bg`. Images that share
+        the same shape and border size are fitted together with
+        :func:`qpimage.bg_estimate.estimate_stack`. The results are
+        stored in the same way as for the individual QPImages.
+
+        Parameters
+        ----------
+        which_data, fit_offset, fit_profile: str
+            See :func:`qpimage.core.QPImage.compute_bg`
+        border_m, border_perc, border_px: float
+            See :func:`qpimage.core.QPImage.compute_bg`
+        from_mask: boolean np.ndarray or None
+            Use a boolean array to define the background area;
+            either a 2D array used for all images or a 3D array
+            with one mask for each image in the series.
+        fit_storage: str
+            See :func:`qpimage.core.QPImage.compute_bg`
+        batch_size: int
+            Maximum number of images fitted at once; this limits
+            the memory usage for large series.
+
+        See Also
+        --------
+        qpimage.bg_estimate.estimate_stack
+        """
+        which_data = QPImage._conv_which_data(which_data)
+        # check validity
+        if not ("amplitude" in which_data or
+                "phase" in which_data):
+            msg = "`which_data` must contain 'phase' or 'amplitude'!"
+            raise ValueError(msg)
+        if from_mask is not None and from_mask.ndim == 3:
+            if len(from_mask) != len(self):
+                raise ValueError("`from_mask` must contain one mask "
+                                 + "for each of the {} QPImages!".format(
+                                     len(self)))
+        # group the images by geometry
+        groups = {}
+        for ii in range(len(self)):
+            qpi = self[ii]
+            if from_mask is not None and from_mask.ndim == 3:
+                frmask = from_mask[ii]
+            else:
+                frmask = from_mask
+            bpx = qpi._get_border_px(border_m=border_m,
+                                     border_perc=border_perc,
+                                     border_px=border_px,
+                                     from_mask=frmask)
+            groups.setdefault((qpi.shape, bpx), []).append(ii)
+        # perform correction
+        imdat_names = []
+        if "amplitude" in which_data:
+            imdat_names.append("_amp")
+        if "phase" in which_data:
+            imdat_names.append("_pha")
+        for (_, bpx), indices in groups.items():
+            for start in range(0, len(indices), batch_size):
+                batch = indices[start:start + batch_size]
+                qpis = [self[ii] for ii in batch]
+                if from_mask is not None and from_mask.ndim == 3:
+                    bmask = from_mask[batch]
+                else:
+                    bmask = from_mask
+                for name in imdat_names:
+                    imdats = [getattr(qpi, name) for qpi in qpis]
+                    # remove existing bg before accessing imdat.image
+                    for imdat in imdats:
+                        imdat.set_bg(bg=None, key="fit")
+                    data3d = np.array([imdat.image for imdat in imdats])
+                    bgimgs, params = bg_estimate.estimate_stack(
+                        data3d=data3d,
+                        fit_offset=fit_offset,
+                        fit_profile=fit_profile,
+                        border_px=bpx,
+                        from_mask=bmask,
+                        ret_params=True)
+                    for ii, imdat in enumerate(imdats):
+                        if bmask is not None and bmask.ndim == 3:
+                            frmask = bmask[ii]
+                        else:
+                            frmask = bmask
+                        imdat._set_fit_bg(bgimgs[ii],
+                                          fit_offset=fit_offset,
+                                          fit_profile=fit_profile,
+                                          border_px=bpx,
+                                          from_mask=frmask,
+                                          params={k: params[k][ii]
+                                                  for k in params},
+                                          fit_storage=fit_storage)
 
     def get_qpimage(self, index):
         """Return a single QPImage of the series
@@ -181,15 +587,14 @@ class QPSeries(object):
         to use the shorthand ``qps[index]``.
         """
         if isinstance(index, str):
-            # search for the identifier
-            for ii in range(len(self)):
-                qpi = self[ii]
-                if "identifier" in qpi and qpi["identifier"] == index:
-                    group = self.h5["qpi_{}".format(ii)]
-                    break
-            else:
-                msg = "QPImage identifier '{}' not found!".format(index)
+            # look up the identifier
+            qpid = index
+            index = self._find_identifier(qpid)
+            if index is None:
+                msg = "QPImage identifier '{}' not found!".format(qpid)
                 raise KeyError(msg)
+        if self._store is not None:
+            return QPImage(h5file=self._store.frame(index))
         else:
             # integer index
             if index < -len(self):
@@ -206,3 +611,461 @@ class QPSeries(object):
                     index, len(self))
                 raise KeyError(msg)
         return QPImage(h5file=group)
+
+    def iter_prefetch(self, depth=2, max_bytes=None):
+        """Iterate over the series, prefetching QPImages in a thread
+
+        A background thread reads the next QPImages and computes
+        their background-corrected amplitude and phase images
+        (including the combined backgrounds), which are kept in
+        the image cache of each QPImage (see the `cache_limit`
+        argument of :class:`qpimage.QPImage`). This way, reading and
+        decompressing the data overlaps with the computations
+        performed on the yielded QPImages.
+
+        Parameters
+        ----------
+        depth: int
+            Maximum number of QPImages prefetched
+        max_bytes: int or None
+            Maximum size of the cached arrays of all prefetched
+            QPImages; no further QPImages are prefetched while this
+            limit is exceeded (at least one QPImage is always
+            prefetched). Defaults to :const:`PREFETCH_LIMIT`.
+
+        Notes
+        -----
+        Exceptions raised while prefetching a QPImage are raised
+        when that QPImage is requested.
+        """
+        if depth < 1:
+            raise ValueError("`depth` must be at least 1, got {}!".format(
+                depth))
+        if max_bytes is None:
+            max_bytes = PREFETCH_LIMIT
+        num = len(self)
+        buffer = collections.deque()
+        state = {"nbytes": 0, "stop": False}
+        cond = threading.Condition()
+
+        def prefetch():
+            for ii in range(num):
+                with cond:
+                    while (not state["stop"] and buffer
+                           and (len(buffer) >= depth
+                                or state["nbytes"] >= max_bytes)):
+                        cond.wait()
+                    if state["stop"]:
+                        return
+                try:
+                    qpi = self.get_qpimage(ii)
+                    qpi._amp._get_image()
+                    qpi._pha._get_image()
+                except Exception as exc:
+                    item = (None, 0, exc)
+                else:
+                    item = (qpi, qpi._cache.nbytes, None)
+                with cond:
+                    buffer.append(item)
+                    state["nbytes"] += item[1]
+                    cond.notify_all()
+                if item[2] is not None:
+                    return
+
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+        try:
+            for _ in range(num):
+                with cond:
+                    while not buffer:
+                        cond.wait()
+                    qpi, nbytes, exc = buffer.popleft()
+                    state["nbytes"] -= nbytes
+                    cond.notify_all()
+                if exc is not None:
+                    raise exc
+                yield qpi
+        finally:
+            with cond:
+                state["stop"] = True
+                cond.notify_all()
+            thread.join()
+
+    def map(self, func, workers=None, out=None, resume=False,
+            errors="raise"):
+        """Apply a function to all QPImages of the series in parallel
+
+        Parameters
+        ----------
+        func: callable
+            Function that is called with an in-memory copy of each
+            QPImage. It returns a new QPImage or `None`, in which case
+            the (modified) copy itself is the result, e.g. for
+            ``def func(qpi): qpi.compute_bg(...)``. For `workers > 1`,
+            `func` must be picklable, i.e. defined at module level.
+        workers: int or None
+            Number of worker processes; defaults to the number of
+            CPUs. If the series is stored in a file, each worker
+            reads only the QPImages it processes; otherwise, the
+            data are sent to the workers. At most `workers *`
+            :const:`MAP_QUEUE_SIZE_PER_WORKER` QPImages are queued
+            at a time. With `workers=1`, all QPImages are processed
+            in the current process.
+        out: qpimage.QPSeries, str, pathlib.Path, or None
+            Output series to which the results are added in the order
+            of the input series (by the current process only); if a
+            path is given, the file is opened (or created) with the
+            layout of this series. Defaults to a new in-memory series.
+        resume: bool
+            Continue a map that was interrupted, skipping the QPImages
+            that were already processed according to the
+            :const:`MAP_PROGRESS_ATTR` attribute of `out`
+        errors: str
+            If set to "raise" (default), an exception in `func` is
+            re-raised as a `RuntimeError` (the results of the previous
+            QPImages are kept in `out`, so the map can be resumed).
+            If set to "collect", failed QPImages are skipped.
+
+        Returns
+        -------
+        out: qpimage.QPSeries
+            Output series with one QPImage per successfully
+            processed QPImage of this series
+        failed: dict
+            Formatted tracebacks of the exceptions raised by `func`,
+            keyed by the index of the QPImage in this series
+            (only for `errors="collect"`)
+        """
+        if errors not in ["collect", "raise"]:
+            raise ValueError("`errors` must be 'collect' or 'raise', "
+                             + "got '{}'!".format(errors))
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if out is None:
+            out = QPSeries(layout=self.layout)
+        elif isinstance(out, (str, pathlib.Path)):
+            out = QPSeries(h5file=out, h5mode="a",
+                           layout=None if resume else self.layout)
+        start = int(out.h5.attrs.get(MAP_PROGRESS_ATTR, 0)) if resume else 0
+        out.h5.attrs[MAP_PROGRESS_ATTR] = start
+        indices = range(start, len(self))
+
+        if workers > 1 and self.h5.file.driver != "core":
+            # workers read their QPImages from the file
+            self.h5.flush()
+            source = (self.h5.file.filename, self.h5.name)
+            tasks = ((ii, None) for ii in indices)
+        else:
+            source = None
+            tasks = ((ii, self[ii].copy().h5) for ii in indices)
+
+        failed = {}
+
+        def collect(result):
+            """Add the result of a QPImage to `out`"""
+            ii, group, tb = result
+            if group is not None:
+                out.add_qpimage(QPImage(h5file=group))
+            elif errors == "raise":
+                raise RuntimeError(
+                    "Processing QPImage {} failed:\n{}".format(ii, tb))
+            else:
+                failed[ii] = tb
+            out.h5.attrs[MAP_PROGRESS_ATTR] = ii + 1
+
+        pool = None
+        try:
+            if workers > 1:
+                # (forked processes would inherit the open HDF5 files)
+                pool = mp.get_context("spawn").Pool(
+                    workers, initializer=_map_init, initargs=(func, source))
+                # submit the tasks in a bounded window (the task handler
+                # of the pool would otherwise consume all of them at once)
+                queue_size = workers * MAP_QUEUE_SIZE_PER_WORKER
+                queue = collections.deque()
+                for task in tasks:
+                    if len(queue) >= queue_size:
+                        collect(queue.popleft().get())
+                    queue.append(pool.apply_async(_map_member, (task,)))
+                while queue:
+                    collect(queue.popleft().get())
+            else:
+                _map_init(func, None)
+                for task in tasks:
+                    collect(_map_member(task))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            _map_state.clear()
+        return out, failed
+
+
+class SeriesStack(object):
+    #: default data types of the stacks
+    dtypes = {"amp": np.float64,
+              "field": np.complex128,
+              "pha": np.float64,
+              }
+
+    def __init__(self, series, which):
+        """Lazy 3D view of the background-corrected images of a series
+
+        The first axis enumerates the QPImages of the series. Indexing
+        with NumPy-style slices, integers, and (along the first axis)
+        integer or boolean arrays reads only the requested QPImages
+        and, for each of them, only the hyperslab of the requested
+        rows and columns (see :class:`qpimage.core.QPImageROI`).
+
+        Parameters
+        ----------
+        series: QPSeries
+            The underlying series; all QPImages must have the
+            same shape
+        which: str
+            One of "amp", "field", or "pha"
+
+        Notes
+        -----
+        Use :func:`SeriesStack.read` to write the data into a
+        preallocated array or to choose the data type of the
+        returned array.
+        """
+        if which not in self.dtypes:
+            raise ValueError("`which` must be one of {}, got '{}'!".format(
+                sorted(self.dtypes), which))
+        self.series = series
+        #: image type ("amp", "field", or "pha")
+        self.which = which
+
+    def __array__(self, dtype=None, copy=None):
+        return self.read(dtype=dtype)
+
+    def __getitem__(self, given):
+        return self.read(given)
+
+    def __len__(self):
+        return len(self.series)
+
+    def __repr__(self):
+        return "<SeriesStack \"{}\": shape {}>".format(self.which,
+                                                       self.shape)
+
+    @property
+    def dtype(self):
+        """default data type of the stack"""
+        return np.dtype(self.dtypes[self.which])
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def shape(self):
+        """shape of the stack (no image data are read)
+
+        For the "group" layout, the shapes of all QPImages are
+        checked; :func:`SeriesStack.read` only checks the shapes
+        of the requested QPImages.
+        """
+        series = self.series
+        if series._store is not None:
+            return (len(series),) + self._frame_shape()
+        shapes = set()
+        for ii in range(len(series)):
+            shapes.add(series.h5["qpi_{}/phase/raw".format(ii)].shape)
+        self._check_shapes(shapes)
+        frame_shape = shapes.pop() if shapes else (0, 0)
+        return (len(series),) + frame_shape
+
+    @staticmethod
+    def _check_shapes(shapes):
+        if len(shapes) > 1:
+            raise ValueError("The QPImages of the series have different "
+                             + "shapes: {}".format(sorted(shapes)))
+
+    def _frame_shape(self):
+        """Return the image shape of the first QPImage"""
+        series = self.series
+        if len(series) == 0:
+            return (0, 0)
+        elif series._store is not None:
+            return series._store.frame_shape
+        else:
+            return series.h5["qpi_0/phase/raw"].shape
+
+    @staticmethod
+    def _normalize_axis(given, size):
+        """Normalize the index of an image axis
+
+        Returns
+        -------
+        region: slice
+            Slice with a positive step
+        flip: bool
+            Whether the data must be reversed
+        squeeze: bool
+            Whether the axis is removed
+        """
+        if isinstance(given, (numbers.Integral, np.integer)):
+            index = int(given)
+            if index < -size or index >= size:
+                raise IndexError("Index {} out of bounds for ".format(index)
+                                 + "axis with size {}!".format(size))
+            index %= size
+            return slice(index, index + 1, 1), False, True
+        elif isinstance(given, slice):
+            indices = range(*given.indices(size))
+            flip = indices.step < 0
+            if flip:
+                indices = indices[::-1]
+            if len(indices) == 0:
+                return slice(0, 0, 1), False, False
+            return (slice(indices.start, indices.stop, indices.step),
+                    flip, False)
+        else:
+            raise IndexError("Only integers and slices are supported "
+                             + "for the image axes, got {}!".format(given))
+
+    def _normalize_index(self, given):
+        """Return frame indices, image regions, and output axes"""
+        if not isinstance(given, tuple):
+            given = (given,)
+        ellipsis = [ii for ii, gg in enumerate(given) if gg is Ellipsis]
+        if ellipsis:
+            pos = ellipsis[0]
+            given = given[:pos] + (slice(None),) * (4 - len(given)) \
+                + given[pos + 1:]
+        if len(given) > 3:
+            raise IndexError("Too many indices for a 3D stack!")
+        given = given + (slice(None),) * (3 - len(given))
+        num = len(self.series)
+        rows, cols = self._frame_shape()
+        # frames
+        frames = given[0]
+        if isinstance(frames, (numbers.Integral, np.integer)):
+            if frames < -num or frames >= num:
+                raise IndexError("Index {} out of bounds for ".format(frames)
+                                 + "QPSeries of size {}!".format(num))
+            frames = [int(frames) % num]
+            squeeze_frames = True
+        else:
+            if isinstance(frames, slice):
+                frames = range(*frames.indices(num))
+            else:
+                frames = np.asarray(frames)
+                if frames.dtype == bool:
+                    if frames.shape != (num,):
+                        raise IndexError("Boolean index must have the "
+                                         + "length {}!".format(num))
+                    frames = np.where(frames)[0]
+                elif frames.ndim != 1 or not (
+                        frames.size == 0
+                        or np.issubdtype(frames.dtype, np.integer)):
+                    raise IndexError("Invalid index for the first axis: "
+                                     + "{}!".format(given[0]))
+                if np.any((frames < -num) | (frames >= num)):
+                    raise IndexError("Index out of bounds for QPSeries "
+                                     + "of size {}!".format(num))
+                frames = frames % num if num else frames
+            squeeze_frames = False
+        rregion, rflip, rsqueeze = self._normalize_axis(given[1], rows)
+        cregion, cflip, csqueeze = self._normalize_axis(given[2], cols)
+        return (frames, (rregion, cregion), (rflip, cflip),
+                (squeeze_frames, rsqueeze, csqueeze))
+
+    def read(self, given=Ellipsis, out=None, dtype=None):
+        """Read (part of) the stack
+
+        Parameters
+        ----------
+        given: int, slice, array, or tuple thereof
+            NumPy-style index (see :class:`SeriesStack`)
+        out: np.ndarray or None
+            Preallocated output array with the shape of the result;
+            its data type is used for the data
+        dtype: np.dtype or str or None
+            Data type of the returned array (e.g. "complex64" for
+            fields); defaults to :const:`SeriesStack.dtypes`
+
+        Returns
+        -------
+        data: np.ndarray
+            The requested data (`out` if given)
+        """
+        frames, region, flips, squeeze = self._normalize_index(given)
+        shape3d = (len(frames),) + tuple(
+            len(range(sl.start, sl.stop, sl.step)) for sl in region)
+        shape = tuple(size for size, sq in zip(shape3d, squeeze) if not sq)
+        if out is None:
+            out = np.empty(shape, dtype=dtype or self.dtype)
+        elif out.shape != shape:
+            raise ValueError("`out` must have the shape {}, got {}!".format(
+                shape, out.shape))
+        elif dtype is not None and np.dtype(dtype) != out.dtype:
+            raise ValueError("`dtype` does not match the data type "
+                             + "of `out`!")
+        # 3D view of `out` (squeezed axes are size-1 axes)
+        target = out.reshape(shape3d)
+        if out.size == 0:
+            return out
+        flip = (slice(None, None, -1 if flips[0] else 1),
+                slice(None, None, -1 if flips[1] else 1))
+        frame_shape = self._frame_shape()
+        for jj, ii in enumerate(frames):
+            qpi = self.series.get_qpimage(int(ii))
+            self._check_shapes({frame_shape, qpi.shape})
+            roi = qpi.roi(region)
+            target[jj] = getattr(roi, self.which)[flip]
+        return out
+
+
+#: per-process state of the :func:`QPSeries.map` workers
+_map_state = {}
+
+
+def _map_init(func, source):
+    """Initialize a :func:`QPSeries.map` worker
+
+    If `source` is a tuple of file name and group name, the
+    QPImages are read from that series (opened read-only).
+    """
+    _map_state["func"] = func
+    if source is not None:
+        filename, name = source
+        try:
+            try:
+                # the file is still open in the main process
+                h5 = h5py.File(filename, mode="r", locking=False)
+            except TypeError:
+                # h5py < 3.5
+                h5 = h5py.File(filename, mode="r")
+            _map_state["series"] = QPSeries(h5file=h5[name], h5mode="r")
+        except Exception:
+            # (an exception here would make the pool restart the worker)
+            _map_state["error"] = traceback.format_exc()
+
+
+def _map_member(task):
+    """Process one QPImage in a :func:`QPSeries.map` worker
+
+    Returns a tuple of the QPImage index, the result as an
+    in-memory group (or `None`), and the formatted traceback
+    of an exception (or `None`).
+    """
+    index, group = task
+    if "error" in _map_state:
+        return index, None, _map_state["error"]
+    try:
+        if group is None:
+            qpi = _map_state["series"][index].copy()
+        else:
+            qpi = QPImage(h5file=group)
+        result = _map_state["func"](qpi)
+        if result is None:
+            result = qpi
+        if not isinstance(result.h5, MemoryGroup):
+            result = result.copy()
+    except Exception:
+        return index, None, traceback.format_exc()
+    return index, result.h5, None
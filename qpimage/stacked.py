@@ -0,0 +1,712 @@
+"""Stacked 3D dataset layout of QPSeries (file format version 2)
+
+In the stacked layout, the raw images, backgrounds, and background
+masks of all QPImages of a series are stored in resizable 3D datasets
+(one frame per QPImage). Per-frame metadata and background
+information are stored in compound tables. QPImages of such a
+series are accessed via :class:`StackedFrame` views, which implement
+the group interface of :class:`qpimage.memory.MemoryGroup`.
+"""
+import abc
+import collections.abc
+
+import h5py
+import numpy as np
+
+from .bg_estimate import PROFILE_PARAMETERS
+from .image_data import check_chunks, check_compression, get_chunk_shape, \
+    get_compression_kwargs
+from .memory import MemoryDataset, MemoryGroup
+from .meta import META_KEYS
+from .unwrap import UNWRAP_ATTR
+
+#: file format version of the stacked layout (the group layout
+#: with one "qpi_<n>" group per QPImage has no version attribute)
+FORMAT_VERSION = 2
+
+#: metadata keys stored as strings in the metadata table
+#: (all other keys are stored as float64)
+META_STRING_KEYS = ["date",
+                    "device",
+                    "identifier",
+                    "qpimage version",
+                    "sim model",
+                    "software",
+                    ]
+
+#: metadata keys stored as float64 arrays of the given length
+META_ARRAY_KEYS = {"sim center": 2}
+
+#: neutral background values (used for frames without background)
+BG_NEUTRAL = {"amplitude": 1,
+              "phase": 0,
+              }
+
+#: valid keys of the background data
+BG_KEYS = ["data", "fit"]
+
+#: image attributes written by :func:`qpimage.image_data.write_image_dataset`
+#: that are not stored in the stacked layout
+_IGNORED_ATTRS = ["CLASS", "IMAGE_SUBCLASS", "IMAGE_VERSION"]
+
+#: maximum number of parametric background coefficients
+_MAX_COEFFS = max(len(pp) for pp in PROFILE_PARAMETERS.values())
+
+
+def bg_table_dtype():
+    """Compound data type of the per-frame background tables"""
+    return np.dtype([("has_data", bool),
+                     ("has_fit", bool),
+                     ("has_mask", bool),
+                     ("fit_offset", h5py.string_dtype()),
+                     ("fit_profile", h5py.string_dtype()),
+                     ("border_px", np.int64),
+                     ("model", h5py.string_dtype()),
+                     ("coefficients", np.float64, (_MAX_COEFFS,)),
+                     # (-1: not set)
+                     (UNWRAP_ATTR, np.int8),
+                     ])
+
+
+def is_stacked(h5):
+    """Whether the HDF5 group `h5` holds a series in the stacked layout"""
+    return h5.attrs.get("format version", 1) == FORMAT_VERSION
+
+
+def meta_dtype():
+    """Compound data type of the per-frame metadata table"""
+    fields = []
+    for key in META_KEYS:
+        if key in META_STRING_KEYS:
+            fields.append((key, h5py.string_dtype()))
+        elif key in META_ARRAY_KEYS:
+            fields.append((key, np.float64, (META_ARRAY_KEYS[key],)))
+        else:
+            fields.append((key, np.float64))
+    return np.dtype(fields)
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return value
+
+
+def _missing(field, value):
+    """Return the missing-value marker or test `value` for it"""
+    if field in META_STRING_KEYS:
+        return _decode(value) == ""
+    else:
+        return np.all(np.isnan(value))
+
+
+class StackedStore(object):
+    def __init__(self, h5, chunks=None, compression=None):
+        """Storage of QPImage data in stacked 3D datasets
+
+        Parameters
+        ----------
+        h5: h5py.Group
+            HDF5 group of the series; if it is empty, it is
+            initialized with the stacked layout
+        chunks: str, int, tuple of int, or None
+            Chunk layout of each frame (see
+            :func:`qpimage.image_data.write_image_dataset`); defaults
+            to the recorded layout or "full"
+        compression: str, dict, or None
+            Compression profiles (see
+            :func:`qpimage.image_data.check_compression`); defaults
+            to the recorded profiles or "archive"
+        """
+        self.h5 = h5
+        if not is_stacked(h5):
+            h5.attrs["format version"] = FORMAT_VERSION
+            h5.create_dataset("meta", shape=(0,), maxshape=(None,),
+                              dtype=meta_dtype(), chunks=(64,))
+            for which in BG_NEUTRAL:
+                grp = h5.create_group(which)
+                grp.create_group("bg_data")
+                grp.create_dataset("bg_table", shape=(0,), maxshape=(None,),
+                                   dtype=bg_table_dtype(), chunks=(64,))
+        grp = h5["phase"]
+        if chunks is not None or "chunk_layout" not in grp.attrs:
+            chunks = "full" if chunks is None else chunks
+            for which in BG_NEUTRAL:
+                h5[which].attrs["chunk_layout"] = check_chunks(chunks)
+        if compression is not None or "compression_raw" not in grp.attrs:
+            compression = "archive" if compression is None else compression
+            for which in BG_NEUTRAL:
+                for role, prof in check_compression(compression).items():
+                    h5[which].attrs["compression_" + role] = prof
+        #: chunk layout of the frames
+        self.chunks = check_chunks(grp.attrs["chunk_layout"])
+        #: compression profile for each dataset role
+        self.compression = check_compression(
+            {role: grp.attrs["compression_" + role]
+             for role in ["raw", "bg", "mask"]})
+
+    def __len__(self):
+        return self.h5["meta"].shape[0]
+
+    @property
+    def frame_shape(self):
+        """shape of the frames (None if the series is empty)"""
+        if "raw" in self.h5["phase"]:
+            return self.h5["phase/raw"].shape[1:]
+        else:
+            return None
+
+    def _datasets(self):
+        """All 3D datasets and tables (resized together)"""
+        dsets = [self.h5["meta"]]
+        for which in BG_NEUTRAL:
+            grp = self.h5[which]
+            dsets.append(grp["bg_table"])
+            for key in ["raw", "estimate_bg_from_mask"]:
+                if key in grp:
+                    dsets.append(grp[key])
+            for key in BG_KEYS:
+                if key in grp["bg_data"]:
+                    dsets.append(grp["bg_data"][key])
+        return dsets
+
+    def _get_dataset(self, path, shape, dtype):
+        """Return the 3D dataset at `path`, creating it if necessary"""
+        if path in self.h5:
+            return self.h5[path]
+        which = path.split("/")[0]
+        if path.endswith("/raw"):
+            role, fillvalue = "raw", 0
+        elif "/bg_data/" in path:
+            role, fillvalue = "bg", BG_NEUTRAL[which]
+        else:
+            role, fillvalue = "mask", False
+        kwargs = {"chunks": (1,) + get_chunk_shape(self.chunks, shape,
+                                                   dtype)}
+        if self.h5.file.driver != "core":
+            kwargs.update(get_compression_kwargs(self.compression[role]))
+        return self.h5.create_dataset(path,
+                                      shape=(len(self),) + tuple(shape),
+                                      maxshape=(None,) + tuple(shape),
+                                      dtype=dtype,
+                                      fillvalue=fillvalue,
+                                      **kwargs)
+
+    def append(self, qpi, identifier=None, bg_from_idx=None):
+        """Append a QPImage as a new frame
+
+        Parameters
+        ----------
+        qpi: qpimage.QPImage
+            The QPImage; its shape must match the frame shape
+        identifier: str or None
+            Identifier of the frame (overrides that of `qpi`)
+        bg_from_idx: int or None
+            Copy the "data" backgrounds from this frame
+        """
+        shape = qpi.shape
+        if self.frame_shape is not None and shape != self.frame_shape:
+            raise ValueError("Shape {} does not match the ".format(shape)
+                             + "frame shape {} ".format(self.frame_shape)
+                             + "of the stacked series!")
+        # metadata
+        meta = np.zeros(1, dtype=meta_dtype())[0]
+        for key in META_KEYS:
+            if key in qpi.h5.attrs:
+                meta[key] = qpi.h5.attrs[key]
+            elif key in META_STRING_KEYS:
+                meta[key] = ""
+            else:
+                meta[key] = np.nan
+        if identifier:
+            meta["identifier"] = identifier
+        index = len(self)
+        for dset in self._datasets():
+            dset.resize(index + 1, axis=0)
+        try:
+            self.h5["meta"][index] = meta
+            # image data
+            for which in BG_NEUTRAL:
+                frame = StackedFrame(self, index)[which]
+                src = qpi.h5[which]
+                frame.attrs[UNWRAP_ATTR] = src.attrs.get(UNWRAP_ATTR, None)
+                frame.create_dataset("raw", data=src["raw"][:],
+                                     dtype=src["raw"].dtype)
+                if "estimate_bg_from_mask" in src:
+                    frame.create_dataset(
+                        "estimate_bg_from_mask",
+                        data=src["estimate_bg_from_mask"][:])
+                for key in BG_KEYS:
+                    if bg_from_idx is not None and key == "data":
+                        ref = StackedFrame(self,
+                                           bg_from_idx)[which]["bg_data"]
+                        if key in ref:
+                            frame["bg_data"][key] = ref[key]
+                    elif key in src["bg_data"]:
+                        frame["bg_data"][key] = src["bg_data"][key]
+        except BaseException:
+            # do not leave a partially written frame behind
+            for dset in self._datasets():
+                dset.resize(index, axis=0)
+            raise
+
+    def frame(self, index):
+        """Return the :class:`StackedFrame` view of a frame"""
+        if index < -len(self):
+            msg = "Index {} out of bounds for QPSeries of size {}!".format(
+                index, len(self))
+            raise ValueError(msg)
+        elif index < 0:
+            index += len(self)
+        if index >= len(self):
+            msg = "Index {} not found for QPSeries of length {}".format(
+                index, len(self))
+            raise KeyError(msg)
+        return StackedFrame(self, index)
+
+    def identifiers(self):
+        """Return the identifiers of all frames ("" if not set)"""
+        if len(self) == 0:
+            return []
+        ids = self.h5["meta"].fields("identifier")[:]
+        return [_decode(ii) for ii in ids]
+
+
+class _TableAttrs(collections.abc.MutableMapping):
+    """Attributes backed by a row of a compound table
+
+    Missing values ("" or nan) are not listed.
+    """
+
+    def __init__(self, table, index, fields, ignore=()):
+        self.table = table
+        self.index = index
+        self.fields = fields
+        self.ignore = ignore
+
+    def __delitem__(self, key):
+        self[key] = None
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError("Unknown attribute '{}'".format(key))
+        value = self.table[self.index][key]
+        if _missing(key, value):
+            raise KeyError("Attribute '{}' not set".format(key))
+        return _decode(value)
+
+    def __iter__(self):
+        return iter(sorted(key for key in self.fields
+                           if not _missing(key,
+                                           self.table[self.index][key])))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __setitem__(self, key, value):
+        if key in self.ignore:
+            return
+        if key not in self.fields:
+            raise KeyError("Attribute '{}' is not supported ".format(key)
+                           + "in the stacked series layout!")
+        row = self.table[self.index]
+        if value is None:
+            value = "" if key in META_STRING_KEYS else np.nan
+        row[key] = value
+        self.table[self.index] = row
+
+    def create(self, name, data):
+        self[name] = data
+
+
+class _MetaAttrs(_TableAttrs):
+    def __init__(self, store, index):
+        super(_MetaAttrs, self).__init__(table=store.h5["meta"],
+                                         index=index,
+                                         fields=META_KEYS)
+
+
+class _FitAttrs(_TableAttrs):
+    """Attributes of the "fit" background (incl. parametric models)"""
+
+    def __init__(self, table, index):
+        super(_FitAttrs, self).__init__(
+            table=table, index=index, ignore=_IGNORED_ATTRS,
+            fields=["border_px", "coefficients", "fit_offset",
+                    "fit_profile", "model"])
+
+    def __getitem__(self, key):
+        row = self.table[self.index]
+        if key == "border_px" and row["border_px"] >= 0:
+            return row["border_px"]
+        elif key == "coefficients" and _decode(row["model"]):
+            size = len(PROFILE_PARAMETERS[_decode(row["model"])])
+            return row["coefficients"][:size]
+        elif key in ["fit_offset", "fit_profile", "model"] and row[key]:
+            return _decode(row[key])
+        raise KeyError("Attribute '{}' not set".format(key))
+
+    def __iter__(self):
+        return iter(sorted(key for key in self.fields if key in self))
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        else:
+            return True
+
+    def __setitem__(self, key, value):
+        if key in self.ignore:
+            return
+        row = self.table[self.index]
+        if key == "border_px":
+            row[key] = -1 if value is None else value
+        elif key == "coefficients":
+            coeffs = np.full(_MAX_COEFFS, np.nan)
+            if value is not None:
+                coeffs[:len(value)] = value
+            row[key] = coeffs
+        elif key in ["fit_offset", "fit_profile", "model"]:
+            row[key] = "" if value is None else _decode(value)
+        else:
+            raise KeyError("Attribute '{}' is not supported ".format(key)
+                           + "in the stacked series layout!")
+        self.table[self.index] = row
+
+    def clear(self):
+        for key in self.fields:
+            self[key] = None
+
+
+class _ImageAttrs(collections.abc.MutableMapping):
+    """Attributes of the amplitude or phase group of a frame
+
+    :const:`qpimage.unwrap.UNWRAP_ATTR` is stored per frame in the
+    background table; all other attributes (chunk layout, compression)
+    are shared by all frames.
+    """
+
+    def __init__(self, attrs, table, index):
+        self.attrs = attrs
+        self.table = table
+        self.index = index
+
+    def __delitem__(self, key):
+        if key == UNWRAP_ATTR:
+            self[key] = None
+        else:
+            del self.attrs[key]
+
+    def __getitem__(self, key):
+        if key == UNWRAP_ATTR:
+            value = self.table[self.index][key]
+            if value < 0:
+                raise KeyError("Attribute '{}' not set".format(key))
+            return np.bool_(value)
+        return self.attrs[key]
+
+    def __iter__(self):
+        keys = list(self.attrs)
+        if self.table[self.index][UNWRAP_ATTR] >= 0:
+            keys.append(UNWRAP_ATTR)
+        return iter(sorted(keys))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __setitem__(self, key, value):
+        if key == UNWRAP_ATTR:
+            row = self.table[self.index]
+            row[key] = -1 if value is None else bool(value)
+            self.table[self.index] = row
+        else:
+            self.attrs[key] = value
+
+    def create(self, name, data):
+        self[name] = data
+
+
+class _IgnoredAttrs(dict):
+    """Attributes of raw images, "data" backgrounds, and masks
+
+    HDFView image attributes are ignored, other attributes
+    are not supported.
+    """
+
+    def __setitem__(self, key, value):
+        if key not in _IGNORED_ATTRS:
+            raise KeyError("Attribute '{}' is not supported ".format(key)
+                           + "in the stacked series layout!")
+
+    def create(self, name, data):
+        self[name] = data
+
+    def update(self, other=(), **kwargs):
+        for key, value in dict(other, **kwargs).items():
+            self[key] = value
+
+
+class StackedFrameDataset(MemoryDataset):
+    def __init__(self, dset, index, name, attrs=None, parametric=False):
+        """View of one frame of a 3D dataset
+
+        This implements the interface of
+        :class:`qpimage.memory.MemoryDataset`.
+
+        Parameters
+        ----------
+        dset: h5py.Dataset
+            The 3D dataset
+        index: int
+            Frame index
+        name: str
+            Name of the dataset within the frame
+        attrs: dict-like or None
+            Attributes of the dataset
+        parametric: bool
+            Whether the frame holds a parametric background (the
+            dataset then behaves like an empty dataset)
+        """
+        self._dset = dset
+        self.index = index
+        self.name = name
+        self.attrs = _IgnoredAttrs() if attrs is None else attrs
+        self.parametric = parametric
+
+    def __getitem__(self, given):
+        if self.parametric:
+            return h5py.Empty(self.dtype)
+        if not isinstance(given, tuple):
+            given = (given,)
+        return self._dset[(self.index,) + given]
+
+    @property
+    def dtype(self):
+        return np.dtype("float64") if self.parametric else self._dset.dtype
+
+    @property
+    def ndim(self):
+        return None if self.parametric else 2
+
+    @property
+    def shape(self):
+        return None if self.parametric else self._dset.shape[1:]
+
+    @property
+    def size(self):
+        return None if self.parametric else int(np.prod(self.shape))
+
+
+class _StackedGroup(MemoryGroup):
+    """Base class of the group views of a frame
+
+    Members cannot be created, deleted, or linked freely, because
+    all frames share the 3D datasets of the stacked layout; such
+    operations raise a TypeError.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, store, index, name):
+        super(_StackedGroup, self).__init__(name=name)
+        self.store = store
+        self.index = index
+
+    def __delitem__(self, name):
+        raise TypeError(
+            "Cannot delete '{}' in the stacked series layout!".format(name))
+
+    def __getitem__(self, name):
+        parts = [p for p in name.split("/") if p]
+        if not parts or parts[0] not in self._member_names():
+            raise KeyError("Unable to open '{}' (not found)".format(name))
+        member = self._get_member(parts[0])
+        if len(parts) > 1:
+            member = member["/".join(parts[1:])]
+        return member
+
+    def __iter__(self):
+        return iter(sorted(self._member_names()))
+
+    def __len__(self):
+        return len(self._member_names())
+
+    def __setitem__(self, name, obj):
+        raise TypeError(
+            "Cannot link '{}' in the stacked series layout!".format(name))
+
+    @abc.abstractmethod
+    def _get_member(self, key):
+        """Return the member view `key` of the frame"""
+
+    @abc.abstractmethod
+    def _member_names(self):
+        """Return the names of the members present in the frame"""
+
+    def create_dataset(self, name, data, dtype=None):
+        raise TypeError(
+            "Cannot create '{}' in the stacked series layout!".format(name))
+
+    def create_group(self, name):
+        raise TypeError(
+            "Cannot create '{}' in the stacked series layout!".format(name))
+
+    def require_group(self, name):
+        return self[name]
+
+
+class StackedFrame(_StackedGroup):
+    def __init__(self, store, index):
+        """Root group view of one QPImage in a stacked series
+
+        Pass this to :class:`qpimage.QPImage` as `h5file`.
+
+        Parameters
+        ----------
+        store: StackedStore
+            Storage of the series
+        index: int
+            Frame index
+        """
+        super(StackedFrame, self).__init__(store, index, name="/")
+        #: metadata (backed by the metadata table)
+        self.attrs = _MetaAttrs(store, index)
+
+    def _get_member(self, key):
+        return _StackedImageGroup(self.store, self.index, key)
+
+    def _member_names(self):
+        return list(BG_NEUTRAL)
+
+
+class _StackedImageGroup(_StackedGroup):
+    """Amplitude or phase group of a frame"""
+
+    def __init__(self, store, index, which):
+        super(_StackedImageGroup, self).__init__(store, index,
+                                                 name="/" + which)
+        self.which = which
+        self._table = store.h5[which]["bg_table"]
+        self.attrs = _ImageAttrs(store.h5[which].attrs, self._table, index)
+
+    def __delitem__(self, name):
+        if name != "estimate_bg_from_mask":
+            super(_StackedImageGroup, self).__delitem__(name)
+        elif name not in self:
+            raise KeyError("Unable to delete '{}' (not found)".format(name))
+        self._set_flag("has_mask", False)
+
+    def replace_dataset(self, name, data, dtype=None):
+        """Overwrite the frame of `name` in place"""
+        return self.create_dataset(name, data=data, dtype=dtype)
+
+    def _get_member(self, key):
+        if key == "bg_data":
+            return _StackedBgGroup(self.store, self.index, self.which)
+        return StackedFrameDataset(self.store.h5[self.which][key],
+                                   index=self.index,
+                                   name="{}/{}".format(self.name, key))
+
+    def _member_names(self):
+        names = ["bg_data"]
+        if "raw" in self.store.h5[self.which]:
+            names.append("raw")
+        if self._table[self.index]["has_mask"]:
+            names.append("estimate_bg_from_mask")
+        return names
+
+    def _set_flag(self, flag, value):
+        row = self._table[self.index]
+        row[flag] = value
+        self._table[self.index] = row
+
+    def create_dataset(self, name, data, dtype=None):
+        if name not in ["raw", "estimate_bg_from_mask"]:
+            super(_StackedImageGroup, self).create_dataset(name, data, dtype)
+        data = np.asarray(data)
+        if dtype is None:
+            dtype = data.dtype
+        dset = self.store._get_dataset("{}/{}".format(self.which, name),
+                                       shape=data.shape, dtype=dtype)
+        if dset.shape[1:] != data.shape:
+            raise ValueError("Shape {} does not match the ".format(data.shape)
+                             + "frame shape {} ".format(dset.shape[1:])
+                             + "of the stacked series!")
+        dset[self.index] = data
+        if name == "estimate_bg_from_mask":
+            self._set_flag("has_mask", True)
+        return self[name]
+
+
+class _StackedBgGroup(_StackedGroup):
+    """Background group ("bg_data") of a frame"""
+
+    def __init__(self, store, index, which):
+        super(_StackedBgGroup, self).__init__(
+            store, index, name="/{}/bg_data".format(which))
+        self.which = which
+        self._table = store.h5[which]["bg_table"]
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError("Unable to delete '{}' (not found)".format(name))
+        row = self._table[self.index]
+        row["has_" + name] = False
+        self._table[self.index] = row
+        if name == "fit":
+            _FitAttrs(self._table, self.index).clear()
+
+    def __setitem__(self, name, obj):
+        """Copy a background (hard links are not possible for frames)"""
+        if name not in BG_KEYS:
+            super(_StackedBgGroup, self).__setitem__(name, obj)
+        if name in self:
+            del self[name]
+        if obj.shape is None:
+            dset = self.create_dataset(name, data=h5py.Empty("float64"))
+        else:
+            dset = self.create_dataset(name, data=obj[:], dtype=obj.dtype)
+        dset.attrs.update(obj.attrs)
+
+    def _get_member(self, key, parametric=None):
+        attrs = None
+        if key == "fit":
+            attrs = _FitAttrs(self._table, self.index)
+        if parametric is None:
+            parametric = attrs is not None and "model" in attrs
+        if parametric:
+            dset = None
+        else:
+            dset = self.store.h5["{}/bg_data/{}".format(self.which, key)]
+        return StackedFrameDataset(dset,
+                                   index=self.index,
+                                   name="{}/{}".format(self.name, key),
+                                   attrs=attrs,
+                                   parametric=parametric)
+
+    def _member_names(self):
+        row = self._table[self.index]
+        return [key for key in BG_KEYS if row["has_" + key]]
+
+    def create_dataset(self, name, data, dtype=None):
+        if name not in BG_KEYS:
+            super(_StackedBgGroup, self).create_dataset(name, data, dtype)
+        if name in self:
+            raise ValueError("Unable to create '{}' (exists)".format(name))
+        if name == "fit":
+            _FitAttrs(self._table, self.index).clear()
+        parametric = isinstance(data, h5py.Empty)
+        if not parametric:
+            # (parametric backgrounds are defined by their attributes)
+            data = np.asarray(data)
+            if dtype is None:
+                dtype = data.dtype
+            dset = self.store._get_dataset(
+                "{}/bg_data/{}".format(self.which, name),
+                shape=data.shape, dtype=dtype)
+            dset[self.index] = data
+        row = self._table[self.index]
+        row["has_" + name] = True
+        self._table[self.index] = row
+        return self._get_member(name, parametric=parametric)
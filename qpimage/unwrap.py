@@ -0,0 +1,535 @@
+"""Phase unwrapping engines
+
+The engine used for phase unwrapping is selected with the `unwrap`
+argument of :class:`qpimage.QPImage`. Additional engines can be
+added with :func:`register_engine`. An engine is a function that
+takes a 2D array of wrapped phase values, which may contain NaN
+values (invalid pixels), and returns the unwrapped phase with NaN
+values at the same positions. The 2π offset correction of
+:class:`qpimage.QPImage` is performed after unwrapping, i.e. engines
+may return the unwrapped phase with an arbitrary offset.
+
+Unwrapping is skipped for phase images without phase jumps
+(see :func:`is_wrapped` and :func:`skip_info`).
+"""
+import collections
+import concurrent.futures
+import heapq
+import os
+
+import numpy as np
+from scipy import ndimage
+from skimage.restoration import unwrap_phase
+
+try:
+    from scipy.fft import dctn, idctn
+except ImportError:
+    # scipy < 1.4
+    from scipy.fftpack import dctn, idctn
+
+#: attribute of the "phase" group of a QPImage that records whether
+#: a phase unwrapping engine was applied (False if the phase did not
+#: contain phase jumps or if `proc_phase` was False)
+UNWRAP_ATTR = "unwrapped"
+
+#: number of image rows checked at once by :func:`is_wrapped`
+WRAP_CHECK_ROWS = 256
+
+#: default maximum phase change between two frames for which
+#: :func:`unwrap_temporal` does not fall back to spatial unwrapping
+TEMPORAL_THRESHOLD = np.pi / 2
+
+#: margin around the pixels that are unwrapped spatially by
+#: :func:`unwrap_temporal` [px]
+TEMPORAL_MARGIN = 16
+
+#: size of the median filter that :func:`unwrap_temporal` applies to
+#: the phase change between two frames (suppresses noisy pixels) [px]
+TEMPORAL_MEDIAN_SIZE = 3
+
+#: maximum number of conjugate gradient iterations of :func:`unwrap_dct`
+#: for phase images with NaN values
+DCT_PCG_MAXITER = 500
+
+#: relative residual at which the conjugate gradient iterations of
+#: :func:`unwrap_dct` stop
+DCT_PCG_RTOL = 1e-9
+
+#: default tile size of :func:`unwrap_tiled` [px]
+TILE_SIZE = 1024
+
+#: default overlap of neighboring tiles of :func:`unwrap_tiled` [px]
+TILE_OVERLAP = 64
+
+
+def unwrap_dct(pha):
+    """Least-squares phase unwrapping with discrete cosine transforms
+
+    This is the least-squares method of Ghiglia and Romero
+    (JOSA A 11(1), 1994). The Poisson equation relating the
+    Laplacian of the unwrapped phase to the divergence of the
+    wrapped phase gradients is solved with Neumann boundary
+    conditions in O(N log N) time. The solution is then made
+    congruent to the input, i.e. it differs from the wrapped
+    phase only by multiples of 2π.
+
+    If the phase contains NaN values, the weighted least-squares
+    problem (phase gradients involving NaN pixels have zero weight)
+    is solved with preconditioned conjugate gradients, using the
+    unweighted DCT solution as preconditioner (see
+    :const:`DCT_PCG_MAXITER` and :const:`DCT_PCG_RTOL`). Connected
+    regions of valid pixels are unwrapped independently.
+    """
+    nanmask = np.isnan(pha)
+    wrapped = np.where(nanmask, 0, pha)
+    weights = [None, None]
+    if np.any(nanmask):
+        valid = ~nanmask
+        weights = [valid[1:] & valid[:-1], valid[:, 1:] & valid[:, :-1]]
+    grads = []
+    for axis in [0, 1]:
+        grad = _wrap(np.diff(wrapped, axis=axis))
+        if weights[axis] is not None:
+            grad[~weights[axis]] = 0
+        grads.append(grad)
+    rho = _divergence(grads)
+    if weights[0] is None:
+        phi = _solve_poisson_dct(rho)
+    else:
+        phi = _solve_poisson_pcg(rho, weights)
+    if np.any(nanmask):
+        # remove the (arbitrary) offset of each region of valid pixels
+        labels, num = ndimage.label(~nanmask)
+        offsets = ndimage.median(_wrap(phi - wrapped), labels=labels,
+                                 index=np.arange(1, num + 1))
+        phi -= np.concatenate(([0], offsets))[labels]
+    # congruence with the wrapped phase
+    unwrapped = wrapped + 2 * np.pi * np.round((phi - wrapped) / (2 * np.pi))
+    unwrapped[nanmask] = np.nan
+    return unwrapped
+
+
+def unwrap_none(pha):
+    """Do not unwrap the phase (only the offset correction is done)"""
+    return np.array(pha, dtype=float)
+
+
+def unwrap_skimage(pha):
+    """Phase unwrapping with :func:`skimage.restoration.unwrap_phase`
+
+    This is the reliability-sorting algorithm of Herráez et al.
+    (Applied Optics 41(35), 2002); NaN values are masked.
+    """
+    nanmask = np.isnan(pha)
+    if np.sum(nanmask):
+        # create masked array
+        # skimage.restoration.unwrap_phase cannot handle nan data
+        # (even if masked)
+        pham = pha.copy()
+        pham[nanmask] = 0
+        pham = np.ma.masked_array(pham, mask=nanmask)
+        pha = unwrap_phase(pham, rng=47)
+        pha[nanmask] = np.nan
+    else:
+        pha = unwrap_phase(pha, rng=47)
+    return pha
+
+
+SkipInfo = collections.namedtuple("SkipInfo", ["checked", "skipped"])
+
+
+def is_wrapped(pha):
+    """Check whether neighboring pixels differ by more than π
+
+    The check is done in blocks of :const:`WRAP_CHECK_ROWS` rows
+    and stops at the first phase jump. NaN values are ignored.
+    """
+    for start in range(0, pha.shape[0], WRAP_CHECK_ROWS):
+        # (one additional row for the differences between blocks)
+        block = pha[start:start + WRAP_CHECK_ROWS + 1]
+        if (np.any(np.abs(np.diff(block, axis=0)) > np.pi)
+                or np.any(np.abs(np.diff(block[:WRAP_CHECK_ROWS], axis=1))
+                          > np.pi)):
+            return True
+    return False
+
+
+def skip_clear():
+    """Reset the statistics of :func:`unwrap_if_wrapped`"""
+    _skip_stats["checked"] = 0
+    _skip_stats["skipped"] = 0
+
+
+def skip_info():
+    """Return how often unwrapping was skipped
+
+    Returns
+    -------
+    info: SkipInfo
+        Named tuple with the number of phase images `checked` by
+        :func:`unwrap_if_wrapped` (e.g. in :class:`qpimage.QPImage`)
+        in the current process and the number of images for which
+        unwrapping was `skipped`
+    """
+    return SkipInfo(checked=_skip_stats["checked"],
+                    skipped=_skip_stats["skipped"])
+
+
+def get_engine(name):
+    """Return the unwrapping engine registered under `name`"""
+    if name not in UNWRAP_ENGINES:
+        raise ValueError("`unwrap` must be one of {}, got '{}'!".format(
+            sorted(UNWRAP_ENGINES), name))
+    return UNWRAP_ENGINES[name]
+
+
+def register_engine(name, func):
+    """Register a phase unwrapping engine
+
+    Parameters
+    ----------
+    name: str
+        Name of the engine (value of `unwrap` in
+        :class:`qpimage.QPImage`)
+    func: callable
+        Function that takes a 2D wrapped phase array (possibly
+        containing NaN values) and returns the unwrapped phase
+
+    Notes
+    -----
+    Worker processes (e.g. of :func:`qpimage.ingest.ingest`) only
+    know the engines that are registered when the module defining
+    them is imported.
+    """
+    if name in UNWRAP_ENGINES:
+        raise ValueError("Unwrapping engine '{}' exists!".format(name))
+    UNWRAP_ENGINES[name] = func
+
+
+def unwrap_tiled(pha, engine="skimage", tile_size=TILE_SIZE,
+                 overlap=TILE_OVERLAP, workers=None):
+    """Unwrap large images in overlapping tiles
+
+    The image is divided into tiles of `tile_size` pixels that are
+    extended by `overlap` pixels on each side. The tiles are
+    unwrapped independently in a thread pool and the 2π offsets
+    between the tiles are then determined from the overlaps of
+    neighboring tiles, starting with the most reliable overlaps
+    (maximum spanning tree).
+
+    Parameters
+    ----------
+    pha: 2d ndarray
+        Wrapped phase (may contain NaN values)
+    engine: str
+        Engine used for the individual tiles
+    tile_size: int
+        Size of the tiles (without overlap) [px]
+    overlap: int
+        Overlap with the neighboring tiles [px]
+    workers: int or None
+        Number of threads; defaults to the number of CPUs
+
+    Returns
+    -------
+    unwrapped: 2d ndarray
+        Unwrapped phase
+
+    Notes
+    -----
+    Only `workers` tiles are processed at a time, so the memory
+    required in addition to the input and output arrays is bounded
+    by the tile size times the number of workers. To use other
+    settings with :class:`qpimage.QPImage`, register an engine,
+    e.g. ``register_engine("tiled-dct",
+    functools.partial(unwrap_tiled, engine="dct"))``.
+    """
+    if tile_size < 1 or overlap < 1:
+        raise ValueError("`tile_size` and `overlap` must be positive, "
+                         + "got {} and {}!".format(tile_size, overlap))
+    func = get_engine(engine)
+    if pha.shape[0] <= tile_size and pha.shape[1] <= tile_size:
+        return func(pha)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    grid = (int(np.ceil(pha.shape[0] / tile_size)),
+            int(np.ceil(pha.shape[1] / tile_size)))
+    out = np.zeros(pha.shape, dtype=float)
+    # edges of the tile graph: (tile_a, tile_b) -> (offset, weight)
+    edges = {}
+
+    def core_slice(tile):
+        return tuple(slice(tile[ax] * tile_size,
+                           min((tile[ax] + 1) * tile_size, pha.shape[ax]))
+                     for ax in [0, 1])
+
+    def ext_slice(tile):
+        return tuple(slice(max(tile[ax] * tile_size - overlap, 0),
+                           min((tile[ax] + 1) * tile_size + overlap,
+                               pha.shape[ax]))
+                     for ax in [0, 1])
+
+    def unwrap_tile(tile):
+        data = pha[ext_slice(tile)]
+        if np.all(np.isnan(data)):
+            return np.array(data, dtype=float)
+        return np.ma.getdata(func(data))
+
+    def write(tile, data):
+        """Store the core of a tile and compare with finished tiles"""
+        ext = ext_slice(tile)
+        core = core_slice(tile)
+        out[core] = data[core[0].start - ext[0].start:
+                         core[0].stop - ext[0].start,
+                         core[1].start - ext[1].start:
+                         core[1].stop - ext[1].start]
+        for nb in [(tile[0] - 1, tile[1]), (tile[0], tile[1] - 1)]:
+            if nb[0] < 0 or nb[1] < 0:
+                continue
+            # overlap of this tile with the core of the neighbor
+            nbc = core_slice(nb)
+            region = tuple(slice(max(ext[ax].start, nbc[ax].start),
+                                 min(ext[ax].stop, nbc[ax].stop))
+                           for ax in [0, 1])
+            diff = out[region] - data[region[0].start - ext[0].start:
+                                      region[0].stop - ext[0].start,
+                                      region[1].start - ext[1].start:
+                                      region[1].stop - ext[1].start]
+            diff = diff[~np.isnan(diff)] / (2 * np.pi)
+            if diff.size:
+                offset = int(np.round(np.median(diff)))
+                weight = np.mean(np.abs(diff - offset) < .25)
+                edges[(nb, tile)] = (offset, weight)
+
+    tiles = [(ii, jj) for ii in range(grid[0]) for jj in range(grid[1])]
+    # tiles are written in order, so the upper and left neighbors are
+    # always finished when a tile is written
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        queue = collections.deque()
+        for tile in tiles:
+            if len(queue) >= workers:
+                first, future = queue.popleft()
+                write(first, future.result())
+            queue.append((tile, pool.submit(unwrap_tile, tile)))
+        while queue:
+            first, future = queue.popleft()
+            write(first, future.result())
+    # resolve the 2π offsets (Prim's algorithm, maximum weights first)
+    neighbors = collections.defaultdict(list)
+    for (ta, tb), (offset, weight) in edges.items():
+        neighbors[ta].append((weight, tb, offset))
+        neighbors[tb].append((weight, ta, -offset))
+    offsets = {}
+    for root in tiles:
+        if root in offsets:
+            continue
+        offsets[root] = 0
+        heap = [(-w, tb, off) for w, tb, off in neighbors[root]]
+        heapq.heapify(heap)
+        while heap:
+            _, tile, offset = heapq.heappop(heap)
+            if tile in offsets:
+                continue
+            offsets[tile] = offset
+            for weight, tb, off in neighbors[tile]:
+                if tb not in offsets:
+                    heapq.heappush(heap, (-weight, tb, offset + off))
+    for tile in tiles:
+        if offsets[tile]:
+            out[core_slice(tile)] += 2 * np.pi * offsets[tile]
+    return out
+
+
+def unwrap_temporal(pha, reference, threshold=TEMPORAL_THRESHOLD,
+                    engine="skimage", ret_fallback=False):
+    """Unwrap the phase using the unwrapped phase of a previous frame
+
+    For each pixel, the multiple of 2π is added that brings the
+    wrapped phase closest to the reference phase plus the local phase
+    change (the phase change median-filtered over
+    :const:`TEMPORAL_MEDIAN_SIZE` pixels, such that isolated noisy
+    pixels follow their neighbors). Pixels for which the local phase
+    change exceeds `threshold`, for which the reference is NaN, or
+    that are next to a phase jump larger than π in the result are
+    unwrapped spatially with `engine`. This is done in
+    the bounding boxes of connected regions of such pixels (extended
+    by :const:`TEMPORAL_MARGIN`) and the results are aligned with
+    the remaining pixels of these boxes.
+
+    Parameters
+    ----------
+    pha: 2d ndarray
+        Wrapped phase (may contain NaN values)
+    reference: 2d ndarray or None
+        Unwrapped phase of the previous frame; if None,
+        the entire image is unwrapped spatially
+    threshold: float
+        Maximum phase change between the frames [rad]
+    engine: str
+        Engine used for spatial unwrapping
+    ret_fallback: bool
+        Also return the number of pixels that were unwrapped
+        spatially
+
+    Returns
+    -------
+    unwrapped: 2d ndarray
+        Unwrapped phase
+    num_fallback: int
+        Number of spatially unwrapped pixels (if `ret_fallback`)
+    """
+    func = get_engine(engine)
+    valid = ~np.isnan(pha)
+    if reference is None:
+        unwrapped = np.array(np.ma.getdata(func(pha)), dtype=float)
+        num_fallback = np.sum(valid)
+    else:
+        if reference.shape != pha.shape:
+            raise ValueError("Shape mismatch: phase {}, reference {}!".format(
+                pha.shape, reference.shape))
+        delta = _wrap(pha - reference)
+        nans = np.isnan(delta)
+        delta[nans] = 0
+        local = ndimage.median_filter(delta, size=TEMPORAL_MEDIAN_SIZE)
+        unwrapped = reference + local + _wrap(delta - local)
+        unwrapped[~valid] = np.nan
+        flag = valid & (nans | (np.abs(local) > threshold))
+        # phase jumps indicate changes larger than π
+        smooth = ndimage.median_filter(np.where(valid, unwrapped, 0),
+                                       size=TEMPORAL_MEDIAN_SIZE)
+        smooth[~valid] = np.nan
+        for axis in [0, 1]:
+            jump = np.abs(np.diff(smooth, axis=axis)) > np.pi
+            if axis == 0:
+                flag[:-1] |= jump
+                flag[1:] |= jump
+            else:
+                flag[:, :-1] |= jump
+                flag[:, 1:] |= jump
+        num_fallback = 0
+        if np.any(flag):
+            grown = ndimage.maximum_filter(flag,
+                                           size=2 * TEMPORAL_MARGIN + 1)
+            labels, _ = ndimage.label(grown)
+            boxes = ndimage.find_objects(labels)
+            if np.sum([labels[box].size for box in boxes]) > pha.size / 2:
+                boxes = [(slice(None), slice(None))]
+            for box in boxes:
+                spatial = np.array(np.ma.getdata(func(pha[box])),
+                                   dtype=float)
+                # align with the remaining pixels
+                diff = (unwrapped[box] - spatial)[~flag[box]]
+                diff = diff[~np.isnan(diff)]
+                if diff.size:
+                    spatial += 2 * np.pi * np.round(
+                        np.median(diff) / (2 * np.pi))
+                unwrapped[box] = spatial
+                num_fallback += np.sum(valid[box])
+    if ret_fallback:
+        return unwrapped, int(num_fallback)
+    else:
+        return unwrapped
+
+
+def unwrap(pha, engine="skimage"):
+    """Unwrap a 2D phase image with the given engine"""
+    return get_engine(engine)(pha)
+
+
+def unwrap_if_wrapped(pha, engine="skimage"):
+    """Unwrap a 2D phase image only if it contains phase jumps
+
+    Returns
+    -------
+    unwrapped: 2d ndarray
+        Unwrapped phase (a copy of `pha` if it does not contain
+        phase jumps larger than π, see :func:`is_wrapped`)
+    applied: bool
+        Whether the unwrapping engine was applied
+    """
+    func = get_engine(engine)
+    _skip_stats["checked"] += 1
+    if is_wrapped(pha):
+        return func(pha), True
+    else:
+        _skip_stats["skipped"] += 1
+        return np.array(pha, dtype=float), False
+
+
+def _divergence(grads, weights=(None, None)):
+    """Divergence of the (weighted) phase gradients along both axes"""
+    div = np.zeros((grads[0].shape[0] + 1, grads[0].shape[1]),
+                   dtype=float)
+    for axis, (grad, weight) in enumerate(zip(grads, weights)):
+        if weight is not None:
+            grad = grad * weight
+        if axis == 0:
+            div[:-1] += grad
+            div[1:] -= grad
+        else:
+            div[:, :-1] += grad
+            div[:, 1:] -= grad
+    return div
+
+
+def _solve_poisson_dct(rho):
+    """Solve the Poisson equation with Neumann boundary conditions"""
+    rho_dct = dctn(rho, type=2, norm="ortho")
+    mm = np.arange(rho.shape[0]).reshape(-1, 1)
+    nn = np.arange(rho.shape[1]).reshape(1, -1)
+    denom = 2 * (np.cos(np.pi * mm / rho.shape[0])
+                 + np.cos(np.pi * nn / rho.shape[1]) - 2)
+    denom[0, 0] = 1
+    phi_dct = rho_dct / denom
+    phi_dct[0, 0] = 0
+    return idctn(phi_dct, type=2, norm="ortho")
+
+
+def _solve_poisson_pcg(rho, weights):
+    """Solve the weighted Poisson equation with preconditioned CG
+
+    The weighted Laplacian is negative semi-definite, so conjugate
+    gradients are applied to its negative.
+    """
+    def laplacian(phi):
+        return _divergence([np.diff(phi, axis=0), np.diff(phi, axis=1)],
+                           weights=weights)
+
+    phi = np.zeros(rho.shape, dtype=float)
+    res = -rho
+    norm = np.linalg.norm(rho)
+    if norm == 0:
+        return phi
+    zz = -_solve_poisson_dct(res)
+    pp = zz
+    rz = np.vdot(res, zz)
+    for _ in range(DCT_PCG_MAXITER):
+        qq = -laplacian(pp)
+        alpha = rz / np.vdot(pp, qq)
+        phi += alpha * pp
+        res -= alpha * qq
+        if np.linalg.norm(res) < DCT_PCG_RTOL * norm:
+            break
+        zz = -_solve_poisson_dct(res)
+        rz_new = np.vdot(res, zz)
+        pp = zz + rz_new / rz * pp
+        rz = rz_new
+    return phi
+
+
+def _wrap(pha):
+    """Wrap phase values to the interval [-π, π)"""
+    return (pha + np.pi) % (2 * np.pi) - np.pi
+
+
+#: registered phase unwrapping engines (see :func:`register_engine`)
+UNWRAP_ENGINES = {"dct": unwrap_dct,
+                  "none": unwrap_none,
+                  "skimage": unwrap_skimage,
+                  "tiled": unwrap_tiled,
+                  }
+
+#: statistics of :func:`unwrap_if_wrapped` (see :func:`skip_info`)
+_skip_stats = {"checked": 0,
+               "skipped": 0,
+               }
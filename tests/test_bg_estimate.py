@@ -31,6 +31,13 @@ def test_bg_estimate_errors():
     else:
         assert False, "offset cannot be fitted"
 
+    try:
+        bg_estimate.estimate(data, fit_engine="unknown")
+    except ValueError:
+        pass
+    else:
+        assert False, "unknown is not a valid engine"
+
 
 def test_mask():
     size = 200
@@ -133,6 +140,160 @@ def test_border_perc():
     assert not np.all(qpi.pha == data_px)
 
 
+def test_cache_info():
+    bg_estimate.cache_clear()
+    rsobj = np.random.RandomState(47)
+    data1 = rsobj.normal(size=(60, 60))
+    data2 = rsobj.normal(size=(60, 60))
+    mask = np.zeros(data1.shape, dtype=bool)
+    mask[:20] = True
+
+    bg1, mask1 = bg_estimate.estimate(data1, fit_profile="tilt",
+                                      border_px=5, ret_mask=True)
+    assert bg_estimate.cache_info().misses == 1
+    # same geometry with different data
+    bg2 = bg_estimate.estimate(data2, fit_profile="tilt", border_px=5)
+    info = bg_estimate.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+    assert info.currsize == 1
+    assert not np.allclose(bg1, bg2)
+    assert np.allclose(bg2, bg_estimate.estimate(data2, fit_profile="tilt",
+                                                 border_px=5,
+                                                 fit_engine="lmfit"))
+    # the returned mask must not be the cached (read-only) mask
+    mask1[:] = False
+    assert np.sum(bg_estimate.estimate(data2, border_px=5,
+                                       ret_mask=True)[1])
+
+    # different border, mask, or profile
+    bg_estimate.estimate(data1, fit_profile="tilt", border_px=6)
+    bg_estimate.estimate(data1, fit_profile="tilt", border_px=5,
+                         from_mask=mask)
+    mask[-1] = True
+    bg_estimate.estimate(data1, fit_profile="tilt", border_px=5,
+                         from_mask=mask)
+    bg_estimate.estimate(data1, fit_profile="poly2o", border_px=5)
+    info = bg_estimate.cache_info()
+    assert info.misses == 5
+    assert info.currsize == 5
+
+    bg_estimate.cache_clear()
+    assert bg_estimate.cache_info() == (0, 0, bg_estimate.CACHE_MAXSIZE, 0)
+
+
+def test_estimate_stack():
+    size = 50
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rsobj = np.random.RandomState(47)
+    data3d = np.array([.1 * ii + .01 * ii * x - .02 * y + 1e-3 * x * y
+                       + rsobj.normal(scale=.05, size=(size, size))
+                       for ii in range(4)])
+    masks = rsobj.rand(*data3d.shape) > .3
+    for fit_profile in ["offset", "tilt", "poly2o"]:
+        for fit_offset in ["fit", "mean"]:
+            if fit_profile == "offset" and fit_offset == "fit":
+                continue
+            for from_mask in [None, masks[0], masks]:
+                bgs, mask = bg_estimate.estimate_stack(
+                    data3d=data3d,
+                    fit_offset=fit_offset,
+                    fit_profile=fit_profile,
+                    border_px=8,
+                    from_mask=from_mask,
+                    ret_mask=True)
+                assert bgs.shape == data3d.shape
+                for ii in range(len(data3d)):
+                    if from_mask is not None and from_mask.ndim == 3:
+                        frmask = from_mask[ii]
+                        frmask_out = mask[ii]
+                    else:
+                        frmask = from_mask
+                        frmask_out = mask
+                    bgi, maski = bg_estimate.estimate(
+                        data=data3d[ii],
+                        fit_offset=fit_offset,
+                        fit_profile=fit_profile,
+                        border_px=8,
+                        from_mask=frmask,
+                        ret_mask=True)
+                    assert np.allclose(bgs[ii], bgi, atol=1e-12, rtol=0)
+                    assert np.all(frmask_out == maski)
+
+
+def test_fit_engine():
+    size = 120
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rsobj = np.random.RandomState(42)
+    data = .3 + .01 * x - .02 * y + 1e-4 * x * y - 2e-4 * x**2 \
+        + rsobj.normal(scale=.05, size=(size, size))
+    for fit_profile in ["tilt", "poly2o"]:
+        for fit_offset in ["fit", "mean"]:
+            bg_lin = bg_estimate.estimate(data=data,
+                                          fit_offset=fit_offset,
+                                          fit_profile=fit_profile,
+                                          border_px=10,
+                                          fit_engine="linear")
+            bg_lmf = bg_estimate.estimate(data=data,
+                                          fit_offset=fit_offset,
+                                          fit_profile=fit_profile,
+                                          border_px=10,
+                                          fit_engine="lmfit")
+            assert np.allclose(bg_lin, bg_lmf, atol=1e-7, rtol=0)
+
+
+def test_fit_nan():
+    size = 60
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rsobj = np.random.RandomState(42)
+    data = .3 + .01 * x - .02 * y \
+        + rsobj.normal(scale=.05, size=(size, size))
+    nandata = data.copy()
+    nandata[2, 3:9] = np.nan
+    nandata[50, 55] = np.inf
+    finite = np.isfinite(nandata)
+    bg_estimate.cache_clear()
+    bg_estimate.estimate(data=nandata, fit_profile="tilt", border_px=10)
+    # only the geometry without the non-finite pixels is cached
+    assert bg_estimate.cache_info().currsize == 1
+    for fit_engine in ["linear", "lmfit"]:
+        bg, mask = bg_estimate.estimate(data=nandata,
+                                        fit_profile="tilt",
+                                        border_px=10,
+                                        fit_engine=fit_engine,
+                                        ret_mask=True)
+        assert np.all(np.isfinite(bg))
+        assert not np.any(mask[~finite])
+        # same as fitting the finite pixels
+        bg_ref = bg_estimate.estimate(data=data,
+                                      fit_profile="tilt",
+                                      from_mask=finite,
+                                      border_px=10,
+                                      fit_engine=fit_engine)
+        assert np.allclose(bg, bg_ref, atol=1e-12, rtol=0)
+    # stacks are fitted image by image
+    data3d = np.array([data, nandata])
+    bgs, masks = bg_estimate.estimate_stack(data3d=data3d,
+                                            fit_profile="tilt",
+                                            border_px=10,
+                                            ret_mask=True)
+    assert np.all(np.isfinite(bgs))
+    assert masks.shape == data3d.shape
+    assert not np.any(masks[1][~finite])
+    assert np.allclose(bgs[1], bg, atol=1e-12, rtol=0)
+    # no finite pixels
+    try:
+        bg_estimate.estimate(data=np.full((size, size), np.nan),
+                             border_px=10)
+    except ValueError:
+        pass
+    else:
+        assert False, "background region without finite pixels"
+
+
 def test_get_mask():
     size = 200
     data = np.zeros((size, size), dtype=float)
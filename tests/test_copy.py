@@ -47,6 +47,81 @@ def test_qpimage_copy_to_file():
         pass
 
 
+def test_copyh5_convert():
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    qpimage.core.copyh5(inh5=h5file, outh5=tf, compression="fast",
+                        chunks=(10, 20))
+    with h5py.File(h5file, "r") as h5a, h5py.File(tf, "r") as h5b:
+        assert h5a["phase/raw"].compression is None
+        assert h5b["phase/raw"].compression == "lzf"
+        assert h5b["phase/raw"].chunks == (10, 20)
+        assert np.all(h5a["phase/raw"][:] == h5b["phase/raw"][:])
+
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_copyh5_hardlinks():
+    size = 50
+    pha = np.linspace(0, 1, size**2).reshape(size, size)
+    qpi1 = qpimage.QPImage(data=pha, bg_data=pha / 2, which_data="phase")
+    qpi2 = qpimage.QPImage(data=pha, which_data="phase")
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(h5file=tf, h5mode="w") as qps:
+        qps.add_qpimage(qpi1)
+        qps.add_qpimage(qpi2, bg_from_idx=0)
+    tf2 = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    qpimage.core.copyh5(inh5=tf, outh5=tf2)
+    with h5py.File(tf2, "r") as h5:
+        bg0 = h5["qpi_0/phase/bg_data/data"]
+        bg1 = h5["qpi_1/phase/bg_data/data"]
+        assert bg0.id == bg1.id
+        assert h5py.h5o.get_info(bg0.id).rc == 2
+    # also when converting the data
+    tf3 = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    qpimage.core.copyh5(inh5=tf, outh5=tf3, compression="fast")
+    with h5py.File(tf3, "r") as h5:
+        bg0 = h5["qpi_0/phase/bg_data/data"]
+        assert bg0.compression == "lzf"
+        assert bg0.id == h5["qpi_1/phase/bg_data/data"].id
+
+    for path in [tf, tf2, tf3]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def test_copyh5_native():
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("Data must not be decoded!")
+
+    getitem = h5py.Dataset.__getitem__
+    h5py.Dataset.__getitem__ = no_read
+    try:
+        qpimage.core.copyh5(inh5=h5file, outh5=tf)
+    finally:
+        h5py.Dataset.__getitem__ = getitem
+
+    with h5py.File(h5file, "r") as h5a, h5py.File(tf, "r") as h5b:
+        for key in ["amplitude/raw", "phase/raw", "phase/bg_data/fit"]:
+            assert h5a[key].chunks == h5b[key].chunks
+            assert h5a[key].compression == h5b[key].compression
+            assert np.all(h5a[key][:] == h5b[key][:])
+            assert dict(h5a[key].attrs) == dict(h5b[key].attrs)
+
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
 def test_qpimage_copy_method():
     h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
     tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
@@ -1,4 +1,8 @@
+import tempfile
+
+import h5py
 import numpy as np
+import pytest
 
 import qpimage  # noqa: E402
 
@@ -32,6 +36,72 @@ def test_clear_bg():
     qpi.clear_bg(which_data="phase", keys="data")
 
 
+def test_cache():
+    size = 50
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    bg_pha = .1 * pha
+    qpi = qpimage.QPImage(data=pha, bg_data=bg_pha, which_data="phase")
+    pha1 = qpi.pha
+    field1 = qpi.field
+    assert qpi._cache.nbytes > 0
+    # returned arrays are writable copies
+    pha1[:] = 0
+    field1[:] = 0
+    assert np.allclose(qpi.pha, .9 * pha, atol=1e-5)
+    assert np.allclose(qpi.field, np.exp(1j * .9 * pha), atol=1e-5)
+    # modifications invalidate the cache
+    version = qpi._pha._version
+    qpi.compute_bg(which_data="phase", fit_profile="tilt", border_px=5)
+    assert qpi._pha._version > version
+    assert np.allclose(qpi.pha, 0, atol=1e-5)
+    assert np.allclose(qpi.field, 1, atol=1e-5)
+    qpi.clear_bg(which_data="phase", keys="fit")
+    assert np.allclose(qpi.pha, .9 * pha, atol=1e-5)
+    qpi.set_bg_data(None)
+    assert np.allclose(qpi.pha, pha, atol=1e-5)
+    assert np.allclose(qpi.bg_pha, 0)
+    qpi._pha["raw"] = 2 * pha
+    assert np.allclose(qpi.pha, 2 * pha, atol=1e-5)
+
+
+def test_cache_limit():
+    size = 50
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpi = qpimage.QPImage(data=pha, which_data="phase", cache_limit=0)
+    assert np.allclose(qpi.pha, pha, atol=1e-5)
+    assert qpi._cache.nbytes == 0
+    # one float64 image
+    qpi2 = qpimage.QPImage(data=pha, which_data="phase",
+                           cache_limit=size**2 * 8)
+    qpi2.pha
+    assert qpi2._cache.nbytes == size**2 * 8
+    assert qpi2.copy()._cache.limit == size**2 * 8
+    # arrays that are too large for the cache stay writable
+    arr = np.zeros((size, size))
+    qpi._cache.set("key", 0, arr)
+    assert arr.flags.writeable
+
+
+def test_cache_limit_shared():
+    size = 50
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    limit = qpimage.image_data.CACHE_LIMIT
+    # three float64 images (phase image and background of one QPImage)
+    qpimage.image_data.CACHE_LIMIT = 3 * size**2 * 8
+    try:
+        qpis = [qpimage.QPImage(data=pha, which_data="phase")
+                for _ in range(5)]
+        for qpi in qpis:
+            qpi.pha
+        assert sum(qpi._cache.nbytes for qpi in qpis) <= 3 * size**2 * 8
+        # the least recently used entries were removed
+        assert qpis[0]._cache.nbytes == 0
+        assert qpis[-1]._cache.nbytes == 2 * size**2 * 8
+        assert np.allclose(qpis[0].pha, pha, atol=1e-5)
+    finally:
+        qpimage.image_data.CACHE_LIMIT = limit
+
+
 def test_clear_bg_error():
     size = 50
     pha = np.repeat(np.linspace(0, 10, size), size)
@@ -189,6 +259,31 @@ def test_get_amp_pha_unrwap_disabled():
     assert np.allclose(qpi.pha, phastep)
 
 
+def test_metadata_no_image_reads():
+    size = 50
+    pha = np.repeat(np.linspace(0, 1, size), size).reshape(size, size)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPImage(data=pha, which_data="phase", h5file=tf,
+                         meta_data={"wavelength": 550e-9}) as qpi:
+        qpi.compute_bg(which_data="phase", fit_profile="tilt",
+                       border_px=5)
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("Image data must not be read!")
+
+    getitem = h5py.Dataset.__getitem__
+    h5py.Dataset.__getitem__ = no_read
+    try:
+        with qpimage.QPImage(h5file=tf, h5mode="r") as qpi:
+            assert repr(qpi).count("50x50px")
+            assert repr(qpi._pha).count("50x50px")
+            assert qpi.shape == (size, size)
+            assert qpi.size == size**2
+            assert qpi.dtype == np.dtype("float32")
+    finally:
+        h5py.Dataset.__getitem__ = getitem
+
+
 def test_properties():
     size = 50
     pha = np.repeat(np.linspace(0, 10, size), size)
@@ -220,6 +315,92 @@ def test_properties():
     assert not np.all(qpi.bg_pha == bg_pha)
 
 
+def test_roi():
+    size = 50
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    pha = .01 * x**2 - .02 * y + np.sin(x * y / 40)
+    amp = np.linspace(.95, 1.05, size**2).reshape(size, size)
+    bg_amp = np.zeros_like(pha) + np.linspace(1.1, .99, size).reshape(-1, 1)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPImage(data=[pha, amp], bg_data=[np.zeros_like(pha), bg_amp],
+                         which_data="phase,amplitude", h5file=tf,
+                         meta_data={"wavelength": 500e-9}) as qpi:
+        qpi.compute_bg(which_data="phase", fit_profile="poly2o",
+                       fit_offset="fit", border_px=5, fit_storage="params")
+        ref_pha = qpi.pha
+        ref_bg_pha = qpi.bg_pha
+        ref_amp = qpi.amp
+
+    given = np.s_[10:30:2, 25:]
+    getitem = h5py.Dataset.__getitem__
+
+    def checked_getitem(self, args, *kwargs):
+        assert args == (slice(10, 30, 2), slice(25, 50, 1)), \
+            "Only the region must be read from '{}'".format(self.name)
+        return getitem(self, args, *kwargs)
+
+    h5py.Dataset.__getitem__ = checked_getitem
+    try:
+        with qpimage.QPImage(h5file=tf, h5mode="r") as qpi:
+            roi = qpi.roi(given)
+            assert roi.shape == (10, 25)
+            assert np.allclose(roi.pha, ref_pha[given])
+            assert np.allclose(roi.bg_pha, ref_bg_pha[given])
+            assert np.allclose(roi.amp, ref_amp[given])
+            assert np.allclose(roi.bg_amp, bg_amp[given])
+            assert np.allclose(roi.raw_pha, pha[given])
+            assert np.allclose(roi.field,
+                               ref_amp[given] * np.exp(1j * ref_pha[given]))
+            qpic = roi.materialize()
+    finally:
+        h5py.Dataset.__getitem__ = getitem
+    assert qpic.shape == (10, 25)
+    # float32 storage of raw and background data
+    assert np.allclose(qpic.pha, ref_pha[given], atol=1e-6)
+    assert np.allclose(qpic.amp, ref_amp[given], atol=1e-6)
+    assert qpic["wavelength"] == 500e-9
+    # region of the cached background
+    qpi = qpimage.QPImage(data=pha, bg_data=pha / 2, which_data="phase")
+    qpi.bg_pha
+    bg_roi = qpi.roi(given).bg_pha
+    bg_roi += 1
+    assert np.allclose(qpi.bg_pha, pha / 2)
+
+
+def test_roi_error():
+    qpi = qpimage.QPImage(data=np.zeros((20, 20)), which_data="phase")
+    try:
+        qpi.roi(np.s_[::-1])
+    except ValueError:
+        pass
+    else:
+        assert False, "negative steps not supported"
+    try:
+        qpi.roi((slice(2), slice(2), slice(2)))
+    except ValueError:
+        pass
+    else:
+        assert False, "only two axes"
+
+
+def test_processed_bg_data_qpimage():
+    size = 200
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    disk = 1.5 * ((x - size / 2)**2 + (y - size / 2)**2 < 30**2)
+    holo = np.sin(-.6 * x - .4 * y + disk)
+    ref = np.sin(-.6 * x - .4 * y + .01 * x)
+    qpi1 = qpimage.QPImage(holo, bg_data=ref, which_data="raw-oah")
+    bg_qpi = qpimage.QPImage(ref, which_data="raw-oah")
+    qpi2 = qpimage.QPImage(holo, bg_data=bg_qpi, which_data="raw-oah")
+    assert np.allclose(qpi1.bg_pha, qpi2.bg_pha)
+    assert np.allclose(qpi1.pha, qpi2.pha)
+    assert np.allclose(qpi1.amp, qpi2.amp)
+    with pytest.raises(ValueError, match="raw-qlsi"):
+        qpimage.QPImage(holo, bg_data=bg_qpi, which_data="raw-qlsi")
+
+
 def test_set_bg_data_qpimage():
     size = 20
     pha = np.repeat(np.linspace(0, 10, size), size)
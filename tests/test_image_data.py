@@ -1,9 +1,13 @@
+import tempfile
 import warnings
 
+import h5py
 import numpy as np
 
 import qpimage
+import qpimage.core
 import qpimage.image_data
+import qpimage.integrity_check
 
 
 def test_bad_keys_error():
@@ -36,6 +40,135 @@ def test_bad_keys_error():
         assert False
 
 
+def test_chunks():
+    data = np.zeros((600, 300), dtype=float)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with h5py.File(tf, "w") as h5:
+        wid = qpimage.image_data.write_image_dataset
+        assert wid(h5, "full", data).chunks == (600, 300)
+        assert wid(h5, "tiles", data, chunks="tiles").chunks == (256, 256)
+        assert wid(h5, "tuple", data, chunks=(64, 32)).chunks == (64, 32)
+        assert wid(h5, "int", data, chunks=400).chunks == (400, 300)
+        # 600 * 300 * 8 bytes > CHUNK_AUTO_LIMIT
+        assert wid(h5, "auto", data, chunks="auto").chunks == (256, 256)
+        assert wid(h5, "auto32", data, h5dtype="float32",
+                   chunks="auto").chunks == (600, 300)
+
+
+def test_chunks_error():
+    for chunks in ["tile", (1, 2, 3), 0]:
+        try:
+            qpimage.image_data.check_chunks(chunks)
+        except ValueError:
+            pass
+        else:
+            assert False, "invalid chunks: {}".format(chunks)
+
+
+def test_chunks_qpimage():
+    size = 300
+    pha = np.linspace(0, 1, size**2).reshape(size, size)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPImage(data=pha, which_data="phase", h5file=tf,
+                         h5chunks=(100, 50)) as qpi:
+        assert qpi.h5["phase/raw"].chunks == (100, 50)
+    # layout is recorded in the file and used for new data
+    with qpimage.QPImage(h5file=tf) as qpi:
+        assert qpi._pha.chunks == (100, 50)
+        qpi.compute_bg(which_data="phase", fit_profile="tilt",
+                       border_px=10)
+        assert qpi.h5["phase/bg_data/fit"].chunks == (100, 50)
+        # copies keep the layout (also via memory)
+        tf2 = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpi.copy().copy(h5file=tf2) as qpi2:
+            assert qpi2.h5["phase/raw"].chunks == (100, 50)
+        # unless requested otherwise
+        with qpi.copy(h5file=tf2, h5chunks="full") as qpi3:
+            assert qpi3.h5["amplitude/raw"].chunks == (size, size)
+            assert qpi3.h5["phase"].attrs["chunk_layout"] == "full"
+    # series
+    qpi4 = qpimage.QPImage(data=pha, which_data="phase")
+    with qpimage.QPSeries(h5file=tf, h5mode="w", h5chunks="tiles") as qps:
+        qps.add_qpimage(qpi4)
+        assert qps[0].h5["phase/raw"].chunks == (256, 256)
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert qps.h5chunks == "tiles"
+
+
+def test_compression():
+    data = np.linspace(0, 1, 200**2).reshape(200, 200)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with h5py.File(tf, "w") as h5:
+        wid = qpimage.image_data.write_image_dataset
+        dset = wid(h5, "archive", data)
+        assert dset.compression == "gzip"
+        assert dset.compression_opts == 9
+        assert dset.fletcher32
+        dset = wid(h5, "fast", data, compression="fast")
+        assert dset.compression == "lzf"
+        assert dset.fletcher32
+        dset = wid(h5, "none", data, compression="none")
+        assert dset.compression is None
+        assert not dset.fletcher32
+        dset = wid(h5, "dict", data,
+                   compression={"compression": "gzip", "compression_opts": 1})
+        assert dset.compression_opts == 1
+        assert np.all(h5["fast"][:] == data)
+
+
+def test_compression_error():
+    cc = qpimage.image_data.check_compression
+    assert cc("fast") == {"raw": "fast", "bg": "fast", "mask": "fast"}
+    assert cc({"bg": "none"}) == {"raw": "archive", "bg": "none",
+                                  "mask": "archive"}
+    for compression in ["gzip", {"raw": "lzf"}, {"image": "fast"}]:
+        try:
+            cc(compression)
+        except ValueError:
+            pass
+        else:
+            assert False, "invalid compression: {}".format(compression)
+
+
+def test_compression_qpimage():
+    size = 100
+    pha = np.linspace(0, 1, size**2).reshape(size, size)
+    mask = np.zeros((size, size), dtype=bool)
+    mask[:10] = True
+    profiles = {"raw": "fast", "bg": "none", "mask": "archive"}
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPImage(data=pha, which_data="phase", h5file=tf,
+                         h5compression=profiles) as qpi:
+        assert qpi.h5["phase/raw"].compression == "lzf"
+    # profiles are recorded in the file and used for new data
+    with qpimage.QPImage(h5file=tf) as qpi:
+        assert qpi._pha.compression == profiles
+        qpi.compute_bg(which_data="phase", fit_profile="tilt",
+                       from_mask=mask)
+        assert qpi.h5["phase/bg_data/fit"].compression is None
+        assert qpi.h5["phase/estimate_bg_from_mask"].compression == "gzip"
+        # copies keep the profiles (also via memory)
+        tf2 = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpi.copy().copy(h5file=tf2) as qpi2:
+            assert qpi2.h5["phase/raw"].compression == "lzf"
+            assert qpi2.h5["phase/bg_data/fit"].compression is None
+        # unless requested otherwise
+        with qpi.copy(h5file=tf2, h5compression="none") as qpi3:
+            assert qpi3.h5["phase/raw"].compression is None
+            assert qpi3.h5["phase"].attrs["compression_raw"] == "none"
+        # copyh5 keeps the filters by default
+        qpimage.core.copyh5(qpi.h5, tf2)
+        with h5py.File(tf2, "r") as h5:
+            assert h5["phase/raw"].compression == "lzf"
+    # series
+    qpi4 = qpimage.QPImage(data=pha, which_data="phase")
+    with qpimage.QPSeries(h5file=tf, h5mode="w", h5compression="fast") as qps:
+        qps.add_qpimage(qpi4)
+        assert qps[0].h5["phase/raw"].compression == "lzf"
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert qps.h5compression["bg"] == "fast"
+
+
 def test_del_warning():
     size = 50
     data = np.zeros((size, size), dtype=float)
@@ -51,6 +184,45 @@ def test_del_warning():
         assert msg.lower().count("no bg data")
 
 
+def test_fit_storage_params():
+    size = 50
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rsobj = np.random.RandomState(47)
+    phase = .3 + .02 * x - .01 * y + 1e-3 * x * y \
+        + rsobj.normal(scale=.01, size=(size, size))
+    amplitude = 1.1 + .001 * x + .002 * y
+    for fit_profile in ["offset", "tilt", "poly2o"]:
+        qpi_img = qpimage.QPImage(data=(phase, amplitude),
+                                  which_data="phase,amplitude")
+        qpi_img.compute_bg(which_data="phase,amplitude",
+                           fit_profile=fit_profile,
+                           border_px=5)
+        tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpimage.QPImage(data=(phase, amplitude),
+                             which_data="phase,amplitude",
+                             h5file=tf, h5mode="w") as qpi_par:
+            qpi_par.compute_bg(which_data="phase,amplitude",
+                               fit_profile=fit_profile,
+                               border_px=5,
+                               fit_storage="params")
+            dset = qpi_par.h5["phase/bg_data/fit"]
+            assert dset.shape is None
+            assert dset.attrs["model"] == fit_profile
+            assert np.allclose(qpi_par.pha, qpi_img.pha, atol=1e-6, rtol=0)
+            assert np.allclose(qpi_par.amp, qpi_img.amp, atol=1e-6, rtol=0)
+            info = dict(qpi_par.info)
+            assert info["phase background model"] == fit_profile
+            qpimage.integrity_check.check(qpi_par, checks="background")
+            qpi_cp = qpi_par.copy()
+        assert np.allclose(qpi_cp.bg_pha, qpi_img.bg_pha, atol=1e-6, rtol=0)
+        # reopen file
+        with h5py.File(tf, "r") as h5:
+            qpi_ro = qpimage.QPImage(h5file=h5)
+            assert np.allclose(qpi_ro._pha.get_bg("fit"),
+                               qpi_img._pha.get_bg("fit"))
+
+
 def test_get_bg():
     size = 200
     phase = np.repeat(np.linspace(0, np.pi, size), size)
@@ -94,6 +266,16 @@ def test_set_bg():
     assert not np.all(pha == clspha.image)
 
 
+def test_fit_storage_error():
+    qpi = qpimage.QPImage(np.zeros((20, 20)), which_data="phase")
+    try:
+        qpi.compute_bg(border_px=2, fit_storage="peter")
+    except ValueError:
+        pass
+    else:
+        assert False, "invalid fit storage"
+
+
 def test_set_bg_error():
     size = 200
     phase = np.repeat(np.linspace(0, np.pi, size), size)
@@ -0,0 +1,163 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+import qpimage
+import qpimage.ingest
+import qpimage.oah
+import qpimage.unwrap
+
+
+def hologram(disk_max, size=200):
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    kx = -.6
+    ky = -.4
+    # there is a phase disk as data in the hologram
+    data = disk_max * ((x - size / 2)**2 + (y - size / 2)**2 < 30**2)
+    return np.sin(kx * x + ky * y + data)
+
+
+def hologram_stream(num):
+    for ii in range(num):
+        yield hologram(1 + ii / 10), {"identifier": "holo_{}".format(ii)}
+
+
+def test_ingest_oah():
+    qps = qpimage.QPSeries()
+    stats = qpimage.ingest.ingest(
+        frames=hologram_stream(4),
+        series=qps,
+        meta_data={"wavelength": 550e-9},
+        qpretrieve_kw={"filter_name": "gauss"},
+        compute_bg_kw={"which_data": "phase",
+                       "fit_offset": "fit",
+                       "fit_profile": "tilt",
+                       "border_px": 5},
+        workers=2,
+        queue_size=2)
+    assert stats["frames"] == 4
+    assert stats["throughput"] > 0
+    assert stats["latency max"] >= stats["latency median"] > 0
+    assert len(qps) == 4
+    for ii in range(4):
+        qpi = qps["holo_{}".format(ii)]
+        assert qpi["wavelength"] == 550e-9
+        assert np.allclose(1 + ii / 10, qpi.pha.max(), rtol=.01, atol=0)
+        ref = qpimage.QPImage(hologram(1 + ii / 10),
+                              which_data="raw-oah",
+                              qpretrieve_kw={"filter_name": "gauss"})
+        ref.compute_bg(which_data="phase", fit_offset="fit",
+                       fit_profile="tilt", border_px=5)
+        assert np.allclose(qpi.pha, ref.pha, atol=1e-6)
+
+
+def test_ingest_shared_bg():
+    ref = hologram(0)
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    for bg_data, workers in [(ref, 2),
+                             (qpimage.QPImage(ref, which_data="raw-oah"), 1)]:
+        stats = qpimage.ingest.ingest(
+            frames=hologram_stream(3),
+            series=tf,
+            bg_data=bg_data,
+            compute_bg_kw={"which_data": "phase",
+                           "fit_offset": "mean",
+                           "fit_profile": "tilt",
+                           "border_px": 5},
+            workers=workers)
+        assert stats["frames"] == 3
+        with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+            bgid = qps.h5["qpi_0/phase/bg_data/data"].id
+            for ii in range(3):
+                assert qps.h5["qpi_{}/phase/bg_data/data".format(ii)].id \
+                    == bgid
+                qpi = qps[ii]
+                holo = hologram(1 + ii / 10)
+                ctx = qpimage.oah.OAHContext.from_hologram(holo)
+                expected = qpimage.QPImage(holo, bg_data=ref,
+                                           which_data="raw-oah",
+                                           oah_context=ctx)
+                expected.compute_bg(which_data="phase", fit_offset="mean",
+                                    fit_profile="tilt", border_px=5)
+                assert np.allclose(qpi.pha, expected.pha, atol=1e-6)
+        os.remove(tf)
+
+
+def test_ingest_path_serial():
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    frames = [np.full((20, 20), ii, dtype=float) for ii in range(5)]
+    stats = qpimage.ingest.ingest(frames=frames,
+                                  series=tf,
+                                  which_data="phase",
+                                  proc_phase=False,
+                                  workers=1,
+                                  queue_size=1)
+    assert stats["frames"] == 5
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert len(qps) == 5
+        assert np.all(qps.pha_stack[:, 0, 0] == np.arange(5))
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_ingest_error():
+    qps = qpimage.QPSeries()
+    frames = [np.zeros((10, 10)), np.zeros((0, 10)), np.zeros((10, 10))]
+    with pytest.raises(ValueError, match="zero size"):
+        qpimage.ingest.ingest(frames=frames, series=qps,
+                              which_data="phase", workers=1)
+    assert len(qps) == 1
+
+
+def test_ingest_unwrap_skipped():
+    qps = qpimage.QPSeries()
+    frames = [np.full((20, 20), .5), np.tile([0, 3, 6], (20, 7))]
+    stats = qpimage.ingest.ingest(frames=frames, series=qps,
+                                  which_data="phase", workers=1)
+    assert stats["unwrap skipped"] == 1
+    assert not qps[0]._pha.h5.attrs[qpimage.unwrap.UNWRAP_ATTR]
+    assert qps[1]._pha.h5.attrs[qpimage.unwrap.UNWRAP_ATTR]
+
+
+def test_ingest_temporal():
+    x = np.linspace(-1, 1, 80).reshape(-1, 1)
+    y = np.linspace(-1, 1, 90).reshape(1, -1)
+    frames = []
+    for ii in range(6):
+        pha = 20 * np.exp(-((x - ii * .02)**2 + y**2) / .3) + 2 * x
+        frames.append(np.angle(np.exp(1j * pha)))
+    bg = np.angle(np.exp(1j * (5 * y)))
+    kw = {"which_data": "phase",
+          "bg_data": bg,
+          "compute_bg_kw": {"which_data": "phase",
+                            "fit_offset": "mean",
+                            "fit_profile": "tilt",
+                            "border_px": 5},
+          "workers": 1}
+    qps1 = qpimage.QPSeries()
+    stats = qpimage.ingest.ingest(frames=frames, series=qps1,
+                                  temporal_unwrap=True, **kw)
+    assert stats["temporal fallback"] < .2
+    qps2 = qpimage.QPSeries()
+    stats = qpimage.ingest.ingest(frames=frames, series=qps2, **kw)
+    assert np.isnan(stats["temporal fallback"])
+    for ii in range(6):
+        assert np.allclose(qps1[ii].pha, qps2[ii].pha, atol=1e-5)
+        assert np.allclose(qps1[ii].bg_pha, qps2[ii].bg_pha, atol=1e-5)
+    with pytest.raises(ValueError, match="requires `proc_phase`"):
+        qpimage.ingest.ingest(frames=frames, series=qps1,
+                              temporal_unwrap=True, proc_phase=False, **kw)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    _loc = locals()
+    for _key in list(_loc.keys()):
+        if _key.startswith("test_") and hasattr(_loc[_key], "__call__"):
+            _loc[_key]()
@@ -0,0 +1,105 @@
+import pathlib
+import tempfile
+
+import h5py
+import numpy as np
+import pytest
+
+import qpimage
+from qpimage.memory import MemoryDataset, MemoryGroup
+
+
+def test_memory_default_backend():
+    size = 20
+    pha = np.repeat(np.linspace(0, 1, size), size).reshape(size, size)
+    qpi = qpimage.QPImage(data=pha, which_data="phase",
+                          meta_data={"wavelength": 550e-9})
+    assert isinstance(qpi.h5, MemoryGroup)
+    assert isinstance(qpi.h5["phase/raw"], MemoryDataset)
+    assert qpi.h5["phase/raw"].dtype == np.dtype("float32")
+    assert np.allclose(qpi.pha, pha)
+    qpi.compute_bg(which_data="phase", fit_profile="tilt",
+                   fit_offset="mean", border_px=2)
+    assert np.allclose(qpi.pha, 0, atol=1e-6)
+    assert qpi["wavelength"] == 550e-9
+
+
+def test_memory_copy_to_file():
+    size = 20
+    pha = np.repeat(np.linspace(0, 1, size), size).reshape(size, size)
+    qpi = qpimage.QPImage(data=pha, which_data="phase",
+                          meta_data={"wavelength": 550e-9})
+    qpi.compute_bg(which_data="phase", fit_profile="tilt",
+                   fit_offset="mean", border_px=2, fit_storage="params")
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpi.copy(h5file=tf) as qpi2:
+        assert isinstance(qpi2.h5, h5py.File)
+        assert np.allclose(qpi2.pha, qpi.pha)
+        assert qpi2.meta == qpi.meta
+        assert np.allclose(qpi2.bg_pha, qpi.bg_pha)
+    # and back into memory
+    with qpimage.QPImage(h5file=tf, h5mode="r") as qpi3:
+        qpi4 = qpi3.copy()
+        assert isinstance(qpi4.h5, MemoryGroup)
+        assert np.allclose(qpi4.pha, qpi.pha)
+        assert np.allclose(qpi4.bg_pha, qpi.bg_pha)
+
+
+def test_memory_file_roundtrip_bg_tilt():
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    with qpimage.QPImage(h5file=h5file, h5mode="r") as qpi:
+        qpi2 = qpi.copy()
+        assert np.allclose(qpi.pha, qpi2.pha)
+        assert np.allclose(qpi.bg_pha, qpi2.bg_pha)
+        assert qpi.info == qpi2.info
+
+
+def test_memory_group():
+    h5 = MemoryGroup()
+    grp = h5.create_group("phase")
+    grp.create_dataset("raw", data=np.arange(6).reshape(2, 3),
+                       dtype="float32")
+    assert "phase/raw" in h5
+    assert "phase/bg" not in h5
+    assert h5["phase/raw"].name == "/phase/raw"
+    assert h5["phase/raw"].shape == (2, 3)
+    assert h5["phase/raw"][1, 2] == 5
+    # returned data are copies
+    data = h5["phase/raw"][:]
+    data[:] = 0
+    assert h5["phase/raw"][1, 2] == 5
+    # hard links
+    h5["phase/link"] = h5["phase/raw"]
+    assert h5["phase/link"] is h5["phase/raw"]
+    with pytest.raises(ValueError, match="exists"):
+        h5["phase/raw"] = np.zeros(2)
+    del h5["phase/raw"]
+    assert "phase/raw" not in h5
+    assert "phase/link" in h5
+    with pytest.raises(KeyError, match="not found"):
+        h5["amplitude/raw"]
+    assert h5.require_group("phase") is grp
+
+
+def test_memory_group_attrs():
+    h5 = MemoryGroup()
+    h5.attrs["b"] = 1
+    h5.attrs["a"] = "text"
+    assert list(h5.attrs) == ["a", "b"]
+    assert isinstance(h5.attrs["b"], np.integer)
+    assert h5.attrs["a"] == "text"
+
+
+def test_memory_empty_dataset():
+    h5 = MemoryGroup()
+    dset = h5.create_dataset("fit", data=h5py.Empty("float64"))
+    assert dset.shape is None
+    assert isinstance(dset[()], h5py.Empty)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
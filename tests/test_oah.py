@@ -0,0 +1,98 @@
+import pickle
+
+import numpy as np
+import pytest
+import qpretrieve
+
+import qpimage
+from qpimage.oah import OAHContext
+
+
+def hologram(disk_max=1.5, size=200, shape=None):
+    if shape is None:
+        shape = (size, size)
+    x = np.arange(shape[0]).reshape(-1, 1)
+    y = np.arange(shape[1]).reshape(1, -1)
+    kx = -.6
+    ky = -.4
+    # there is a phase disk as data in the hologram
+    data = disk_max * ((x - shape[0] / 2)**2 + (y - shape[1] / 2)**2
+                       < 30**2)
+    return np.sin(kx * x + ky * y + data)
+
+
+def test_oah_context():
+    kw = {"filter_name": "gauss"}
+    ctx = OAHContext.from_hologram(hologram(), qpretrieve_kw=kw)
+    geom = ctx.geometry((200, 200))
+    assert geom is not None
+    assert ctx.geometry((100, 100)) is None
+    for disk_max in [1.0, 1.5, 2.0]:
+        holo = hologram(disk_max=disk_max)
+        qpi = qpimage.QPImage(holo, which_data="raw-oah", oah_context=ctx)
+        ref = qpimage.QPImage(holo, which_data="raw-oah", qpretrieve_kw=kw)
+        assert np.allclose(qpi.pha, ref.pha)
+        assert np.allclose(qpi.amp, ref.amp)
+    # the sideband is not searched again
+    assert ctx.geometry((200, 200)) == geom
+    # other shapes
+    holo = hologram(shape=(180, 220))
+    qpi = qpimage.QPImage(holo, which_data="raw-oah", oah_context=ctx)
+    ref = qpimage.QPImage(holo, which_data="raw-oah", qpretrieve_kw=kw)
+    assert np.allclose(qpi.pha, ref.pha)
+    assert ctx.geometry((180, 220)) is not None
+
+
+def test_oah_context_explicit_sideband():
+    holo = hologram()
+    ref = qpimage.QPImage(holo, which_data="raw-oah")
+    freq = OAHContext.from_hologram(holo).geometry(
+        holo.shape)["sideband_freq"]
+    ctx = OAHContext(qpretrieve_kw={"sideband_freq": freq})
+    qpi = qpimage.QPImage(holo, which_data="raw-oah", oah_context=ctx)
+    assert np.allclose(qpi.pha, ref.pha)
+    assert ctx.geometry(holo.shape)["sideband_freq"] == tuple(freq)
+
+
+def test_oah_context_error():
+    with pytest.raises(ValueError, match="Unknown keyword argument"):
+        OAHContext(qpretrieve_kw={"filter_nam": "gauss"})
+
+
+def test_oah_context_filter_cached():
+    holo = hologram()
+    ctx = OAHContext.from_hologram(holo)
+    cache_info = qpretrieve.filter.get_filter_array.cache_info
+    misses = cache_info().misses
+    hits = cache_info().hits
+    for disk_max in [1.0, 2.0]:
+        ctx.retrieve(hologram(disk_max=disk_max))
+    # the Fourier filter is not computed again
+    assert cache_info().misses == misses
+    assert cache_info().hits == hits + 2
+
+
+def test_oah_context_same_as_qpretrieve():
+    kw = {"filter_name": "smooth disk", "filter_size": .4}
+    ctx = OAHContext.from_hologram(hologram(), qpretrieve_kw=kw)
+    for disk_max in [1.0, 2.0]:
+        holo = hologram(disk_max=disk_max)
+        ref = qpretrieve.OffAxisHologram(data=holo)
+        assert np.allclose(ctx.retrieve(holo), ref.run_pipeline(**kw),
+                           atol=0, rtol=1e-12)
+
+
+def test_oah_context_pickle():
+    ctx = OAHContext.from_hologram(hologram())
+    ctx2 = pickle.loads(pickle.dumps(ctx))
+    assert ctx2.geometry((200, 200)) == ctx.geometry((200, 200))
+    holo = hologram(disk_max=1.2)
+    assert np.allclose(ctx2.retrieve(holo), ctx.retrieve(holo))
+
+
+if __name__ == "__main__":
+    # Run all tests
+    _loc = locals()
+    for _key in list(_loc.keys()):
+        if _key.startswith("test_") and hasattr(_loc[_key], "__call__"):
+            _loc[_key]()
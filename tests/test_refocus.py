@@ -75,6 +75,62 @@ def test_refocus_kernel_different():
     assert not np.all(qpi1.pha == qpi2.pha)
 
 
+def test_refocus_stack():
+    meta = {"wavelength": 1e-6,
+            "pixel size": .5e-6,
+            "medium index": 1,
+            "identifier": "cell"}
+    size = 40
+    x = (np.arange(size) - size / 2).reshape(-1, 1)
+    y = (np.arange(size + 6) - size / 2).reshape(1, -1)
+    amp = gaussian_filter(.5 * (1 + (x**2 + y**2 < size / 3)), 1)
+    qpi = qpimage.QPImage(data=amp * np.exp(.1j), which_data="field",
+                          meta_data=meta)
+    # equidistant and arbitrary distances
+    for distances in [np.linspace(-3e-6, 3e-6, 5),
+                      np.array([1e-6, -2e-6, 0, 3e-6, 2.5e-6])]:
+        check_refocus_stack(qpi, distances)
+
+
+def check_refocus_stack(qpi, distances):
+    for padding in [True, False]:
+        # one distance at a time and all at once
+        for max_bytes in [1, 2**30]:
+            stack = qpi.refocus_stack(distances, kernel="fresnel",
+                                      padding=padding, max_bytes=max_bytes)
+            assert stack.shape == (5,) + qpi.shape
+            for ii, distance in enumerate(distances):
+                ref = qpi.refocus(distance, kernel="fresnel", padding=padding)
+                assert np.allclose(stack[ii], ref.field, rtol=0, atol=1e-6)
+
+
+def test_refocus_stack_series():
+    meta = {"wavelength": 1e-6,
+            "pixel size": .5e-6,
+            "medium index": 1,
+            "identifier": "cell"}
+    size = 40
+    x = (np.arange(size) - size / 2).reshape(-1, 1)
+    y = (np.arange(size) - size / 2).reshape(1, -1)
+    pha = 10 * np.exp(-(x**2 + y**2) / 100)
+    qpi = qpimage.QPImage(data=pha, which_data="phase", meta_data=meta)
+    distances = [-1e-6, 0, 1e-6]
+    for proc_phase in [True, False]:
+        qps = qpi.refocus_stack(distances,
+                                series=qpimage.QPSeries(layout="stacked"),
+                                proc_phase=proc_phase)
+        assert qps.layout == "stacked"
+        assert len(qps) == 3
+        assert qps[1]["identifier"] == "cell@h0.00000e+00m"
+        if proc_phase:
+            for ii, distance in enumerate(distances):
+                ref = qpi.refocus(distance)
+                assert np.allclose(qps[ii].pha, ref.pha, atol=1e-5)
+            assert np.allclose(qps[1].pha, pha, atol=1e-3)
+        else:
+            assert np.abs(qps[1].pha).max() <= np.pi
+
+
 if __name__ == "__main__":
     # Run all tests
     _loc = locals()
@@ -110,6 +110,43 @@ def test_series_from_list():
     assert qps.get_qpimage(0) == qps.get_qpimage(1)
 
 
+def test_series_length():
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    qpi = qpimage.QPImage(h5file=h5file, h5mode="r")
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=[qpi, qpi], h5file=tf) as qps:
+        assert len(qps) == 2
+        qps.add_qpimage(qpi)
+        assert len(qps) == 3
+        assert len(list(qps)) == 3
+    with h5py.File(tf, mode="a") as h5:
+        assert h5.attrs[qpimage.series.LENGTH_ATTR] == 3
+        # wrong count (e.g. file edited with an older version)
+        h5.attrs[qpimage.series.LENGTH_ATTR] = 5
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert len(qps) == 3
+    with qpimage.QPSeries(h5file=tf, h5mode="a") as qps:
+        assert len(qps) == 3
+    with h5py.File(tf, mode="r") as h5:
+        assert h5.attrs[qpimage.series.LENGTH_ATTR] == 3
+    with h5py.File(tf, mode="a") as h5:
+        h5.attrs[qpimage.series.LENGTH_ATTR] = 2
+    with qpimage.QPSeries(h5file=tf, h5mode="a") as qps:
+        assert len(qps) == 3
+    # missing attribute (files created with qpimage < 0.10.0)
+    with h5py.File(tf, mode="a") as h5:
+        del h5.attrs[qpimage.series.LENGTH_ATTR]
+    with qpimage.QPSeries(h5file=tf, h5mode="a") as qps:
+        assert len(qps) == 3
+    with h5py.File(tf, mode="r") as h5:
+        assert h5.attrs[qpimage.series.LENGTH_ATTR] == 3
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
 def test_series_h5file():
     tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
     with h5py.File(tf, mode="a") as fd:
@@ -166,6 +203,36 @@ def test_series_hdf5_hardlink_bg():
     qpimage.image_data.COMPRESSION = compr
 
 
+def test_series_shared_bg():
+    size = 50
+    pha = np.linspace(0, 1, size**2).reshape(size, size)
+    bg_qpi = qpimage.QPImage(data=pha / 2, which_data="phase")
+    qpis = [qpimage.QPImage(data=pha * (ii + 1), which_data="phase")
+            for ii in range(3)]
+    for layout in ["group", "stacked"]:
+        tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpimage.QPSeries(h5file=tf, h5mode="w", layout=layout) as qps:
+            for qpi in qpis:
+                qps.add_qpimage(qpi, bg_data=bg_qpi)
+            for ii, qpi in enumerate(qpis):
+                assert np.allclose(qps[ii].pha, qpi.pha - pha / 2)
+            with pytest.raises(ValueError, match="at the same time"):
+                qps.add_qpimage(qpis[0], bg_data=bg_qpi, bg_from_idx=0)
+        if layout == "group":
+            with h5py.File(tf, "r") as h5:
+                bg0 = h5["qpi_0/phase/bg_data/data"]
+                for ii in [1, 2]:
+                    assert bg0.id == h5["qpi_{}/phase/bg_data/data".format(
+                        ii)].id
+                bga = h5["qpi_0/amplitude/bg_data/data"]
+                assert bga.id == h5["qpi_2/amplitude/bg_data/data"].id
+        # cleanup
+        try:
+            os.remove(tf)
+        except OSError:
+            pass
+
+
 def test_series_meta():
     h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
     # We have no write intent on the file, so we cannot modify
@@ -1,7 +1,10 @@
+import os
 import pathlib
 import tempfile
 
+import h5py
 import numpy as np
+import pytest
 
 import qpimage
 
@@ -18,6 +21,35 @@ def test_h5file_confusion():
         assert False, "h5file must be given as kwarg!"
 
 
+def test_compute_bg():
+    size = 40
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    rsobj = np.random.RandomState(42)
+    qpis = []
+    for ii in range(5):
+        pha = .2 * ii + .03 * x - .01 * y \
+            + rsobj.normal(scale=.01, size=(size, size))
+        qpis.append(qpimage.QPImage(data=pha, which_data="phase",
+                                    meta_data={"pixel size": 1e-6}))
+    # add an image with a different shape
+    qpis.append(qpimage.QPImage(data=np.ones((20, 30)), which_data="phase",
+                                meta_data={"pixel size": 1e-6}))
+    series = qpimage.QPSeries(qpimage_list=qpis)
+    series.compute_bg(which_data="phase",
+                      fit_offset="fit",
+                      fit_profile="tilt",
+                      border_m=5e-6,
+                      batch_size=2)
+    for qpi, qpi_ref in zip(series, qpis):
+        qpi_ref.compute_bg(which_data="phase",
+                           fit_offset="fit",
+                           fit_profile="tilt",
+                           border_m=5e-6)
+        assert np.allclose(qpi.pha, qpi_ref.pha, atol=1e-6, rtol=0)
+        assert qpi.info == qpi_ref.info
+
+
 def test_getitem():
     size = 20
     pha = np.repeat(np.linspace(0, 10, size), size)
@@ -85,6 +117,122 @@ def test_getitem_identifier():
         assert False, "Adding QPImage with same identifier should not work"
 
 
+def test_identifier_index_persistent():
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpis = [qpimage.QPImage(data=pha * (ii + 1),
+                            which_data="phase",
+                            meta_data={"identifier": "id{}".format(ii)})
+            for ii in range(3)]
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=qpis, h5file=tf):
+        pass
+    with h5py.File(tf, "r") as h5:
+        ids = h5[qpimage.series.IDENTIFIER_INDEX].asstr()[:]
+        assert list(ids) == ["id0", "id1", "id2"]
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert "id2" in qps
+        assert qps["id1"] == qpis[1]
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_identifier_index_rebuild():
+    """Files without an identifier index (qpimage < 0.10.0)"""
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpis = [qpimage.QPImage(data=pha * (ii + 1),
+                            which_data="phase",
+                            meta_data={"identifier": "id{}".format(ii)})
+            for ii in range(3)]
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=qpis[:2], h5file=tf):
+        pass
+    with h5py.File(tf, "a") as h5:
+        del h5[qpimage.series.IDENTIFIER_INDEX]
+    # read-only: the index is rebuilt in memory
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert qps["id1"] == qpis[1]
+        assert qpimage.series.IDENTIFIER_INDEX not in qps.h5
+    # writable: the index is rebuilt and written
+    with qpimage.QPSeries(h5file=tf, h5mode="a") as qps:
+        assert "id0" in qps
+        qps.add_qpimage(qpis[2])
+        try:
+            qps.add_qpimage(qpis[0])
+        except ValueError:
+            pass
+        else:
+            assert False, "duplicate identifier"
+    with h5py.File(tf, "r") as h5:
+        ids = h5[qpimage.series.IDENTIFIER_INDEX].asstr()[:]
+        assert list(ids) == ["id0", "id1", "id2"]
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_identifier_index_meta_data():
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpi = qpimage.QPImage(data=pha, which_data="phase")
+    for layout in ["group", "stacked"]:
+        tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpimage.QPSeries(qpimage_list=[qpi], h5file=tf, layout=layout,
+                              meta_data={"identifier": "X"}) as qps:
+            assert "X" in qps
+            assert qps["X"] == qpi
+        with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+            assert "X" in qps
+        # cleanup
+        try:
+            os.remove(tf)
+        except OSError:
+            pass
+
+
+def test_identifier_index_rename():
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpis = [qpimage.QPImage(data=pha * (ii + 1),
+                            which_data="phase",
+                            meta_data={"identifier": "id{}".format(ii)})
+            for ii in range(2)]
+    for layout in ["group", "stacked"]:
+        tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+        with qpimage.QPSeries(qpimage_list=qpis, h5file=tf,
+                              layout=layout) as qps:
+            assert "id0" in qps
+            qps[0]["identifier"] = "b"
+            assert "b" in qps
+            assert "id0" not in qps
+            assert qps["b"] == qpis[0]
+            assert qps["id1"] == qpis[1]
+            with pytest.raises(KeyError, match="not found"):
+                qps["id0"]
+        with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+            assert "b" in qps
+            assert "id0" not in qps
+            assert qps["b"] == qpis[0]
+        with qpimage.QPSeries(h5file=tf, h5mode="a") as qps:
+            # the identifier index on disk is stale until the next lookup
+            qps[1]["identifier"] = "c"
+        with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+            assert "c" in qps
+            assert "id1" not in qps
+            assert qps["c"] == qpis[1]
+        # cleanup
+        try:
+            os.remove(tf)
+        except OSError:
+            pass
+
+
 def test_identifier():
     h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
     qpi = qpimage.QPImage(h5file=h5file, h5mode="r")
@@ -122,6 +270,45 @@ def test_iter():
         assert qpj == qpi
 
 
+def test_iter_prefetch():
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    qpis = [qpimage.QPImage(data=pha * (ii + 1), bg_data=pha / 2,
+                            which_data="phase")
+            for ii in range(5)]
+    series = qpimage.QPSeries(qpimage_list=qpis)
+    for depth, max_bytes in [(1, None), (3, None), (2, 1)]:
+        prefetched = list(series.iter_prefetch(depth=depth,
+                                               max_bytes=max_bytes))
+        assert len(prefetched) == 5
+        for qpi, qpj in zip(qpis, prefetched):
+            assert np.allclose(qpi.pha, qpj.pha)
+    # the images are cached already
+    qpj = next(series.iter_prefetch())
+    assert qpj._cache.get(("Phase", "image"), qpj._pha._version) is not None
+    # stop early
+    for ii, qpj in enumerate(series.iter_prefetch()):
+        if ii == 1:
+            break
+    assert np.allclose(qpj.pha, qpis[1].pha)
+
+
+def test_iter_prefetch_error():
+    size = 20
+    pha = np.repeat(np.linspace(0, 10, size), size).reshape(size, size)
+    series = qpimage.QPSeries(
+        qpimage_list=[qpimage.QPImage(data=pha, which_data="phase")] * 3)
+    del series.h5["qpi_1/phase/raw"]
+    iterator = series.iter_prefetch()
+    assert np.allclose(next(iterator).pha, pha)
+    try:
+        next(iterator)
+    except KeyError:
+        pass
+    else:
+        assert False, "missing dataset"
+
+
 if __name__ == "__main__":
     # Run all tests
     _loc = locals()
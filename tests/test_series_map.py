@@ -0,0 +1,105 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+import qpimage
+
+
+def compute_bg(qpi):
+    qpi.compute_bg(which_data="phase", fit_offset="fit",
+                   fit_profile="tilt", border_px=3)
+
+
+def fail_on_third(qpi):
+    if qpi["identifier"] == "image_2":
+        raise ValueError("bad image")
+    return qpimage.QPImage(data=qpi.pha * 2, which_data="phase",
+                           meta_data={"identifier": qpi["identifier"]})
+
+
+def get_series(h5file=None, num=5):
+    size = 30
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    qps = qpimage.QPSeries(h5file=h5file, h5mode="w")
+    for ii in range(num):
+        pha = .1 * ii * x + .05 * y + np.sin(x * y / 30)
+        qpi = qpimage.QPImage(data=pha, which_data="phase",
+                              meta_data={"identifier": "image_{}".format(ii)})
+        qps.add_qpimage(qpi)
+    return qps
+
+
+def test_map_errors_collect():
+    qps = get_series()
+    out, failed = qps.map(fail_on_third, workers=2, errors="collect")
+    assert list(failed.keys()) == [2]
+    assert "bad image" in failed[2]
+    assert len(out) == 4
+    assert "image_2" not in out
+    assert np.allclose(out["image_3"].pha, 2 * qps["image_3"].pha)
+
+
+def test_map_errors_raise_and_resume():
+    qps = get_series()
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with pytest.raises(RuntimeError, match="QPImage 2 failed"):
+        qps.map(fail_on_third, workers=1, out=tf)
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as out:
+        assert len(out) == 2
+        assert out.h5.attrs[qpimage.series.MAP_PROGRESS_ATTR] == 2
+    # skip the failed image and resume
+    with qpimage.QPSeries(h5file=tf, h5mode="a") as out:
+        out.h5.attrs[qpimage.series.MAP_PROGRESS_ATTR] = 3
+    out, failed = qps.map(fail_on_third, workers=1, out=tf, resume=True)
+    with out:
+        assert not failed
+        assert len(out) == 4
+        assert [qpi["identifier"] for qpi in out] == [
+            "image_0", "image_1", "image_3", "image_4"]
+        assert out.h5.attrs[qpimage.series.MAP_PROGRESS_ATTR] == 5
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_map_file_workers():
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with get_series(h5file=tf) as qps:
+        out, failed = qps.map(compute_bg, workers=2)
+        assert not failed
+        assert len(out) == len(qps)
+        for ii in range(len(qps)):
+            ref = qps[ii].copy()
+            compute_bg(ref)
+            assert out[ii]["identifier"] == "image_{}".format(ii)
+            assert np.allclose(out[ii].pha, ref.pha)
+            # input is not modified
+            assert np.all(qps[ii].bg_pha == 0)
+    # cleanup
+    try:
+        os.remove(tf)
+    except OSError:
+        pass
+
+
+def test_map_stacked():
+    qps = get_series()
+    stacked = qpimage.QPSeries(qpimage_list=list(qps), layout="stacked")
+    out, _ = stacked.map(compute_bg, workers=1)
+    assert out.layout == "stacked"
+    ref, _ = qps.map(compute_bg, workers=1)
+    for ii in range(len(qps)):
+        assert np.allclose(out[ii].pha, ref[ii].pha)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    _loc = locals()
+    for _key in list(_loc.keys()):
+        if _key.startswith("test_") and hasattr(_loc[_key], "__call__"):
+            _loc[_key]()
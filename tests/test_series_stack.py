@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import qpimage
+
+
+def get_series(layout="group", num=4, size=(20, 30)):
+    x = np.arange(size[0]).reshape(-1, 1)
+    y = np.arange(size[1]).reshape(1, -1)
+    qpis = []
+    for ii in range(num):
+        pha = .1 * ii * x + .05 * y + np.sin(x * y / 30)
+        amp = 1 + .01 * ii * x + 0 * y
+        qpis.append(qpimage.QPImage(data=(pha, amp),
+                                    bg_data=(pha / 10, amp / 2),
+                                    which_data=("phase", "amplitude")))
+    qps = qpimage.QPSeries(qpimage_list=qpis, layout=layout)
+    return qps
+
+
+def test_stack_slicing():
+    for layout in ["group", "stacked"]:
+        qps = get_series(layout=layout)
+        pha = np.array([qpi.pha for qpi in qps])
+        amp = np.array([qpi.amp for qpi in qps])
+        field = np.array([qpi.field for qpi in qps])
+        assert qps.pha_stack.shape == (4, 20, 30)
+        assert len(qps.pha_stack) == 4
+        assert np.allclose(np.asarray(qps.pha_stack), pha)
+        assert np.allclose(np.asarray(qps.amp_stack), amp)
+        assert np.allclose(np.asarray(qps.field_stack), field)
+        for given in [1,
+                      -1,
+                      slice(1, 3),
+                      slice(None, None, -2),
+                      (Ellipsis, 5),
+                      (slice(None), 3, slice(2, 20, 3)),
+                      (2, slice(None, None, -1), slice(10, 2, -2)),
+                      ([3, 0], slice(5, 10)),
+                      (np.array([True, False, True, False]), -3),
+                      (slice(0, 0), 1),
+                      ]:
+            assert np.allclose(qps.pha_stack[given], pha[given])
+            assert np.allclose(qps.field_stack[given], field[given])
+
+
+def test_stack_error():
+    qps = get_series()
+    with pytest.raises(IndexError):
+        qps.pha_stack[4]
+    with pytest.raises(IndexError):
+        qps.pha_stack[0, 20]
+    with pytest.raises(IndexError):
+        qps.pha_stack[0, [1, 2]]
+    with pytest.raises(IndexError):
+        qps.pha_stack[0, 1, 2, 3]
+    qps.add_qpimage(qpimage.QPImage(data=np.zeros((10, 10)),
+                                    which_data="phase"))
+    with pytest.raises(ValueError, match="different shapes"):
+        qps.pha_stack.shape
+    with pytest.raises(ValueError, match="different shapes"):
+        qps.pha_stack[4]
+    # frames with the same shape can still be read
+    assert qps.pha_stack[:4].shape == (4, 20, 30)
+
+
+def test_stack_out():
+    qps = get_series()
+    field = np.array([qpi.field for qpi in qps])
+    out = np.zeros((2, 20, 30), dtype=np.complex64)
+    ret = qps.field_stack.read(slice(1, 3), out=out)
+    assert ret is out
+    assert np.allclose(out, field[1:3], atol=1e-5)
+    data = qps.field_stack.read((0, 3), dtype="complex64")
+    assert data.dtype == np.complex64
+    assert np.allclose(data, field[0, 3], atol=1e-5)
+    with pytest.raises(ValueError, match="shape"):
+        qps.field_stack.read(0, out=out)
+    with pytest.raises(ValueError, match="dtype"):
+        qps.field_stack.read(slice(1, 3), out=out, dtype=np.complex128)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    _loc = locals()
+    for _key in list(_loc.keys()):
+        if _key.startswith("test_") and hasattr(_loc[_key], "__call__"):
+            _loc[_key]()
@@ -0,0 +1,173 @@
+import pathlib
+import tempfile
+
+import h5py
+import numpy as np
+import pytest
+
+import qpimage
+from qpimage.stacked import FORMAT_VERSION
+
+
+def make_qpis(num=4, size=40):
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    qpis = []
+    for ii in range(num):
+        pha = .1 * ii + .02 * x - .01 * y + np.sin(x * y / 100)
+        amp = 1 + .01 * ii + .001 * x + 0 * y
+        qpis.append(qpimage.QPImage(data=(pha, amp),
+                                    which_data="phase,amplitude",
+                                    meta_data={"wavelength": 550e-9,
+                                               "pixel size": 1e-6,
+                                               "time": float(ii)}))
+    return qpis
+
+
+def test_stacked_basic():
+    qpis = make_qpis()
+    qpis[1].compute_bg(which_data="phase", fit_profile="tilt",
+                       border_px=5)
+    qpis[2].compute_bg(which_data="phase", fit_profile="poly2o",
+                       border_px=5, fit_storage="params")
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=qpis, h5file=tf, h5mode="w",
+                          layout="stacked") as qps:
+        assert len(qps) == 4
+        assert qps.h5["phase/raw"].shape == (4, 40, 40)
+        assert qps.h5.attrs["format version"] == FORMAT_VERSION
+
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert qps.layout == "stacked"
+        assert len(qps) == 4
+        for qpi, ref in zip(qps, qpis):
+            assert qpi.shape == ref.shape
+            assert np.allclose(qpi.pha, ref.pha)
+            assert np.allclose(qpi.amp, ref.amp)
+            assert np.allclose(qpi.bg_pha, ref.bg_pha)
+            assert qpi.meta == ref.meta
+            assert [ii[0] for ii in qpi.info] == [ii[0] for ii in ref.info]
+        assert "phase background coefficients" in dict(qps[2].info)
+        # copy to memory
+        qpi = qps[1].copy()
+        assert np.allclose(qpi.pha, qpis[1].pha)
+
+
+def test_stacked_compute_bg():
+    qpis = make_qpis()
+    with qpimage.QPSeries(qpimage_list=qpis, layout="stacked") as qps:
+        qps.compute_bg(which_data="phase", fit_profile="tilt",
+                       fit_offset="fit", border_px=5)
+        for qpi, ref in zip(qps, qpis):
+            ref.compute_bg(which_data="phase", fit_profile="tilt",
+                           fit_offset="fit", border_px=5)
+            assert np.allclose(qpi.pha, ref.pha, atol=1e-6)
+        # remove the fit again
+        qps[0].clear_bg(which_data="phase", keys="fit")
+        assert np.allclose(qps[0].pha, qpis[0].raw_pha)
+        assert np.allclose(qps[1].pha, qpis[1].pha, atol=1e-6)
+
+
+def test_stacked_error():
+    qpis = make_qpis(num=1)
+    qpi2 = qpimage.QPImage(data=np.zeros((10, 10)), which_data="phase")
+    with qpimage.QPSeries(qpimage_list=qpis, layout="stacked") as qps:
+        with pytest.raises(ValueError, match="does not match"):
+            qps.add_qpimage(qpi2)
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=[qpimage.QPImage(h5file=h5file)],
+                          h5file=tf, h5mode="w"):
+        pass
+    with pytest.raises(ValueError, match="has the 'group' layout"):
+        qpimage.QPSeries(h5file=tf, layout="stacked")
+    with pytest.raises(ValueError, match="must be one of"):
+        qpimage.QPSeries(layout="3d")
+
+
+def test_stacked_append_error():
+    qpis = make_qpis(num=2)
+    qpis[1].compute_bg(which_data="phase", fit_profile="tilt",
+                       border_px=5)
+    qpis[1]._pha.h5["bg_data/fit"].attrs["unsupported"] = 1
+    with qpimage.QPSeries(qpimage_list=qpis[:1], layout="stacked") as qps:
+        with pytest.raises(KeyError, match="not supported"):
+            qps.add_qpimage(qpis[1])
+        # the partially written frame is removed
+        assert len(qps) == 1
+        assert qps.h5["phase/raw"].shape == (1, 40, 40)
+        assert qps.h5["phase/bg_table"].shape == (1,)
+        assert len(list(qps)) == 1
+        qps.add_qpimage(qpis[0])
+        assert len(qps) == 2
+        assert np.allclose(qps[1].pha, qpis[0].pha)
+
+
+def test_stacked_overwrite_raw():
+    qpis = make_qpis(num=2)
+    with qpimage.QPSeries(qpimage_list=qpis, layout="stacked") as qps:
+        qpi = qps[0]
+        qpi._pha["raw"] = qpis[1].raw_pha
+        assert np.allclose(qps[0].raw_pha, qpis[1].raw_pha)
+        assert np.allclose(qps[1].raw_pha, qpis[1].raw_pha)
+        with pytest.raises(ValueError, match="does not match"):
+            qpi._pha["raw"] = np.zeros((10, 10))
+        # unsupported operations
+        with pytest.raises(TypeError, match="stacked series layout"):
+            qpi._pha["raw"] = None
+        with pytest.raises(TypeError, match="stacked series layout"):
+            qpi.h5.create_group("extra")
+
+
+def test_stacked_identifier_meta():
+    qpis = make_qpis(num=3)
+    with qpimage.QPSeries(layout="stacked") as qps:
+        for ii, qpi in enumerate(qpis):
+            qps.add_qpimage(qpi, identifier="image_{}".format(ii))
+        assert "image_1" in qps
+        assert "image_5" not in qps
+        assert qps["image_2"]["time"] == 2
+        assert qps["image_2"]["identifier"] == "image_2"
+        assert "medium index" not in qps[0]
+        qps[0].h5.attrs["medium index"] = 1.335
+        assert qps[0]["medium index"] == 1.335
+        with pytest.raises(ValueError, match="already exists"):
+            qps.add_qpimage(qpis[0], identifier="image_1")
+
+
+def test_stacked_mask_and_hardlink_bg():
+    qpis = make_qpis(num=2)
+    mask = np.zeros(qpis[0].shape, dtype=bool)
+    mask[:5] = True
+    qpis[0].set_bg_data(bg_data=qpis[0].pha / 2, which_data="phase")
+    qpis[0].compute_bg(which_data="phase", fit_profile="tilt",
+                       from_mask=mask)
+    with qpimage.QPSeries(layout="stacked", h5compression="fast") as qps:
+        qps.add_qpimage(qpis[0])
+        qps.add_qpimage(qpis[1], bg_from_idx=0)
+        assert np.all(qps[0].h5["phase/estimate_bg_from_mask"][:] == mask)
+        assert "estimate_bg_from_mask" not in qps[1].h5["phase"]
+        assert np.allclose(qps[1].bg_pha, qpis[0]._pha.get_bg("data"))
+        # neutral backgrounds for frames without background data
+        assert np.all(qps.h5["amplitude/bg_data/data"][:] == 1)
+
+
+def test_stacked_group_file_still_readable():
+    h5file = pathlib.Path(__file__).parent / "data" / "bg_tilt.h5"
+    qpi = qpimage.QPImage(h5file=h5file, h5mode="r")
+    tf = tempfile.mktemp(suffix=".h5", prefix="qpimage_test_")
+    with qpimage.QPSeries(qpimage_list=[qpi], h5file=tf, h5mode="w"):
+        pass
+    with h5py.File(tf, "r") as h5:
+        assert "format version" not in h5.attrs
+    with qpimage.QPSeries(h5file=tf, h5mode="r") as qps:
+        assert qps.layout == "group"
+        assert np.allclose(qps[0].pha, qpi.pha)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+import qpimage
+from qpimage import unwrap
+
+
+def hologram(size=200):
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    # there is a smooth wrapped phase object in the hologram
+    data = 10 * np.exp(-((x - size / 2)**2 + (y - size / 2)**2) / 30**2)
+    return np.sin(-.6 * x - .4 * y + data)
+
+
+def get_phase(size=128):
+    x = np.linspace(-1, 1, size).reshape(-1, 1)
+    y = np.linspace(-1, 1, size * 2).reshape(1, -1)
+    pha = 30 * np.exp(-(x**2 + y**2) / .3) + 8 * x - 3 * y
+    return pha, np.angle(np.exp(1j * pha))
+
+
+def test_unwrap_engines():
+    pha, wrapped = get_phase()
+    for engine in ["dct", "skimage"]:
+        unwrapped = unwrap.unwrap(wrapped, engine=engine)
+        offset = unwrapped[0, 0] - pha[0, 0]
+        assert np.allclose(offset / (2 * np.pi),
+                           np.round(offset / (2 * np.pi)))
+        assert np.allclose(unwrapped - offset, pha)
+    assert np.all(unwrap.unwrap(wrapped, engine="none") == wrapped)
+
+
+def test_unwrap_dct_nan():
+    pha, wrapped = get_phase()
+    # large invalid region and 1% scattered invalid pixels
+    wrapped[40:80, 30:200] = np.nan
+    rs = np.random.RandomState(42)
+    wrapped[rs.uniform(size=wrapped.shape) < .01] = np.nan
+    for engine in ["dct", "skimage"]:
+        unwrapped = unwrap.unwrap(wrapped, engine=engine)
+        assert np.all(np.isnan(unwrapped) == np.isnan(wrapped))
+        valid = ~np.isnan(wrapped)
+        diff = (unwrapped[valid] - pha[valid]) / (2 * np.pi)
+        assert np.allclose(diff, np.round(diff[0]))
+    # regions separated by invalid pixels are unwrapped independently
+    wrapped[60:62] = np.nan
+    unwrapped = unwrap.unwrap_dct(wrapped)
+    for region in [np.s_[:60], np.s_[62:]]:
+        diff = (unwrapped[region] - pha[region]) / (2 * np.pi)
+        diff = diff[~np.isnan(diff)]
+        assert np.allclose(diff, np.round(diff[0]))
+
+
+def test_unwrap_qpimage():
+    pha, wrapped = get_phase()
+    qpi1 = qpimage.QPImage(data=wrapped, which_data="phase")
+    qpi2 = qpimage.QPImage(data=wrapped, which_data="phase", unwrap="dct")
+    assert np.allclose(qpi1.pha, qpi2.pha, atol=1e-6)
+    assert qpi2.unwrap_engine == "dct"
+    # offset correction is also done without unwrapping
+    qpi3 = qpimage.QPImage(data=wrapped + 4 * np.pi, which_data="phase",
+                           unwrap="none")
+    assert np.allclose(qpi3.pha, wrapped, atol=1e-6)
+
+
+def test_unwrap_register():
+    def unwrap_twice(pha):
+        return unwrap.unwrap_dct(pha) * 2
+
+    unwrap.register_engine("twice", unwrap_twice)
+    try:
+        pha, wrapped = get_phase()
+        qpi = qpimage.QPImage(data=wrapped, which_data="phase",
+                              unwrap="twice")
+        assert np.all(qpi.pha != 0)
+        with pytest.raises(ValueError, match="exists"):
+            unwrap.register_engine("twice", unwrap_twice)
+    finally:
+        unwrap.UNWRAP_ENGINES.pop("twice")
+    with pytest.raises(ValueError, match="must be one of"):
+        qpimage.QPImage(data=wrapped, which_data="phase", unwrap="twice")
+
+
+def test_unwrap_tiled():
+    pha, wrapped = get_phase(size=150)
+    for engine in ["dct", "skimage"]:
+        unwrapped = unwrap.unwrap_tiled(wrapped, engine=engine,
+                                        tile_size=40, overlap=8,
+                                        workers=2)
+        diff = (unwrapped - pha) / (2 * np.pi)
+        assert np.allclose(diff, np.round(diff[0, 0]))
+    # small images are not tiled
+    assert np.all(unwrap.unwrap_tiled(wrapped, engine="dct")
+                  == unwrap.unwrap_dct(wrapped))
+    with pytest.raises(ValueError, match="must be positive"):
+        unwrap.unwrap_tiled(wrapped, overlap=0)
+
+
+def test_unwrap_tiled_nan():
+    pha, wrapped = get_phase(size=150)
+    wrapped[30:70, 50:90] = np.nan
+    # fully invalid tile
+    wrapped[:40, 260:] = np.nan
+    unwrapped = unwrap.unwrap_tiled(wrapped, tile_size=40, overlap=8)
+    assert np.all(np.isnan(unwrapped) == np.isnan(wrapped))
+    diff = (unwrapped - pha) / (2 * np.pi)
+    assert np.allclose(diff[~np.isnan(diff)], np.round(diff[-1, -1]))
+
+
+def test_unwrap_temporal():
+    x = np.linspace(-1, 1, 120).reshape(-1, 1)
+    y = np.linspace(-1, 1, 100).reshape(1, -1)
+    reference = None
+    for ii in range(5):
+        pha = 30 * np.exp(-((x - ii * .01)**2 + y**2) / .3) + 8 * x
+        if ii == 3:
+            # sudden local phase change
+            pha[40:50, 40:50] += 2.5
+        wrapped = np.angle(np.exp(1j * pha))
+        unwrapped, num = unwrap.unwrap_temporal(wrapped, reference,
+                                                ret_fallback=True)
+        diff = (unwrapped - pha) / (2 * np.pi)
+        assert np.allclose(diff, np.round(diff[0, 0]))
+        if ii == 0:
+            assert num == pha.size
+        elif ii in [3, 4]:
+            assert 0 < num < pha.size / 2
+        else:
+            assert num == 0
+        reference = unwrapped
+    with pytest.raises(ValueError, match="Shape mismatch"):
+        unwrap.unwrap_temporal(wrapped, reference[1:])
+
+
+def test_unwrap_temporal_noise():
+    """Noisy pixels must not trigger spatial unwrapping"""
+    x = np.linspace(-1, 1, 200).reshape(-1, 1)
+    y = np.linspace(-1, 1, 200).reshape(1, -1)
+    rs = np.random.RandomState(42)
+    reference = None
+    for ii in range(3):
+        pha = 30 * np.exp(-((x - ii * .01)**2 + y**2) / .3)
+        noisy = pha + rs.normal(scale=.3, size=pha.shape)
+        wrapped = np.angle(np.exp(1j * noisy))
+        unwrapped, num = unwrap.unwrap_temporal(wrapped, reference,
+                                                ret_fallback=True)
+        diff = (unwrapped - noisy) / (2 * np.pi)
+        assert np.allclose(diff, np.round(diff[0, 0]))
+        if ii > 0:
+            assert num == 0
+        reference = unwrapped
+
+
+def test_unwrap_temporal_nan():
+    pha, wrapped = get_phase()
+    reference = pha + .1
+    reference[10:20, 10:20] = np.nan
+    wrapped[30:40, 30:40] = np.nan
+    unwrapped, num = unwrap.unwrap_temporal(wrapped, reference,
+                                            ret_fallback=True)
+    assert np.all(np.isnan(unwrapped) == np.isnan(wrapped))
+    assert np.allclose(unwrapped[~np.isnan(wrapped)],
+                       pha[~np.isnan(wrapped)])
+    assert 100 <= num < pha.size / 2
+
+
+def test_is_wrapped():
+    pha = np.zeros((3 * unwrap.WRAP_CHECK_ROWS, 20))
+    assert not unwrap.is_wrapped(pha)
+    # jumps between and within blocks
+    for idx in [(unwrap.WRAP_CHECK_ROWS, 5),
+                (unwrap.WRAP_CHECK_ROWS - 1, 5),
+                (-1, -1)]:
+        pha2 = pha.copy()
+        pha2[idx] = 3.2
+        assert unwrap.is_wrapped(pha2)
+        pha2[idx] = np.nan
+        assert not unwrap.is_wrapped(pha2)
+
+
+def test_unwrap_skip():
+    pha, wrapped = get_phase()
+    unwrap.skip_clear()
+    flat = qpimage.QPImage(data=wrapped / 10, which_data="phase")
+    assert unwrap.skip_info() == (1, 1)
+    assert not flat._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    assert np.allclose(flat.pha, wrapped / 10)
+    qpi = qpimage.QPImage(data=wrapped, which_data="phase")
+    assert unwrap.skip_info() == (2, 1)
+    assert qpi._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    # the attribute is kept when slicing and copying
+    assert qpi[10:20, 10:20]._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    for layout in ["group", "stacked"]:
+        qps = qpimage.QPSeries(qpimage_list=[qpi, flat], layout=layout)
+        assert qps[0]._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+        assert not qps[1]._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+        assert qps[0].copy()._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+        assert not qps[1].copy()._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    # not set for QPImages created with qpimage < 0.10.0
+    del flat._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    qps = qpimage.QPSeries(qpimage_list=[flat], layout="stacked")
+    assert unwrap.UNWRAP_ATTR not in qps[0]._pha.h5.attrs
+    unwrap.skip_clear()
+    assert unwrap.skip_info() == (0, 0)
+
+
+def test_unwrap_hologram_proc_phase():
+    holo = hologram()
+    unwrap.skip_clear()
+    qpi = qpimage.QPImage(holo, which_data="raw-oah")
+    # the phase is only checked (and unwrapped) once
+    assert unwrap.skip_info() == (1, 0)
+    assert qpi._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    assert np.ptp(qpi.pha) > 9
+    raw = qpimage.QPImage(holo, which_data="raw-oah", proc_phase=False)
+    assert unwrap.skip_info() == (1, 0)
+    assert not raw._pha.h5.attrs[unwrap.UNWRAP_ATTR]
+    assert np.nanmax(np.abs(raw.pha)) <= np.pi
+
+
+if __name__ == "__main__":
+    # Run all tests
+    _loc = locals()
+    for _key in list(_loc.keys()):
+        if _key.startswith("test_") and hasattr(_loc[_key], "__call__"):
+            _loc[_key]()